@@ -0,0 +1,220 @@
+"""
+ASGI variant of the ingest service (same endpoints and response bodies as main.py).
+
+The Flask app blocks a gunicorn thread for the whole of a /fetch: the API
+call, then every BigQuery round trip in turn. Here the API call goes through
+an async HTTP client, the fetch-metadata lookup runs while the API responds,
+and the ingest step (CPU work + blocking BigQuery client calls) runs in a
+thread pool, so one worker serves many simultaneous fetches:
+
+- ASYNC_INGEST_CONCURRENCY ingest steps run at once (memory bound); other
+  fetches wait for a slot with their payload already downloaded
+- ASYNC_BQ_THREADS threads serve the blocking BigQuery calls
+- INSERT_CONCURRENCY (main.py) sends a run's insertAll batches in parallel
+
+Run:
+    uvicorn async_main:app --host 0.0.0.0 --port 8080 --workers 2
+"""
+import asyncio
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+import httpx
+from flask.json.provider import DefaultJSONProvider
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+import file_ingest
+import json_codec
+import main
+import payload_archive
+import sinks
+
+ASYNC_INGEST_CONCURRENCY = int(os.getenv("ASYNC_INGEST_CONCURRENCY", "4"))
+ASYNC_BQ_THREADS = int(os.getenv("ASYNC_BQ_THREADS", "32"))
+API_TIMEOUT_SECONDS = 180
+
+
+class FlaskJSONResponse(JSONResponse):
+    """
+    What Flask's jsonify returns (sorted keys, compact, trailing newline),
+    with Flask's own conversion of other types (HTTP dates for datetimes).
+    """
+
+    def render(self, content) -> bytes:
+        return (
+            json.dumps(content, sort_keys=True, separators=(",", ":"), default=DefaultJSONProvider.default) + "\n"
+        ).encode("utf-8")
+
+
+@asynccontextmanager
+async def lifespan(app):
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=ASYNC_BQ_THREADS, thread_name_prefix="bq")
+    )
+    main.limit_memory_usage()
+    app.state.ingest_slots = asyncio.Semaphore(ASYNC_INGEST_CONCURRENCY)
+    credentials = (main.API_USER, main.API_PASS) if main.API_USER and main.API_PASS else None
+    async with httpx.AsyncClient(
+        auth=credentials,
+        timeout=API_TIMEOUT_SECONDS,
+        limits=httpx.Limits(max_connections=100),
+    ) as client:
+        app.state.api_client = client
+        print(f"✅ Async ingest app started ({ASYNC_INGEST_CONCURRENCY} ingest slots, "
+              f"{ASYNC_BQ_THREADS} BigQuery threads)")
+        yield
+
+
+async def run_fetch_async(
+    app,
+    date: str = None,
+    days_back=None,
+    mode: str = "incremental",
+    start_hour: int = 0,
+    end_hour: int = 8,
+    strategy: str = None,
+    sink_names: list = None,
+) -> tuple:
+    """main.run_fetch with the API call and the metadata lookup awaited together."""
+    strategy = strategy or main.INGEST_STRATEGY
+    date = main.resolve_fetch_date(date, days_back, mode)
+
+    try:
+        last_timestamp, response = await asyncio.gather(
+            asyncio.to_thread(main.get_incremental_timestamp, date, mode),
+            app.state.api_client.post(main.API_URL, json=main.api_payload(date)),
+        )
+        if response.status_code != 200:
+            return {"error": f"API error: {response.status_code}", "body": response.text}, response.status_code
+
+        content = response.content
+        del response
+        async with app.state.ingest_slots:
+            return await asyncio.to_thread(
+                _ingest_content, content, date, mode, start_hour, end_hour, strategy, last_timestamp, sink_names
+            )
+    except Exception as e:
+        return {"error": str(e)}, 500
+
+
+def _ingest_content(content: bytes, date, mode, start_hour, end_hour, strategy, last_timestamp, sink_names) -> tuple:
+    # Decoded straight into the call, so ingest_payload can release the dicts
+    return main.ingest_payload(
+        json_codec.loads(content), date, mode, start_hour, end_hour, strategy, last_timestamp, sink_names
+    )
+
+
+# === ROUTES ===
+async def index(request):
+    return FlaskJSONResponse(main.SERVICE_INFO)
+
+
+async def fetch(request):
+    """Same query parameters as main.fetch."""
+    args = request.query_params
+    strategy = args.get("strategy", main.INGEST_STRATEGY)
+    if strategy not in main.INGEST_STRATEGIES:
+        return FlaskJSONResponse({"error": f"Unknown strategy: {strategy}"}, status_code=400)
+    try:
+        sink_names = sinks.parse_sinks(args.get("sinks"))
+    except ValueError as e:
+        return FlaskJSONResponse({"error": str(e)}, status_code=400)
+
+    body, status = await run_fetch_async(
+        request.app,
+        date=args.get("date"),
+        days_back=args.get("days_back"),
+        mode=args.get("mode", "incremental"),
+        start_hour=int(args.get("start_hour", 0)),
+        end_hour=int(args.get("end_hour", 8)),
+        strategy=strategy,
+        sink_names=sink_names,
+    )
+    return FlaskJSONResponse(body, status_code=status)
+
+
+async def replay(request):
+    """Same query parameters as main.replay."""
+    args = request.query_params
+    start = args.get("from") or args.get("date")
+    end = args.get("to") or start
+    strategy = args.get("strategy", main.INGEST_STRATEGY)
+    if not start:
+        return FlaskJSONResponse({"error": "Missing 'from' parameter"}, status_code=400)
+    if strategy not in main.INGEST_STRATEGIES:
+        return FlaskJSONResponse({"error": f"Unknown strategy: {strategy}"}, status_code=400)
+    try:
+        sink_names = sinks.parse_sinks(args.get("sinks"))
+    except ValueError as e:
+        return FlaskJSONResponse({"error": str(e)}, status_code=400)
+
+    try:
+        async with request.app.state.ingest_slots:
+            summary = await asyncio.to_thread(
+                payload_archive.replay_days, start, end, lambda rows: main.ingest_to_sinks(rows, strategy, sink_names)
+            )
+        return FlaskJSONResponse({"status": "ok", "from": start, "to": end, **summary})
+    except Exception as e:
+        return FlaskJSONResponse({"error": str(e)}, status_code=500)
+
+
+async def ingest_file(request):
+    """
+    Same query parameters as main.ingest_file, plus `filename` to take the
+    format from. The file is the raw request body (multipart parsing would
+    need python-multipart), spooled before ingest.
+    """
+    args = request.query_params
+    sink_name = args.get("sink", sinks.PRIMARY_SINK)
+    if sink_name not in sinks.SINKS:
+        return FlaskJSONResponse({"error": f"Unknown sink: {sink_name}"}, status_code=400)
+    try:
+        fmt, gzipped = file_ingest.upload_options(
+            args.get("filename"), args.get("format"), args.get("gzip") == "1" if "gzip" in args else None
+        )
+    except ValueError as e:
+        return FlaskJSONResponse({"error": str(e)}, status_code=400)
+    chunk_rows = int(args["chunk_rows"]) if args.get("chunk_rows") else None
+
+    try:
+        with file_ingest.spool_upload() as body:
+            async for piece in request.stream():
+                body.write(piece)
+            body.seek(0)
+            async with request.app.state.ingest_slots:
+                result = await asyncio.to_thread(
+                    file_ingest.ingest_file, body, fmt, gzipped, sink_name, chunk_rows
+                )
+        return FlaskJSONResponse({"status": "ok", "format": fmt, "bq_status": result})
+    except Exception as e:
+        return FlaskJSONResponse({"error": str(e)}, status_code=500)
+
+
+async def sink_progress(request):
+    """Same query parameters as main.sink_progress."""
+    try:
+        progress = await asyncio.to_thread(main.get_sink_progress, request.query_params.get("date"))
+        return FlaskJSONResponse({"configured": sinks.parse_sinks(), "progress": progress})
+    except Exception as e:
+        return FlaskJSONResponse({"error": str(e)}, status_code=500)
+
+
+async def schedule(request):
+    return FlaskJSONResponse(await asyncio.to_thread(main.scheduler.read_state))
+
+
+app = Starlette(
+    routes=[
+        Route("/", index),
+        Route("/fetch", fetch),
+        Route("/replay", replay),
+        Route("/sinks", sink_progress),
+        Route("/ingest-file", ingest_file, methods=["POST"]),
+        Route("/schedule", schedule),
+    ],
+    lifespan=lifespan,
+)
@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+Checkpointed, resumable backfill of the orders table.
+
+Runs the /fetch ingest pipeline from main.py once per day of a date range
+with bounded concurrency and an API rate limit. Completed (day, sink) pairs
+are recorded in a checkpoint file, so a crashed or interrupted backfill
+resumes where it stopped, and a rerun with more sinks only writes the sinks
+a day is missing. Each day is fetched once per run: sinks that failed are
+retried from the fetched payload, without calling the API again.
+Delivery dates whose dashboard rollup refresh failed (e.g. a transaction
+aborted by a concurrent ingest) are kept in the checkpoint and refreshed
+again at the end of the run, and of every later run until they succeed.
+
+Usage:
+    python backfill.py --from 2025-01-01 --to 2025-03-31
+    python backfill.py --from 2025-01-01 --to 2025-03-31 --concurrency 4 --rate 20
+    python backfill.py --from 2025-01-01 --to 2025-03-31 --sinks enriched,v1
+"""
+import argparse
+import datetime as dt
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import json_codec
+import order_rollups
+import sinks
+
+DEFAULT_CHECKPOINT = "backfill_checkpoint.json"
+DEFAULT_CONCURRENCY = 3
+DEFAULT_RATE_PER_MIN = 30  # API calls per minute
+DEFAULT_RETRIES = 2
+RETRY_BACKOFF_SECONDS = 30
+
+
+class RateLimiter:
+    """Token bucket shared by all worker threads (one token per API call)."""
+
+    def __init__(self, per_minute: float):
+        self.interval = 60.0 / per_minute
+        self.next_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            now = time.monotonic()
+            wait = self.next_at - now
+            self.next_at = max(now, self.next_at) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+
+class Checkpoint:
+    """
+    JSON file of completed (day, sink) pairs, failed days and stale rollup
+    delivery dates, rewritten atomically:
+    {"completed": {day: {sink: result}}, "failed": {day: result}, "rollup_dates": [date]}.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.state = {"completed": {}, "failed": {}, "rollup_dates": []}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.state = json.load(f)
+            self.state.setdefault("completed", {})
+            self.state.setdefault("failed", {})
+            self.state.setdefault("rollup_dates", [])
+
+    def pending_sinks(self, day: str, sink_names: list) -> list:
+        """The sinks not written yet for a day."""
+        done = self.state["completed"].get(day, {})
+        return [name for name in sink_names if name not in done]
+
+    def record(self, day: str, result: dict, ok: bool):
+        """Store the sinks a day attempt wrote; the day stays failed until every sink is done."""
+        with self.lock:
+            completed = self.state["completed"].setdefault(day, {})
+            for name, sink_result in result.get("sinks", {}).items():
+                if sink_result.get("status") != "error":
+                    completed[name] = sink_result
+            if ok:
+                self.state["failed"].pop(day, None)
+            else:
+                self.state["failed"][day] = result
+            self._add_rollup_dates(result.get("rollup_dates", []))
+            self._save()
+
+    def set_rollup_dates(self, dates: list):
+        """Replace the stale rollup delivery dates (after a repair attempt)."""
+        with self.lock:
+            self.state["rollup_dates"] = []
+            self._add_rollup_dates(dates)
+            self._save()
+
+    def _add_rollup_dates(self, dates: list):
+        self.state["rollup_dates"] = order_rollups.delivery_date_list(set(self.state["rollup_dates"]) | set(dates))
+
+    def _save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.state, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+
+def date_range(start: str, end: str) -> list:
+    first = dt.date.fromisoformat(start)
+    last = dt.date.fromisoformat(end)
+    return [(first + dt.timedelta(days=i)).isoformat() for i in range((last - first).days + 1)]
+
+
+def _sink_summary(result: dict, strategy: str) -> dict:
+    return {
+        "status": result.get("status"),
+        "inserted_rows": result.get("inserted_rows", 0),
+        "skipped_duplicates": result.get("skipped_duplicates", 0),
+        "strategy": strategy,
+        "finished_at": dt.datetime.now().isoformat(timespec="seconds"),
+    }
+
+
+def backfill_day(day: str, limiter: RateLimiter, retries: int, strategy: str = None,
+                 sink_names: list = None) -> tuple:
+    """
+    Fetch and ingest one day into the given sinks; returns (ok, result).
+
+    The API response is kept (undecoded) after the first successful call,
+    so retries only re-write the sinks that failed, from the same payload.
+    """
+    from main import INGEST_STRATEGY, fetch_payload, ingest_payload
+
+    strategy = strategy or INGEST_STRATEGY
+    attempt = 0
+    content = None
+    archived = False
+    pending_sinks = sink_names
+    sink_results = {}
+    rollup_dates = set()
+    row_count = 0
+    started = time.time()
+    while True:
+        try:
+            if content is None:
+                limiter.acquire()
+                content, body, status = fetch_payload(day)
+            if content is not None:
+                # The payload is archived once, not again by retries
+                body, status = ingest_payload(
+                    json_codec.loads(content), day, "backfill", 0, 8, strategy,
+                    sink_names=pending_sinks, archive=not archived,
+                )
+                archived = True
+        except Exception as e:
+            body, status = {"error": str(e)}, 500
+
+        if status == 200:
+            row_count = body.get("row_count", 0)
+            for name, result in (body.get("sinks") or {}).items():
+                rollups = result.get("rollups") or {}
+                if rollups.get("status") == "error":
+                    rollup_dates.update(rollups.get("delivery_dates", []))
+                sink_results[name] = (
+                    {"status": "error", "error": result.get("error")} if result.get("status") == "error"
+                    else _sink_summary(result, strategy)
+                )
+            failed_sinks = [name for name, result in sink_results.items() if result["status"] == "error"]
+            primary = sink_results.get(sinks.PRIMARY_SINK) or next(iter(sink_results.values()), {})
+            summary = {
+                "row_count": row_count,
+                "inserted_rows": primary.get("inserted_rows", 0),
+                "skipped_duplicates": primary.get("skipped_duplicates", 0),
+                "sinks": sink_results,
+                "rollup_dates": list(rollup_dates),
+                "seconds": round(time.time() - started, 2),
+            }
+            if not failed_sinks:
+                return True, summary
+            pending_sinks = failed_sinks
+            body = {"error": "; ".join(f"{name}: {sink_results[name].get('error')}" for name in failed_sinks)}
+        if attempt >= retries:
+            return False, {"status": status, "error": body.get("error"), "attempts": attempt + 1,
+                           "sinks": sink_results, "rollup_dates": list(rollup_dates)}
+        attempt += 1
+        source = "fetched payload" if content is not None else "API"
+        print(f"⚠️ {day} failed ({status}: {body.get('error')}), retry {attempt}/{retries} from the {source}")
+        time.sleep(RETRY_BACKOFF_SECONDS * attempt)
+
+
+def run_backfill(start: str, end: str, concurrency: int, rate_per_min: float,
+                 checkpoint_path: str, retries: int, strategy: str = None, sink_names: list = None) -> dict:
+    checkpoint = Checkpoint(checkpoint_path)
+    days = date_range(start, end)
+    sink_names = sink_names or sinks.parse_sinks()
+    # Day -> sinks it still needs; a sink done with another strategy holds the same rows
+    pending = {day: checkpoint.pending_sinks(day, sink_names) for day in days}
+    pending = {day: names for day, names in pending.items() if names}
+    print(f"📅 Backfill {start} → {end} into {', '.join(sink_names)}: {len(days)} days, "
+          f"{len(days) - len(pending)} already done, {len(pending)} to go "
+          f"(concurrency {concurrency}, {rate_per_min:g} calls/min)")
+
+    limiter = RateLimiter(rate_per_min)
+    started = time.time()
+    totals = {"days": 0, "failed": 0, "row_count": 0, "inserted_rows": 0}
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = {
+            pool.submit(backfill_day, day, limiter, retries, strategy, names): day
+            for day, names in pending.items()
+        }
+        for future in as_completed(futures):
+            day = futures[future]
+            ok, result = future.result()
+            checkpoint.record(day, result, ok)
+            if ok:
+                totals["days"] += 1
+                totals["row_count"] += result["row_count"]
+                totals["inserted_rows"] += result["inserted_rows"]
+                print(f"✅ {day}: {result['row_count']:,} rows, {result['inserted_rows']:,} inserted "
+                      f"({result['seconds']:.1f}s) [{totals['days']}/{len(pending)}]")
+            else:
+                totals["failed"] += 1
+                print(f"❌ {day}: {result['error']}")
+
+    totals["stale_rollup_dates"] = repair_rollups(checkpoint)
+    elapsed = time.time() - started
+    totals["elapsed_seconds"] = round(elapsed, 1)
+    return totals
+
+
+def repair_rollups(checkpoint: Checkpoint) -> int:
+    """Refresh the rollups of the delivery dates whose refresh failed; returns how many stay stale."""
+    dates = checkpoint.state["rollup_dates"]
+    if not dates:
+        return 0
+    from main import bq_client
+
+    try:
+        order_rollups.refresh_delivery_dates(bq_client, dates)
+        print(f"📊 Refreshed dashboard rollups for {len(dates)} delivery dates left stale by failed refreshes")
+        checkpoint.set_rollup_dates([])
+        return 0
+    except Exception as e:
+        print(f"⚠️ Warning: Could not refresh dashboard rollups for {len(dates)} delivery dates: {e}")
+        return len(dates)
+
+
+def print_report(totals: dict):
+    elapsed = max(totals["elapsed_seconds"], 1e-9)
+    print("\n" + "=" * 60)
+    print("BACKFILL REPORT")
+    print("=" * 60)
+    print(f"Days completed:  {totals['days']:,}")
+    print(f"Days failed:     {totals['failed']:,}")
+    print(f"Rows fetched:    {totals['row_count']:,}")
+    print(f"Rows inserted:   {totals['inserted_rows']:,}")
+    print(f"Elapsed:         {elapsed:,.1f}s")
+    print(f"Throughput:      {totals['row_count'] / elapsed:,.0f} rows/s, "
+          f"{totals['days'] / elapsed * 60:,.1f} days/min")
+    if totals["failed"]:
+        print("⚠️ Failed days are kept in the checkpoint; rerun the same command to retry them.")
+    if totals["stale_rollup_dates"]:
+        print(f"⚠️ {totals['stale_rollup_dates']:,} delivery dates have stale dashboard rollups; "
+              "they are kept in the checkpoint and refreshed by the next run.")
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description="Resumable backfill of the orders table")
+    parser.add_argument("--from", dest="start", required=True, help="YYYY-MM-DD")
+    parser.add_argument("--to", dest="end", required=True, help="YYYY-MM-DD (inclusive)")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--rate", type=float, default=DEFAULT_RATE_PER_MIN, help="Max API calls per minute")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT)
+    parser.add_argument("--retries", type=int, default=DEFAULT_RETRIES)
+    parser.add_argument("--strategy", default=None, help="stream or merge (default: INGEST_STRATEGY)")
+    parser.add_argument("--sinks", default=None, help="Comma-separated sink tables (default: INGEST_SINKS)")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = _parse_args()
+    totals = run_backfill(
+        args.start, args.end, args.concurrency, args.rate,
+        args.checkpoint, args.retries, args.strategy,
+        sinks.parse_sinks(args.sinks),
+    )
+    print_report(totals)
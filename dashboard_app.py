@@ -11,7 +11,21 @@ from plotly.subplots import make_subplots
 from google.cloud import bigquery
 from datetime import datetime, timedelta
 import numpy as np
-from io import BytesIO
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import threading
+import time
+
+import dashboard_cache
+import dashboard_export
+import dashboard_frames
+import dashboard_perf
+import dashboard_periods
+import dashboard_queries
+from dashboard_text import normalize_series
+import dimension_catalog
+import order_rollups
 
 # ============================================
 # PAGE CONFIG
@@ -70,52 +84,186 @@ def get_bq_client():
         st.stop()
         raise
 
+# Query records of this rerun, for the performance panel (see dashboard_perf.py)
+st.session_state["query_records"] = []
+# Set when the cached query function really runs (not an st.cache_data hit)
+_query_state = threading.local()
+
+def record_query(panel, query, started, rows, cache, bytes_processed=0, bytes_billed=0,
+                 memory_bytes=0, memory_bytes_before=0):
+    record = dashboard_perf.make_record(
+        panel, query, (time.perf_counter() - started) * 1000, rows, cache, bytes_processed, bytes_billed,
+        memory_bytes, memory_bytes_before
+    )
+    st.session_state["query_records"].append(record)
+    dashboard_perf.append_log(record)
+
+def _fetch_bigquery(query, client=None):
+    _query_state.ran = True
+    client = client or get_bq_client()
+    job = client.query(query)
+    # Columnar download, compact dtypes (see dashboard_frames.py)
+    table = job.to_arrow()
+    df = dashboard_frames.compact_frame(table)
+    return df, {**dashboard_perf.job_stats(job), **dashboard_frames.memory_stats(table, df)}
+
 @st.cache_data(ttl=300)
-def run_query(query):
+def _run_bigquery(query):
+    return _fetch_bigquery(query)
+
+# Slowly changing results (the dimension catalog); cleared by "Veriyi Yenile" as well
+DIMENSION_CATALOG_TTL_SECONDS = int(os.getenv("DASHBOARD_DIMENSION_CATALOG_TTL_SECONDS", "21600"))
+
+@st.cache_data(ttl=DIMENSION_CATALOG_TTL_SECONDS)
+def _run_bigquery_long(query):
+    return _fetch_bigquery(query)
+
+def run_query(query, panel="Diğer", long_lived=False):
+    _query_state.ran = False
+    started = time.perf_counter()
+    df, stats = (_run_bigquery_long if long_lived else _run_bigquery)(query)
+    if not _query_state.ran:
+        stats = {"cache": "streamlit", "memory_bytes": stats["memory_bytes"],
+                 "memory_bytes_before": stats["memory_bytes_before"]}
+    record_query(panel, query, started, len(df), **stats)
+    return df
+
+# Daily rollups maintained by ingest (see order_rollups.py); 0 = always query raw rows
+USE_ROLLUPS = os.getenv("DASHBOARD_USE_ROLLUPS", "1") == "1"
+ORDER_ROLLUP = order_rollups.rollup_table("orders")
+PRODUCT_ROLLUP = order_rollups.rollup_table("products")
+VENDOR_ROLLUP = order_rollups.rollup_table("vendors")
+
+@st.cache_data(ttl=600)
+def rollups_available():
     client = get_bq_client()
-    return client.query(query).to_dataframe()
+    try:
+        for table in (ORDER_ROLLUP, PRODUCT_ROLLUP, VENDOR_ROLLUP):
+            client.get_table(table)
+        return True
+    except Exception:
+        return False
+
+@st.cache_data(ttl=600)
+def dimension_catalog_available():
+    try:
+        get_bq_client().get_table(dimension_catalog.CATALOG_TABLE)
+        return True
+    except Exception:
+        return False
 
-# Excel export helper
-def to_excel(df):
-    # Create a copy to avoid modifying original
-    df_export = df.copy()
-    
-    # Remove timezone from datetime columns
-    for col in df_export.columns:
-        if pd.api.types.is_datetime64_any_dtype(df_export[col]):
-            df_export[col] = df_export[col].dt.tz_localize(None)
-        elif df_export[col].dtype == 'object':
-            # Check if it's a timezone-aware datetime string
-            try:
-                df_export[col] = pd.to_datetime(df_export[col])
-                if df_export[col].dt.tz is not None:
-                    df_export[col] = df_export[col].dt.tz_localize(None)
-            except:
-                pass
-    
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df_export.to_excel(writer, index=False, sheet_name='Siparişler')
-    return output.getvalue()
+# Local cache of order days (see dashboard_cache.py); 0 = always query BigQuery
+LOCAL_CACHE = os.getenv("DASHBOARD_LOCAL_CACHE", "1") == "1"
 
-# ============================================
-# NORMALIZATION
-# ============================================
-def normalize_turkish(text):
-    if pd.isna(text) or text is None:
-        return text
-    text = str(text).strip()
-    fixes = {'Ä°': 'I', 'Ä±': 'i', 'Ã': 'A', 'Ã¼': 'u', 'Ã¶': 'o', 'Ã§': 'c', 'Å': 'S', 'ÄŸ': 'g', '0STANBUL': 'ISTANBUL'}
-    for old, new in fixes.items():
-        text = text.replace(old, new)
-    replacements = {'ğ': 'g', 'Ğ': 'G', 'ü': 'u', 'Ü': 'U', 'ş': 's', 'Ş': 'S', 'ı': 'i', 'İ': 'I', 'ö': 'o', 'Ö': 'O', 'ç': 'c', 'Ç': 'C'}
-    for old, new in replacements.items():
-        text = text.replace(old, new)
-    if 'ISTANBUL' in text.upper() and 'AVRUPA' in text.upper():
-        text = 'ISTANBUL-AVRUPA'
-    elif 'ISTANBUL' in text.upper() and 'ANADOLU' in text.upper():
-        text = 'ISTANBUL-ANADOLU'
-    return text.replace('  ', ' ')
+@st.cache_resource
+def get_slice_store():
+    return dashboard_cache.SliceStore()
+
+def run_local_query(query, panel="Diğer"):
+    started = time.perf_counter()
+    table = get_slice_store().query_arrow(query)
+    df = dashboard_frames.compact_frame(table)
+    record_query(panel, query, started, len(df), "local", **dashboard_frames.memory_stats(table, df))
+    return df
+
+def sync_local_cache(start, end):
+    """Bring the cached days of the range up to date; False when the range is not served locally."""
+    if not LOCAL_CACHE or not dashboard_cache.covers(start, end):
+        return False
+    try:
+        started = time.perf_counter()
+        result = get_slice_store().sync(get_bq_client(), start, end)
+        record_query(
+            "Yerel önbellek senkronu", f"sync {start} {end}", started, result["loaded_rows"],
+            "miss" if result["checked"] or result["loaded_days"] else "local",
+            result["bytes_processed"], result["bytes_processed"],
+        )
+        return True
+    except Exception as e:
+        print(f"⚠️ Warning: Local cache unavailable, querying BigQuery: {e}")
+        return False
+
+def prepare_export(query, fmt, key, local):
+    """Write a full export to a temporary file, page by page, for the download button."""
+    started = time.perf_counter()
+    if local:
+        pages = get_slice_store().iter_batches(query, dashboard_export.EXPORT_PAGE_ROWS)
+    else:
+        job, pages = dashboard_export.bigquery_pages(get_bq_client(), query)
+    result = dashboard_export.write_export(pages, fmt)
+    stats = {"cache": "local"} if local else dashboard_perf.job_stats(job)
+    record_query("Dışa aktarma", query, started, result["rows"], **stats)
+    previous = st.session_state.get("export")
+    if previous and os.path.exists(previous["path"]):
+        os.remove(previous["path"])
+    st.session_state["export"] = {**result, "key": key, "created": datetime.now().strftime('%Y%m%d_%H%M%S')}
+
+# Daily totals behind the period comparison (see dashboard_periods.py)
+@st.cache_resource
+def get_period_store():
+    return dashboard_periods.PeriodStore()
+
+def fetch_daily_totals(ranges, local, approximate):
+    """
+    Daily totals of the missing comparison days, in one query. approximate
+    must match the period-store key: the HLL rollups only answer keys
+    marked approximate, every other key reads the raw table.
+    """
+    if local:
+        return run_local_query(
+            dashboard_periods.build_daily_query(filter_where, ranges, local_table=dashboard_cache.LOCAL_TABLE),
+            "Karşılaştırma",
+        )
+    return run_query(dashboard_periods.build_daily_query(filter_where, ranges, approximate), "Karşılaştırma")
+
+# Order list pages (see dashboard_queries.fetch_orders_page); the next page is prefetched
+ORDER_PAGE_SIZES = [50, 100, 250, 500]
+
+@st.cache_resource
+def get_prefetch_pool():
+    return ThreadPoolExecutor(max_workers=2, thread_name_prefix="order-pages")
+
+def fetch_order_page(fetch_page, store, client, cursor):
+    """
+    A page of the order list, its next cursor and the summed stats of its
+    queries (runs in the prefetch pool; store is None for BigQuery pages).
+    """
+    stats = {"bytes_processed": 0, "bytes_billed": 0, "memory_bytes": 0, "memory_bytes_before": 0}
+    def fetch_frame(query):
+        if store is not None:
+            table = store.query_arrow(query)
+            df = dashboard_frames.compact_frame(table)
+            query_stats = dashboard_frames.memory_stats(table, df)
+        else:
+            df, query_stats = _fetch_bigquery(query, client)
+        for key in stats:
+            stats[key] += query_stats.get(key, 0)
+        return df
+    frame, next_cursor = fetch_page(fetch_frame, after=cursor)
+    return frame, next_cursor, stats
+
+def order_page(pager, cursor):
+    """A page of the order list and the next page's cursor, prefetched when possible."""
+    future = pager["pages"].get(cursor)
+    cache = "prefetch" if future is not None else ("local" if pager["local"] else "miss")
+    if future is None:
+        future = pager["pages"][cursor] = get_prefetch_pool().submit(pager["fetch"], cursor)
+    started = time.perf_counter()
+    try:
+        frame, next_cursor, stats = future.result()
+    except Exception:
+        del pager["pages"][cursor]
+        raise
+    record_query("Sipariş listesi", f"{pager['key']} after {cursor}", started, len(frame), cache, **stats)
+    return frame.copy(), next_cursor
+
+def keep_order_pages(pager, cursors):
+    """Drop the fetched pages other than the given ones (the current and the next page)."""
+    for cursor in [cursor for cursor in pager["pages"] if cursor not in cursors]:
+        pager["pages"].pop(cursor).cancel()
+
+def move_order_page(step):
+    st.session_state["order_pager"]["page"] += step
 
 # ============================================
 # EXECUTIVE HEADER
@@ -158,26 +306,39 @@ else:
         max_value=datetime.now()
     )
 
+# Filter values from the dimension catalog kept by ingest (see dimension_catalog.py)
+if dimension_catalog_available():
+    catalog_df = run_query(
+        dimension_catalog.catalog_query(["city", "payment_method"]), "Filtre kataloğu", long_lived=True
+    )
+    cities_df = catalog_df[catalog_df['dimension'] == 'city'].rename(
+        columns={'value': 'city', 'normalized_value': 'city_normalized'}
+    )
+    payment_df = catalog_df[catalog_df['dimension'] == 'payment_method'].rename(columns={'value': 'payment_method'})
+else:
+    cities_query = """
+    SELECT DISTINCT city
+    FROM `tazecicekdb.order_data.order_items_clean_v3_enriched_partitioned_clustered`
+    WHERE city IS NOT NULL
+    ORDER BY city
+    """
+    cities_df = run_query(cities_query, "Şehir filtresi")
+    cities_df['city_normalized'] = normalize_series(cities_df['city'])
+    payment_query = """
+    SELECT DISTINCT payment_method
+    FROM `tazecicekdb.order_data.order_items_clean_v3_enriched_partitioned_clustered`
+    WHERE payment_method IS NOT NULL
+    ORDER BY payment_method
+    """
+    payment_df = run_query(payment_query, "Ödeme filtresi")
+
 # City Filter
-cities_query = """
-SELECT DISTINCT city
-FROM `tazecicekdb.order_data.order_items_clean_v3_enriched_partitioned_clustered`
-WHERE city IS NOT NULL
-ORDER BY city
-"""
-cities_df = run_query(cities_query)
-cities_df['city_normalized'] = cities_df['city'].apply(normalize_turkish)
-selected_cities = st.sidebar.multiselect("🏙️ Şehirler", options=cities_df['city_normalized'].tolist(), default=[])
+selected_cities = st.sidebar.multiselect(
+    "🏙️ Şehirler", options=cities_df['city_normalized'].drop_duplicates().tolist(), default=[]
+)
 selected_cities_original = cities_df[cities_df['city_normalized'].isin(selected_cities)]['city'].tolist() if selected_cities else []
 
 # Payment Method
-payment_query = """
-SELECT DISTINCT payment_method
-FROM `tazecicekdb.order_data.order_items_clean_v3_enriched_partitioned_clustered`
-WHERE payment_method IS NOT NULL
-ORDER BY payment_method
-"""
-payment_df = run_query(payment_query)
 selected_payment = st.sidebar.multiselect("💳 Ödeme Yöntemleri", options=payment_df['payment_method'].tolist(), default=[])
 
 # Comparison Mode
@@ -185,80 +346,88 @@ st.sidebar.markdown("---")
 compare_mode = st.sidebar.checkbox("📊 Karşılaştırma Modu", value=False)
 compare_period = None
 if compare_mode:
-    compare_period = st.sidebar.selectbox("Karşılaştır", ["Önceki Dönem", "Önceki Yıl", "Önceki Ay"])
+    compare_period = st.sidebar.selectbox("Karşılaştır", dashboard_periods.COMPARISONS)
 
 # Refresh
 st.sidebar.markdown("---")
 if st.sidebar.button("🔄 Veriyi Yenile"):
     st.cache_data.clear()
+    get_period_store().clear()
+    st.session_state.pop("order_pager", None)
+    if LOCAL_CACHE:
+        get_slice_store().expire()
     st.rerun()
+show_perf = st.sidebar.checkbox("🛠️ Performans Paneli", value=False)
 
 # ============================================
 # BUILD WHERE CLAUSE
 # ============================================
-where_conditions = []
-if date_range[0] and date_range[1]:
-    where_conditions.append(f"order_created_date_tr BETWEEN '{date_range[0]}' AND '{date_range[1]}'")
+filter_conditions = []
 if selected_cities_original:
     cities_str = "', '".join(selected_cities_original)
-    where_conditions.append(f"city IN ('{cities_str}')")
+    filter_conditions.append(f"city IN ('{cities_str}')")
 if selected_payment:
     payment_str = "', '".join(selected_payment)
-    where_conditions.append(f"payment_method IN ('{payment_str}')")
+    filter_conditions.append(f"payment_method IN ('{payment_str}')")
+# Non-date filters alone, for the period comparison
+filter_where = " AND ".join(filter_conditions) if filter_conditions else "1=1"
+where_conditions = []
+if date_range[0] and date_range[1]:
+    where_conditions.append(f"order_created_date_tr BETWEEN '{date_range[0]}' AND '{date_range[1]}'")
+where_conditions += filter_conditions
 where_clause = " AND ".join(where_conditions) if where_conditions else "1=1"
 
+# Same filters on the rollup tables (day column: order_date)
+use_rollups = USE_ROLLUPS and rollups_available()
+rollup_where = where_clause.replace("order_created_date_tr BETWEEN", "order_date BETWEEN")
+
+# Order-items queries run on the local cache when it holds the date range
+use_local = len(date_range) == 2 and sync_local_cache(date_range[0], date_range[1])
+items_table = (
+    dashboard_cache.LOCAL_TABLE if use_local
+    else "`tazecicekdb.order_data.order_items_clean_v3_enriched_partitioned_clustered`"
+)
+
 # ============================================
 # EXECUTIVE SUMMARY - KEY METRICS
 # ============================================
 st.markdown("### 📈 Yönetim Özeti")
 
-metrics_query = f"""
-SELECT
-  COUNT(DISTINCT order_id) AS total_orders,
-  COUNT(*) AS total_items,
-  SUM(order_amount) AS total_revenue,
-  AVG(order_amount) AS avg_order_value,
-  COUNT(DISTINCT DATE(order_created_date_tr)) AS active_days,
-  COUNT(DISTINCT city) AS unique_cities,
-  COUNT(DISTINCT vendor_id) AS unique_vendors
-FROM `tazecicekdb.order_data.order_items_clean_v3_enriched_partitioned_clustered`
-WHERE {where_clause}
-  AND order_created_date_tr IS NOT NULL
-"""
-
-metrics_df = run_query(metrics_query)
+# One GROUPING SETS job behind every aggregate panel (see dashboard_queries.py)
+if use_local:
+    panel_frame = run_local_query(
+        dashboard_queries.build_panel_query(where_clause, local_table=dashboard_cache.LOCAL_TABLE), "Paneller"
+    )
+else:
+    panel_frame = run_query(
+        dashboard_queries.build_panel_query(where_clause, rollup_where, use_rollups), "Paneller"
+    )
+panels = dashboard_queries.split_panels(panel_frame)
+metrics_df = panels["metrics"]
 
 # Calculate growth if comparison mode
 growth_orders = None
 growth_revenue = None
 if compare_mode and compare_period:
-    if compare_period == "Önceki Dönem":
-        days_diff = (date_range[1] - date_range[0]).days
-        compare_start = date_range[0] - timedelta(days=days_diff + 1)
-        compare_end = date_range[0] - timedelta(days=1)
-    elif compare_period == "Önceki Yıl":
-        compare_start = date_range[0] - timedelta(days=365)
-        compare_end = date_range[1] - timedelta(days=365)
-    else:
-        compare_start = date_range[0] - timedelta(days=30)
-        compare_end = date_range[1] - timedelta(days=30)
-    
-    compare_where = where_clause.replace(
-        f"order_created_date_tr BETWEEN '{date_range[0]}' AND '{date_range[1]}'",
-        f"order_created_date_tr BETWEEN '{compare_start}' AND '{compare_end}'"
+    # Days of every comparison type in one read, so switching types is free
+    period_ranges = dashboard_periods.all_periods(date_range[0], date_range[1])
+    # With the local cache on, days outside the synced range come from the raw
+    # table too, so the stored totals stay exact like the local ones
+    period_approximate = use_rollups and not use_local
+    period_state = dashboard_periods.filter_state(selected_cities_original, selected_payment, period_approximate)
+    period_store = get_period_store()
+    # Missing days inside the synced range are read from the local cache
+    missing = period_store.missing_ranges(period_state, period_ranges)
+    compare_local = use_local and all(date_range[0] <= first and last <= date_range[1] for first, last in missing)
+    daily_totals = period_store.daily(
+        period_state, period_ranges,
+        partial(fetch_daily_totals, local=compare_local, approximate=period_approximate),
+    )
+    current_period, previous_period = dashboard_periods.periods(date_range[0], date_range[1], compare_period)
+    growth_orders, growth_revenue = dashboard_periods.growth(
+        dashboard_periods.totals(daily_totals, current_period),
+        dashboard_periods.totals(daily_totals, previous_period),
     )
-    compare_query = f"""
-    SELECT
-      COUNT(DISTINCT order_id) AS total_orders,
-      SUM(order_amount) AS total_revenue
-    FROM `tazecicekdb.order_data.order_items_clean_v3_enriched_partitioned_clustered`
-    WHERE {compare_where}
-      AND order_created_date_tr IS NOT NULL
-    """
-    compare_df = run_query(compare_query)
-    if compare_df['total_orders'].iloc[0] > 0:
-        growth_orders = ((metrics_df['total_orders'].iloc[0] - compare_df['total_orders'].iloc[0]) / compare_df['total_orders'].iloc[0]) * 100
-        growth_revenue = ((metrics_df['total_revenue'].iloc[0] - compare_df['total_revenue'].iloc[0]) / compare_df['total_revenue'].iloc[0]) * 100
 
 # Golden Ratio Layout: 1.618 columns
 col1, col2, col3, col4 = st.columns([1.618, 1, 1.618, 1])
@@ -308,20 +477,7 @@ col1, col2 = st.columns([1.618, 1])  # Golden ratio
 
 with col1:
     st.markdown("### 📈 Gelir & Sipariş Trendleri")
-    daily_query = f"""
-    SELECT
-      order_created_date_tr AS date,
-      COUNT(DISTINCT order_id) AS unique_orders,
-      SUM(order_amount) AS total_revenue,
-      AVG(order_amount) AS avg_order_value
-    FROM `tazecicekdb.order_data.order_items_clean_v3_enriched_partitioned_clustered`
-    WHERE {where_clause}
-      AND order_created_date_tr IS NOT NULL
-    GROUP BY date
-    ORDER BY date DESC
-    LIMIT 90
-    """
-    daily_df = run_query(daily_query).sort_values('date')
+    daily_df = panels["daily"].sort_values('date')
     
     fig = make_subplots(specs=[[{"secondary_y": True}]])
     
@@ -405,7 +561,8 @@ with col2:
         <div class="insight-box">
             <h4 style="color: {'green' if growth_orders > 0 else 'red'}; margin-bottom: 0.5rem;">📊 Büyüme Analizi</h4>
             <p style="margin: 0; color: #666;">Sipariş: {growth_orders:+.1f}%</p>
-            <p style="margin: 0; color: #666;">Gelir: {growth_revenue:+.1f}%</p>
+            <p style="margin: 0; color: #666;">Gelir: {f"{growth_revenue:+.1f}%" if growth_revenue is not None else "-"}</p>
+            <p style="margin: 0; color: #666;">{current_period[0]} – {current_period[1]} / {previous_period[0]} – {previous_period[1]}</p>
         </div>
         """, unsafe_allow_html=True)
 
@@ -418,19 +575,7 @@ col1, col2 = st.columns([1.618, 1])
 
 with col1:
     st.markdown("### 🔥 Haftalık & Saatlik Dağılım")
-    heatmap_query = f"""
-    SELECT
-      EXTRACT(DAYOFWEEK FROM order_created_date_tr) AS day_of_week,
-      EXTRACT(HOUR FROM order_creation_timestamp) AS hour,
-      COUNT(DISTINCT order_id) AS unique_orders
-    FROM `tazecicekdb.order_data.order_items_clean_v3_enriched_partitioned_clustered`
-    WHERE {where_clause}
-      AND order_created_date_tr IS NOT NULL
-      AND order_creation_timestamp IS NOT NULL
-    GROUP BY day_of_week, hour
-    ORDER BY day_of_week, hour
-    """
-    heatmap_df = run_query(heatmap_query)
+    heatmap_df = panels["heatmap"]
     
     if not heatmap_df.empty:
         pivot_df = heatmap_df.pivot(index='day_of_week', columns='hour', values='unique_orders').fillna(0)
@@ -452,20 +597,8 @@ with col1:
 
 with col2:
     st.markdown("### 🏙️ En İyi Şehirler")
-    city_query = f"""
-    SELECT
-      city,
-      COUNT(DISTINCT order_id) AS unique_orders,
-      SUM(order_amount) AS total_revenue
-    FROM `tazecicekdb.order_data.order_items_clean_v3_enriched_partitioned_clustered`
-    WHERE {where_clause}
-      AND city IS NOT NULL
-    GROUP BY city
-    ORDER BY unique_orders DESC
-    LIMIT 10
-    """
-    city_df = run_query(city_query)
-    city_df['city_display'] = city_df['city'].apply(normalize_turkish)
+    city_df = panels["city"]
+    city_df['city_display'] = normalize_series(city_df['city'])
     city_df = city_df.groupby('city_display').agg({
         'unique_orders': 'sum',
         'total_revenue': 'sum'
@@ -500,19 +633,8 @@ col1, col2 = st.columns([1.618, 1])
 
 with col1:
     st.markdown("### 💳 Ödeme Yöntemleri")
-    payment_query = f"""
-    SELECT
-      payment_method,
-      COUNT(DISTINCT order_id) AS unique_orders,
-      SUM(order_amount) AS total_revenue
-    FROM `tazecicekdb.order_data.order_items_clean_v3_enriched_partitioned_clustered`
-    WHERE {where_clause}
-      AND payment_method IS NOT NULL
-    GROUP BY payment_method
-    ORDER BY unique_orders DESC
-    """
-    payment_df = run_query(payment_query)
-    payment_df['payment_method'] = payment_df['payment_method'].apply(normalize_turkish)
+    payment_df = panels["payment"]
+    payment_df['payment_method'] = normalize_series(payment_df['payment_method'])
     
     fig = px.pie(
         payment_df,
@@ -534,18 +656,8 @@ with col1:
 
 with col2:
     st.markdown("### 📊 Teslimat Durumu")
-    delivery_query = f"""
-    SELECT
-      delivery_status,
-      COUNT(DISTINCT order_id) AS unique_orders
-    FROM `tazecicekdb.order_data.order_items_clean_v3_enriched_partitioned_clustered`
-    WHERE {where_clause}
-      AND delivery_status IS NOT NULL
-    GROUP BY delivery_status
-    ORDER BY unique_orders DESC
-    """
-    delivery_df = run_query(delivery_query)
-    delivery_df['delivery_status'] = delivery_df['delivery_status'].apply(normalize_turkish)
+    delivery_df = panels["delivery"]
+    delivery_df['delivery_status'] = normalize_series(delivery_df['delivery_status'])
     
     fig = px.bar(
         delivery_df,
@@ -582,136 +694,99 @@ tab1, tab2, tab3 = st.tabs(["📦 Sipariş Listesi", "🏆 En İyi Ürünler", "
 with tab1:
     st.markdown("#### 📊 Detaylı Sipariş Listesi")
     
-    # Limit selector
-    limit_options = [100, 500, 1000, 5000, 10000]
-    selected_limit = st.selectbox("Gösterilecek Kayıt Sayısı", limit_options, index=2)
-    
-    orders_query = f"""
-    SELECT
-      order_id,
-      order_created_date_tr AS tarih,
-      city AS sehir,
-      payment_method AS odeme_yontemi,
-      delivery_status AS teslimat_durumu,
-      vendor_id,
-      product_name AS urun_adi,
-      product_code_1 AS urun_kodu,
-      order_amount AS siparis_tutari,
-      order_creation_timestamp AS siparis_zamani
-    FROM `tazecicekdb.order_data.order_items_clean_v3_enriched_partitioned_clustered`
-    WHERE {where_clause}
-      AND order_created_date_tr IS NOT NULL
-    ORDER BY order_created_date_tr DESC, order_id
-    LIMIT {selected_limit}
-    """
+    page_rows = st.selectbox("Sayfa Boyutu", ORDER_PAGE_SIZES, index=1)
     
-    orders_df = run_query(orders_query)
+    # Keyset pages on (order_created_date_tr, order_id), fetched on demand
+    pager_key = (where_clause, items_table, page_rows)
+    pager = st.session_state.get("order_pager")
+    if pager is None or pager["key"] != pager_key:
+        fetch_page = partial(dashboard_queries.fetch_orders_page, where_clause=where_clause,
+                             table=items_table, page_rows=page_rows)
+        pager = st.session_state["order_pager"] = {
+            "key": pager_key,
+            "local": use_local,
+            "fetch": partial(fetch_order_page, fetch_page, get_slice_store() if use_local else None,
+                             get_bq_client()),
+            "page": 0,
+            "cursors": [None],
+            "offsets": [0],
+            "pages": {},
+        }
+    page = pager["page"]
+    orders_df, next_cursor = order_page(pager, pager["cursors"][page])
+    del pager["cursors"][page + 1:], pager["offsets"][page + 1:]
+    pager["offsets"].append(pager["offsets"][page] + len(orders_df))
+    if next_cursor is not None:
+        pager["cursors"].append(next_cursor)
+        if next_cursor not in pager["pages"]:
+            pager["pages"][next_cursor] = get_prefetch_pool().submit(pager["fetch"], next_cursor)
+    # Only the current and the next page stay in the session
+    keep_order_pages(pager, {pager["cursors"][page], next_cursor})
     
     if not orders_df.empty:
-        # Create a copy for Excel (keep numeric values)
-        orders_df_excel = orders_df.copy()
-        
-        # Remove timezone from datetime columns for Excel
-        for col in ['tarih', 'siparis_zamani']:
-            if col in orders_df_excel.columns:
-                if pd.api.types.is_datetime64_any_dtype(orders_df_excel[col]):
-                    orders_df_excel[col] = orders_df_excel[col].dt.tz_localize(None)
-                else:
-                    try:
-                        orders_df_excel[col] = pd.to_datetime(orders_df_excel[col])
-                        if orders_df_excel[col].dt.tz is not None:
-                            orders_df_excel[col] = orders_df_excel[col].dt.tz_localize(None)
-                    except:
-                        pass
-        
-        # Normalize Turkish characters for both
-        for col in ['sehir', 'odeme_yontemi', 'teslimat_durumu', 'urun_adi']:
-            if col in orders_df.columns:
-                orders_df[col] = orders_df[col].apply(normalize_turkish)
-                orders_df_excel[col] = orders_df_excel[col].apply(normalize_turkish)
-        
-        # Format currency for display only
-        orders_df_display = orders_df.copy()
-        if 'siparis_tutari' in orders_df_display.columns:
-            orders_df_display['siparis_tutari'] = orders_df_display['siparis_tutari'].apply(lambda x: f"₺{x:,.2f}" if pd.notna(x) else "")
-        
-        # Format datetime for display
-        if 'siparis_zamani' in orders_df_display.columns:
-            orders_df_display['siparis_zamani'] = pd.to_datetime(orders_df_display['siparis_zamani']).dt.strftime('%Y-%m-%d %H:%M:%S')
-        
-        # Rename columns for display
-        display_columns = {
-            'order_id': 'Sipariş ID',
-            'tarih': 'Tarih',
-            'sehir': 'Şehir',
-            'odeme_yontemi': 'Ödeme Yöntemi',
-            'teslimat_durumu': 'Teslimat Durumu',
-            'vendor_id': 'Vendor ID',
-            'urun_adi': 'Ürün Adı',
-            'urun_kodu': 'Ürün Kodu',
-            'siparis_tutari': 'Sipariş Tutarı',
-            'siparis_zamani': 'Sipariş Zamanı'
-        }
-        orders_df_display = orders_df_display.rename(columns=display_columns)
-        orders_df_excel = orders_df_excel.rename(columns=display_columns)
+        # One frame, formatted for display in place (exports read their own pages)
+        for col in dashboard_export.TEXT_COLUMNS:
+            orders_df[col] = normalize_series(orders_df[col])
+        orders_df['siparis_tutari'] = orders_df['siparis_tutari'].apply(lambda x: f"₺{x:,.2f}" if pd.notna(x) else "")
+        orders_df['siparis_zamani'] = pd.to_datetime(orders_df['siparis_zamani']).dt.strftime('%Y-%m-%d %H:%M:%S')
+        orders_df = orders_df.rename(columns=dashboard_export.ORDER_COLUMN_LABELS)
         
-        # Export button
+        # Export of every row of the filters, written page by page on request
         col1, col2 = st.columns([1, 4])
         with col1:
-            excel_data = to_excel(orders_df_excel)
-            st.download_button(
-                label="📥 Excel'e İndir",
-                data=excel_data,
-                file_name=f"siparisler_{date_range[0]}_to_{date_range[1]}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+            export_format = st.selectbox("Dosya Biçimi", list(dashboard_export.FORMATS), format_func=str.upper)
+            export_query = dashboard_queries.build_orders_query(
+                where_clause, items_table, dashboard_export.max_rows(export_format) + 1
             )
+            export_key = (export_query, export_format)
+            if st.button("📦 Dışa Aktarmayı Hazırla"):
+                with st.spinner("Dosya hazırlanıyor..."):
+                    prepare_export(export_query, export_format, export_key, use_local)
+            export = st.session_state.get("export")
+            if export and export["key"] == export_key:
+                # Streamlit keeps the whole file in memory while the button is shown
+                # (see dashboard_export.py); EXPORT_MAX_ROWS bounds its size
+                with open(export["path"], "rb") as f:
+                    st.download_button(
+                        label=f"📥 {export_format.upper()} İndir",
+                        data=f,
+                        file_name=f"siparisler_{date_range[0]}_to_{date_range[1]}_{export['created']}.{export_format}",
+                        mime=dashboard_export.FORMATS[export_format]
+                    )
         with col2:
-            st.info(f"📊 **{len(orders_df)}** sipariş gösteriliyor. Excel'e indirmek için yukarıdaki butonu kullanın.")
+            st.info("📊 Filtrelere uyan tüm kayıtları indirmek için biçimi seçip dosyayı hazırlayın.")
+            if export and export["key"] == export_key:
+                st.caption(f"{export['rows']:,} satır · {export['bytes'] / 1024 ** 2:,.1f} MB")
+                if export["truncated"]:
+                    st.warning(f"Dosya ilk {export['rows']:,} satırla sınırlandı.")
         
         # Display dataframe
-        st.dataframe(orders_df_display, use_container_width=True, height=400)
+        st.dataframe(orders_df, use_container_width=True, height=400)
+        
+        nav1, nav2, nav3 = st.columns([1, 1, 4])
+        with nav1:
+            st.button("◀ Önceki", on_click=move_order_page, args=(-1,), disabled=page == 0)
+        with nav2:
+            st.button("Sonraki ▶", on_click=move_order_page, args=(1,), disabled=next_cursor is None)
+        with nav3:
+            total_items = int(metrics_df['total_items'].iloc[0])
+            st.caption(
+                f"Sayfa {page + 1} · {pager['offsets'][page] + 1:,}–{pager['offsets'][page + 1]:,} "
+                f"/ {total_items:,} sipariş kalemi"
+            )
     else:
         st.warning("Seçilen filtreler için sipariş bulunamadı.")
 
 with tab2:
-    products_query = f"""
-    SELECT
-      product_name,
-      product_code_1,
-      COUNT(DISTINCT order_id) AS unique_orders,
-      COUNT(*) AS total_items_sold,
-      SUM(order_amount) AS total_revenue,
-      AVG(order_amount) AS avg_price
-    FROM `tazecicekdb.order_data.order_items_clean_v3_enriched_partitioned_clustered`
-    WHERE {where_clause}
-      AND product_name IS NOT NULL
-    GROUP BY product_name, product_code_1
-    ORDER BY unique_orders DESC
-    LIMIT 50
-    """
-    products_df = run_query(products_query)
-    products_df['product_name'] = products_df['product_name'].apply(normalize_turkish)
+    products_df = panels["products"]
+    products_df['product_name'] = normalize_series(products_df['product_name'])
     products_df.columns = ['Ürün', 'Kod', 'Sipariş', 'Satılan Adet', 'Gelir', 'Ortalama Fiyat']
     products_df['Gelir'] = products_df['Gelir'].apply(lambda x: f"₺{x:,.2f}")
     products_df['Ortalama Fiyat'] = products_df['Ortalama Fiyat'].apply(lambda x: f"₺{x:,.2f}")
     st.dataframe(products_df, use_container_width=True, height=400)
 
 with tab3:
-    vendor_query = f"""
-    SELECT
-      vendor_id,
-      COUNT(DISTINCT order_id) AS unique_orders,
-      COUNT(*) AS total_items,
-      SUM(order_amount) AS total_revenue,
-      AVG(order_amount) AS avg_order_value
-    FROM `tazecicekdb.order_data.order_items_clean_v3_enriched_partitioned_clustered`
-    WHERE {where_clause}
-      AND vendor_id IS NOT NULL
-    GROUP BY vendor_id
-    ORDER BY unique_orders DESC
-    LIMIT 50
-    """
-    vendor_df = run_query(vendor_query)
+    vendor_df = panels["vendors"]
     vendor_df.columns = ['Vendor ID', 'Sipariş', 'Ürün', 'Gelir', 'Ortalama Sipariş']
     vendor_df['Gelir'] = vendor_df['Gelir'].apply(lambda x: f"₺{x:,.2f}")
     vendor_df['Ortalama Sipariş'] = vendor_df['Ortalama Sipariş'].apply(lambda x: f"₺{x:,.2f}")
@@ -725,6 +800,28 @@ col1, col2, col3 = st.columns(3)
 with col1:
     st.markdown(f"**Son Güncelleme:** {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
 with col2:
-    st.markdown("*BigQuery'den gerçek zamanlı veri*")
+    if use_local:
+        st.markdown("*Yerel önbellekten veri (BigQuery ile senkron)*")
+    else:
+        st.markdown("*BigQuery günlük özet tablolarından veri*" if use_rollups else "*BigQuery'den gerçek zamanlı veri*")
 with col3:
     st.markdown("**Yönetim Dashboard'u v2.0**")
+
+# ============================================
+# PERFORMANCE PANEL
+# ============================================
+if show_perf:
+    records = st.session_state["query_records"]
+    with st.sidebar.expander("🛠️ Sorgu Performansı", expanded=True):
+        st.markdown("**Bu yenileme**")
+        st.dataframe(dashboard_perf.summarize(records), use_container_width=True, hide_index=True)
+        st.caption(
+            f"{len(records)} sorgu · {sum(r['latency_ms'] for r in records):,.0f} ms · "
+            f"{sum(r['bytes_billed'] for r in records) / 1024 ** 2:,.1f} MB faturalanan · "
+            f"{sum(r['memory_bytes'] for r in records) / 1024 ** 2:,.2f} MB bellek "
+            f"(varsayılan tiplerle {sum(r['memory_bytes_before'] for r in records) / 1024 ** 2:,.2f} MB)"
+        )
+        st.markdown("**En yavaş sorgular (tüm oturumlar)**")
+        st.dataframe(dashboard_perf.worst_queries(10, "latency_ms"), use_container_width=True, hide_index=True)
+        st.markdown("**En pahalı sorgular (tüm oturumlar)**")
+        st.dataframe(dashboard_perf.worst_queries(10, "bytes_billed"), use_container_width=True, hide_index=True)
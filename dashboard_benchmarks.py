@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Dashboard benchmarks (offline, no BigQuery).
+
+Usage:
+    python dashboard_benchmarks.py normalize --rows 100000
+"""
+import argparse
+import random
+import time
+
+import pandas as pd
+
+import dashboard_text
+
+# (input, output of the dashboard's row-by-row normalize_turkish before
+# dashboard_text.py), recorded from the old function
+NORMALIZE_CASES = [
+    ("İSTANBUL-AVRUPA", "ISTANBUL-AVRUPA"),
+    ("ISTANBUL-ANADOLU", "ISTANBUL-ANADOLU"),
+    ("İstanbul Avrupa Yakası", "ISTANBUL-AVRUPA"),
+    ("istanbul anadolu", "ISTANBUL-ANADOLU"),
+    ("0STANBUL-AVRUPA", "ISTANBUL-AVRUPA"),
+    ("Ä±stanbul avrupa", "ISTANBUL-AVRUPA"),
+    ("Ã§orum", "A§orum"),
+    ("Ä°zmir", "Izmir"),
+    ("KÄ±rÅŸehir", "KirSŸehir"),
+    ("Ã", "A"),
+    ("Å", "S"),
+    ("ANKARA", "ANKARA"),
+    ("  Kırşehir  ", "Kirsehir"),
+    ("Çanakkale", "Canakkale"),
+    ("Şanlıurfa", "Sanliurfa"),
+    ("Muğla", "Mugla"),
+    ("Gümüşhane", "Gumushane"),
+    ("Kredi Kartı", "Kredi Karti"),
+    ("Kapıda Ödeme", "Kapida Odeme"),
+    ("Havale", "Havale"),
+    ("Teslim Edildi", "Teslim Edildi"),
+    ("Hazırlanıyor", "Hazirlaniyor"),
+    ("İptal", "Iptal"),
+    ("Kırmızı  Gül Buketi", "Kirmizi Gul Buketi"),
+    ("Beyaz Orkide (2 Dallı)", "Beyaz Orkide (2 Dalli)"),
+    ("ÖZEL  ÇİÇEK", "OZEL CICEK"),
+    ("", ""),
+    (None, None),
+]
+CITIES = ["İSTANBUL-AVRUPA", "İSTANBUL-ANADOLU", "ANKARA", "İZMİR", "BURSA", "ANTALYA", "KOCAELİ",
+          "0STANBUL-AVRUPA", "Ã§orum"]
+STATUSES = ["Teslim Edildi", "Yolda", "Hazırlanıyor", "İptal", None]
+PAYMENTS = ["Kredi Kartı", "Havale", "Kapıda Ödeme"]
+
+
+def _best_of(func, repeat: int = 3) -> float:
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def synthetic_frame(count: int, seed: int = 42) -> pd.DataFrame:
+    """Order-list text columns with the value mix of the order table (mojibake and NULLs included)."""
+    rng = random.Random(seed)
+    return pd.DataFrame({
+        "city": [rng.choice(CITIES) for _ in range(count)],
+        "payment_method": [rng.choice(PAYMENTS) for _ in range(count)],
+        "delivery_status": [rng.choice(STATUSES) for _ in range(count)],
+        "product_name": [f"Kırmızı Gül Buketi {rng.randint(1, 500)}" for _ in range(count)],
+    })
+
+
+def check_normalize_cases():
+    """normalize_turkish and normalize_series against NORMALIZE_CASES."""
+    inputs = [value for value, _ in NORMALIZE_CASES]
+    expected = [output for _, output in NORMALIZE_CASES]
+    for value, output in NORMALIZE_CASES:
+        if dashboard_text.normalize_turkish(value) != output:
+            raise SystemExit(f"❌ normalize_turkish({value!r}) differs from the recorded {output!r}")
+    for source in (pd.Series(inputs, dtype=object), pd.Series(inputs, dtype="category")):
+        # Missing values compare equal (a categorical gives NaN back for None)
+        if not dashboard_text.normalize_series(source).equals(pd.Series(expected, dtype=object)):
+            raise SystemExit(f"❌ normalize_series differs from the recorded outputs ({source.dtype})")
+
+
+def bench_normalize(args):
+    """Dashboard text normalization: row-by-row .apply vs once per distinct value."""
+    check_normalize_cases()
+    frame = synthetic_frame(args.rows)
+    categorical = frame.astype("category")
+    columns = list(frame.columns)
+    for column in columns:
+        if not dashboard_text.normalize_series(frame[column]).equals(
+            frame[column].apply(dashboard_text.normalize_turkish).astype(object)
+        ):
+            raise SystemExit(f"❌ normalize_series differs from row-by-row normalize_turkish on {column}")
+
+    def row_by_row():
+        # Every row normalized again, as the dashboard's .apply did before
+        normalize = dashboard_text._normalize_text.__wrapped__
+        return [frame[column].apply(lambda v: v if v is None or pd.isna(v) else normalize(str(v)))
+                for column in columns]
+
+    def vectorized(source, cold):
+        if cold:
+            dashboard_text._normalize_text.cache_clear()
+        return [dashboard_text.normalize_series(source[column]) for column in columns]
+
+    runs = [
+        ("row-by-row .apply", row_by_row),
+        ("unique values, cold", lambda: vectorized(frame, True)),
+        ("unique values, memoized", lambda: vectorized(frame, False)),
+        ("categorical codes", lambda: vectorized(categorical, False)),
+    ]
+    distinct = {column: frame[column].nunique() for column in columns}
+    print(f"\n📊 {len(frame):,} rows x {len(columns)} columns, distinct values: "
+          f"{', '.join(f'{column}={count}' for column, count in distinct.items())} "
+          f"({len(NORMALIZE_CASES)} recorded cases identical ✅)")
+    print(f"{'method':<26}{'seconds':>10}{'speedup':>10}")
+    baseline = None
+    for name, run in runs:
+        seconds = _best_of(run)
+        baseline = baseline or seconds
+        print(f"{name:<26}{seconds:>10.3f}{baseline / seconds:>9.1f}x")
+
+
+BENCHMARKS = {
+    "normalize": bench_normalize,
+}
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description="Dashboard benchmarks")
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS))
+    parser.add_argument("--rows", type=int, default=100_000, help="Synthetic frame size")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = _parse_args()
+    BENCHMARKS[args.benchmark](args)
@@ -0,0 +1,231 @@
+"""
+Local columnar cache of the order-items slice behind the dashboard
+(dashboard_app.py), kept in an embedded DuckDB file.
+
+The cache holds the columns the dashboard reads, one order day at a time.
+A day is loaded from BigQuery once and then answers every filter change
+locally (the dashboard's panel and order-list queries run on DuckDB).
+
+Days stay cached until their data changes. Every CACHE_REFRESH_SECONDS,
+sync() compares the last-modified times of the source table's partitions
+(INFORMATION_SCHEMA.PARTITIONS, delivery-date partitions) with the ones
+seen last time, and drops the cached order days that have rows in the
+changed partitions. The last CACHE_OPEN_DAYS days are dropped on every
+check as well, since streamed rows do not show up in the partition
+metadata right away. Closed days are therefore kept indefinitely and only
+the changed ones are loaded again, in one query.
+"""
+import datetime as dt
+import os
+import threading
+import time
+
+import duckdb
+from google.cloud import bigquery
+
+import order_rollups
+
+SOURCE_TABLE = order_rollups.SOURCE_TABLE
+CACHE_PATH = os.getenv("DASHBOARD_CACHE_PATH", "dashboard_cache.duckdb")
+CACHE_REFRESH_SECONDS = int(os.getenv("DASHBOARD_CACHE_REFRESH_SECONDS", "300"))
+# Days up to today that are re-read on every refresh (rows still streaming in)
+CACHE_OPEN_DAYS = int(os.getenv("DASHBOARD_CACHE_OPEN_DAYS", "2"))
+# Longer date ranges are not cached (the dashboard queries BigQuery for them)
+CACHE_MAX_RANGE_DAYS = int(os.getenv("DASHBOARD_CACHE_MAX_RANGE_DAYS", "400"))
+# Least recently used days beyond this are dropped
+CACHE_MAX_DAYS = int(os.getenv("DASHBOARD_CACHE_MAX_DAYS", "800"))
+
+LOCAL_TABLE = "order_items"
+COLUMNS = [
+    "order_id", "order_created_date_tr", "order_creation_timestamp", "order_delivery_date",
+    "city", "payment_method", "delivery_status", "vendor_id",
+    "product_name", "product_code_1", "order_amount",
+]
+
+
+def covers(start: dt.date, end: dt.date) -> bool:
+    """Whether a date range is served from the cache."""
+    return 0 <= (end - start).days < CACHE_MAX_RANGE_DAYS
+
+
+def _days(start: dt.date, end: dt.date) -> list:
+    return [start + dt.timedelta(days=offset) for offset in range((end - start).days + 1)]
+
+
+class SliceStore:
+    """Order days of the source table cached in a DuckDB file."""
+
+    def __init__(self, path: str = None):
+        self.con = duckdb.connect(path or CACHE_PATH)
+        # EXTRACT(HOUR ...) in BigQuery is UTC
+        self.con.execute("SET TimeZone = 'UTC'")
+        self.con.execute("""
+            CREATE TABLE IF NOT EXISTS cached_days (
+              day DATE PRIMARY KEY, rows BIGINT, fetched_at TIMESTAMP, used_at TIMESTAMP
+            )""")
+        self.con.execute("""
+            CREATE TABLE IF NOT EXISTS source_partitions (
+              partition_id VARCHAR PRIMARY KEY, last_modified TIMESTAMP
+            )""")
+        self.lock = threading.Lock()
+        self.checked_at = None
+        self.stats = {"loaded_days": 0, "loaded_rows": 0, "invalidated_days": 0, "bytes_processed": 0}
+
+    def _table_ready(self) -> bool:
+        return bool(self.con.execute(
+            "SELECT COUNT(*) FROM information_schema.tables WHERE table_name = ?", [LOCAL_TABLE]
+        ).fetchone()[0])
+
+    def _cached_days(self) -> set:
+        return {row[0] for row in self.con.execute("SELECT day FROM cached_days").fetchall()}
+
+    def _drop_days(self, days):
+        days = sorted(days)
+        if not days:
+            return
+        if self._table_ready():
+            self.con.execute(f"DELETE FROM {LOCAL_TABLE} WHERE cache_day IN (SELECT UNNEST(?))", [days])
+        self.con.execute("DELETE FROM cached_days WHERE day IN (SELECT UNNEST(?))", [days])
+
+    def expire(self):
+        """Check for changed partitions on the next sync()."""
+        self.checked_at = None
+
+    def _changed_days(self, client) -> set:
+        """Cached order days with rows in source partitions modified since the last check."""
+        project, dataset, table = SOURCE_TABLE.split(".")
+        job_config = bigquery.QueryJobConfig(query_parameters=[
+            bigquery.ScalarQueryParameter("table", "STRING", table),
+        ])
+        partitions = {
+            row["partition_id"]: row["last_modified_time"]
+            for row in client.query(f"""
+            SELECT partition_id, last_modified_time
+            FROM `{project}.{dataset}.INFORMATION_SCHEMA.PARTITIONS`
+            WHERE table_name = @table
+            """, job_config=job_config).result()
+        }
+        seen = dict(self.con.execute("SELECT partition_id, last_modified FROM source_partitions").fetchall())
+        changed = [
+            partition_id for partition_id, modified in partitions.items()
+            if partition_id not in seen or modified.replace(tzinfo=None) > seen[partition_id]
+        ]
+        self.con.execute("DELETE FROM source_partitions")
+        self.con.executemany(
+            "INSERT INTO source_partitions VALUES (?, ?)",
+            [[partition_id, modified.replace(tzinfo=None)] for partition_id, modified in partitions.items()],
+        )
+
+        cached = self._cached_days()
+        today = dt.date.today()
+        days = {day for day in cached if (today - day).days < CACHE_OPEN_DAYS}
+        dates = [f"{p[:4]}-{p[4:6]}-{p[6:]}" for p in changed if p.isdigit()]
+        null_changed = "__NULL__" in changed
+        if cached and (dates or null_changed):
+            job_config = bigquery.QueryJobConfig(query_parameters=[
+                bigquery.ArrayQueryParameter("dates", "DATE", dates),
+                bigquery.ScalarQueryParameter("null_changed", "BOOL", null_changed),
+            ])
+            job = client.query(f"""
+            SELECT DISTINCT DATE(order_created_date_tr) AS day
+            FROM `{SOURCE_TABLE}`
+            WHERE order_delivery_date IN UNNEST(@dates)
+               OR (@null_changed AND order_delivery_date IS NULL)
+            """, job_config=job_config)
+            days.update(row["day"] for row in job.result() if row["day"] in cached)
+            self.stats["bytes_processed"] += job.total_bytes_processed or 0
+        return days
+
+    def _load_days(self, client, days: list):
+        """Read the given order days from BigQuery in one query and replace them locally."""
+        job_config = bigquery.QueryJobConfig(query_parameters=[
+            bigquery.ArrayQueryParameter("days", "DATE", [day.isoformat() for day in days]),
+        ])
+        job = client.query(f"""
+        SELECT DATE(order_created_date_tr) AS cache_day, {', '.join(COLUMNS)}
+        FROM `{SOURCE_TABLE}`
+        WHERE DATE(order_created_date_tr) IN UNNEST(@days)
+        """, job_config=job_config)
+        rows = job.to_arrow()
+        self.stats["bytes_processed"] += job.total_bytes_processed or 0
+
+        counts = rows.group_by("cache_day").aggregate([("cache_day", "count")])
+        counts = dict(zip(counts["cache_day"].to_pylist(), counts["cache_day_count"].to_pylist()))
+        now = dt.datetime.now()
+        self.con.register("loaded_rows", rows)
+        self.con.execute("BEGIN TRANSACTION")
+        try:
+            if not self._table_ready():
+                self.con.execute(f"CREATE TABLE {LOCAL_TABLE} AS SELECT * FROM loaded_rows WHERE FALSE")
+            self._drop_days(days)
+            self.con.execute(f"INSERT INTO {LOCAL_TABLE} SELECT * FROM loaded_rows")
+            self.con.executemany(
+                "INSERT INTO cached_days VALUES (?, ?, ?, ?)",
+                [[day, counts.get(day, 0), now, now] for day in days],
+            )
+            self.con.execute("COMMIT")
+        except Exception:
+            self.con.execute("ROLLBACK")
+            raise
+        finally:
+            self.con.unregister("loaded_rows")
+        self.stats["loaded_days"] += len(days)
+        self.stats["loaded_rows"] += rows.num_rows
+
+    def _evict(self):
+        overflow = self.con.execute(
+            "SELECT day FROM cached_days ORDER BY used_at DESC, day DESC OFFSET ?", [CACHE_MAX_DAYS]
+        ).fetchall()
+        self._drop_days(row[0] for row in overflow)
+
+    def sync(self, client, start: dt.date, end: dt.date) -> dict:
+        """Make the days [start, end] current in the cache; returns what was done."""
+        with self.lock:
+            started = time.time()
+            stats_before = dict(self.stats)
+            invalidated = set()
+            checked = self.checked_at is None or time.monotonic() - self.checked_at >= CACHE_REFRESH_SECONDS
+            if checked:
+                invalidated = self._changed_days(client)
+                self._drop_days(invalidated)
+                self.stats["invalidated_days"] += len(invalidated)
+                self.checked_at = time.monotonic()
+
+            days = _days(start, end)
+            missing = sorted(set(days) - self._cached_days())
+            if missing:
+                self._load_days(client, missing)
+            self.con.execute(
+                "UPDATE cached_days SET used_at = ? WHERE day BETWEEN ? AND ?", [dt.datetime.now(), start, end]
+            )
+            self._evict()
+            if invalidated or missing:
+                print(f"🗄️ Dashboard cache: {len(invalidated):,} changed days dropped, {len(missing):,} days "
+                      f"loaded ({time.time() - started:.1f}s)")
+            return {
+                "checked": checked,
+                "invalidated_days": len(invalidated),
+                "loaded_days": len(missing),
+                "loaded_rows": self.stats["loaded_rows"] - stats_before["loaded_rows"],
+                "bytes_processed": self.stats["bytes_processed"] - stats_before["bytes_processed"],
+            }
+
+    def iter_batches(self, sql: str, batch_rows: int):
+        """Arrow record batches of a DuckDB query on the cached rows, read lazily."""
+        with self.lock:
+            cursor = self.con.cursor()
+            reader = cursor.execute(sql).fetch_record_batch(batch_rows)
+        try:
+            yield from reader
+        finally:
+            cursor.close()
+
+    def query_arrow(self, sql: str):
+        """Run a DuckDB query on the cached rows; returns an Arrow table."""
+        with self.lock:
+            return self.con.execute(sql).fetch_arrow_table()
+
+    def query(self, sql: str):
+        """Run a DuckDB query on the cached rows (table LOCAL_TABLE, after sync()); returns a DataFrame."""
+        with self.lock:
+            return self.con.execute(sql).df()
@@ -0,0 +1,223 @@
+"""
+Streaming export of the dashboard order list (dashboard_app.py).
+
+The rows of an export are read page by page (BigQuery result pages or
+DuckDB record batches from the local cache), normalized, and appended to a
+temporary file, so memory stays bounded by EXPORT_PAGE_ROWS whatever the
+export size:
+
+- xlsx: XlsxWriter in constant_memory mode (rows are flushed as written)
+- csv: UTF-8 with BOM, so Excel reads the Turkish characters
+- parquet: one row group per page
+
+Writing is bounded; serving is not. st.download_button reads the finished
+file into Streamlit's in-memory media store, so a prepared export occupies
+its full file size (st.caption next to the button) in server memory until
+the session reruns without it. EXPORT_MAX_ROWS is the limit that bounds it.
+"""
+import os
+import tempfile
+import time
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+import xlsxwriter
+
+from dashboard_text import normalize_series
+
+EXPORT_PAGE_ROWS = int(os.getenv("DASHBOARD_EXPORT_PAGE_ROWS", "20000"))
+EXPORT_MAX_ROWS = int(os.getenv("DASHBOARD_EXPORT_MAX_ROWS", "1000000"))
+# Export files older than this are removed (sessions that never downloaded)
+EXPORT_FILE_TTL_SECONDS = 3600
+EXPORT_FILE_PREFIX = "siparisler_"
+# Excel sheets end at 1,048,576 rows (one is the header)
+XLSX_MAX_ROWS = 1_048_575
+
+FORMATS = {
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+}
+ORDER_COLUMN_LABELS = {
+    'order_id': 'Sipariş ID',
+    'tarih': 'Tarih',
+    'sehir': 'Şehir',
+    'odeme_yontemi': 'Ödeme Yöntemi',
+    'teslimat_durumu': 'Teslimat Durumu',
+    'vendor_id': 'Vendor ID',
+    'urun_adi': 'Ürün Adı',
+    'urun_kodu': 'Ürün Kodu',
+    'siparis_tutari': 'Sipariş Tutarı',
+    'siparis_zamani': 'Sipariş Zamanı',
+}
+TEXT_COLUMNS = ['sehir', 'odeme_yontemi', 'teslimat_durumu', 'urun_adi']
+
+
+def max_rows(fmt: str) -> int:
+    return min(EXPORT_MAX_ROWS, XLSX_MAX_ROWS) if fmt == "xlsx" else EXPORT_MAX_ROWS
+
+
+def bigquery_pages(client, query: str, page_rows: int = None):
+    """(job, iterator of Arrow record batches) of a query, fetched page by page."""
+    job = client.query(query)
+    rows = job.result(page_size=page_rows or EXPORT_PAGE_ROWS)
+    return job, rows.to_arrow_iterable()
+
+
+def prepare_page(page) -> pa.Table:
+    """Normalized text, time zones dropped (Excel has none), display column names."""
+    table = pa.Table.from_batches([page]) if isinstance(page, pa.RecordBatch) else page
+    columns = []
+    for name, column in zip(table.column_names, table.columns):
+        if name in TEXT_COLUMNS:
+            column = pa.array(normalize_series(column.to_pandas()), type=pa.string())
+        elif pa.types.is_timestamp(column.type) and column.type.tz is not None:
+            column = column.cast(pa.timestamp(column.type.unit))
+        columns.append(column)
+    return pa.table(columns, names=[ORDER_COLUMN_LABELS.get(name, name) for name in table.column_names])
+
+
+# Excel serial day numbers count from 1899-12-30
+EXCEL_EPOCH_OFFSET_DAYS = 25569
+
+
+def _excel_values(column) -> list:
+    """Cell values of a column as Python numbers/strings; dates become Excel serial numbers."""
+    if pa.types.is_date(column.type) or pa.types.is_timestamp(column.type):
+        micros = column.cast(pa.timestamp("us")).cast(pa.int64())
+        return pc.add(pc.divide(micros.cast(pa.float64()), 86_400_000_000.0), EXCEL_EPOCH_OFFSET_DAYS).to_pylist()
+    if pa.types.is_decimal(column.type):
+        return column.cast(pa.float64()).to_pylist()
+    if pa.types.is_integer(column.type) or pa.types.is_floating(column.type) or pa.types.is_boolean(column.type):
+        return column.to_pylist()
+    return column.cast(pa.string()).to_pylist()
+
+
+class _XlsxSink:
+    def __init__(self, path: str):
+        self.workbook = xlsxwriter.Workbook(path, {"constant_memory": True, "strings_to_urls": False})
+        self.sheet = self.workbook.add_worksheet("Siparişler")
+        self.header = self.workbook.add_format({"bold": True})
+        self.formats = {
+            "date": self.workbook.add_format({"num_format": "yyyy-mm-dd"}),
+            "timestamp": self.workbook.add_format({"num_format": "yyyy-mm-dd hh:mm:ss"}),
+        }
+        self.row = 0
+
+    def _writers(self, table: pa.Table) -> list:
+        """One typed cell writer per column (skips XlsxWriter's per-cell type dispatch)."""
+        sheet = self.sheet
+        writers = []
+        for column in table.columns:
+            if pa.types.is_date(column.type) or pa.types.is_timestamp(column.type):
+                cell_format = self.formats["date" if pa.types.is_date(column.type) else "timestamp"]
+                writers.append(lambda row, col, value, cell_format=cell_format:
+                               sheet.write_number(row, col, value, cell_format))
+            elif pa.types.is_boolean(column.type):
+                writers.append(sheet.write_boolean)
+            elif (pa.types.is_integer(column.type) or pa.types.is_floating(column.type)
+                  or pa.types.is_decimal(column.type)):
+                writers.append(sheet.write_number)
+            else:
+                writers.append(sheet.write_string)
+        return writers
+
+    def write(self, table: pa.Table):
+        if self.row == 0:
+            self.sheet.write_row(0, 0, table.column_names, self.header)
+            self.sheet.set_column(0, len(table.column_names) - 1, 18)
+            self.row = 1
+        writers = self._writers(table)
+        for values in zip(*(_excel_values(column) for column in table.columns)):
+            for col, (writer, value) in enumerate(zip(writers, values)):
+                if value is not None:
+                    writer(self.row, col, value)
+            self.row += 1
+
+    def close(self):
+        self.workbook.close()
+
+
+class _CsvSink:
+    def __init__(self, path: str):
+        self.file = open(path, "wb")
+        self.file.write(b"\xef\xbb\xbf")
+        self.writer = None
+        self.schema = None
+
+    def write(self, table: pa.Table):
+        if self.writer is None:
+            self.schema = table.schema
+            self.writer = pa_csv.CSVWriter(self.file, self.schema)
+        self.writer.write_table(table.cast(self.schema))
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.file.close()
+
+
+class _ParquetSink:
+    def __init__(self, path: str):
+        self.path = path
+        self.writer = None
+
+    def write(self, table: pa.Table):
+        if self.writer is None:
+            self.writer = pq.ParquetWriter(self.path, table.schema, compression="zstd")
+        self.writer.write_table(table.cast(self.writer.schema))
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        else:
+            pq.write_table(pa.table({}), self.path)
+
+
+SINKS = {"xlsx": _XlsxSink, "csv": _CsvSink, "parquet": _ParquetSink}
+
+
+def _remove_stale_exports():
+    directory = tempfile.gettempdir()
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        try:
+            if name.startswith(EXPORT_FILE_PREFIX) and time.time() - os.path.getmtime(path) > EXPORT_FILE_TTL_SECONDS:
+                os.remove(path)
+        except OSError:
+            pass
+
+
+def write_export(pages, fmt: str, limit: int = None) -> dict:
+    """
+    Write record batches / tables to a temporary file in the given format.
+
+    Stops after `limit` rows (default: max_rows(fmt)); query one row more
+    than that to learn whether the export was cut. Returns the file path,
+    row count and the truncated flag; the caller deletes the file.
+    """
+    limit = limit or max_rows(fmt)
+    _remove_stale_exports()
+    handle, path = tempfile.mkstemp(prefix=EXPORT_FILE_PREFIX, suffix=f".{fmt}")
+    os.close(handle)
+    sink = SINKS[fmt](path)
+    rows = 0
+    truncated = False
+    try:
+        for page in pages:
+            if rows + page.num_rows > limit:
+                page = page.slice(0, limit - rows)
+                truncated = True
+            if page.num_rows:
+                sink.write(prepare_page(page))
+                rows += page.num_rows
+            if truncated:
+                break
+    except Exception:
+        sink.close()
+        os.remove(path)
+        raise
+    sink.close()
+    return {"path": path, "rows": rows, "truncated": truncated, "bytes": os.path.getsize(path)}
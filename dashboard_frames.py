@@ -0,0 +1,77 @@
+"""
+Compact DataFrames of dashboard query results (dashboard_app.py).
+
+Query results are read as Arrow tables (BigQuery's columnar download, or
+DuckDB's Arrow output for the local cache) and converted column by column
+to the smallest pandas dtype that keeps the values:
+
+- city, payment method and delivery status: categoricals
+- integers: nullable Int32 when the values fit, nullable Int64 otherwise
+- floats and NUMERIC: float32 when every value survives the round trip
+  within FLOAT32_TOLERANCE, float64 otherwise
+- dates: datetime64 instead of Python date objects
+
+These frames are what Streamlit pickles into its cache, so they are
+smaller there as well. memory_stats() reports the frame size next to the
+size of the same result with to_dataframe()'s default dtypes.
+"""
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+# Low-cardinality text columns, by source and order-list names
+CATEGORY_COLUMNS = {
+    "city", "payment_method", "delivery_status",
+    "sehir", "odeme_yontemi", "teslimat_durumu",
+}
+# Largest change float32 may make to an amount (half a kuruş)
+FLOAT32_TOLERANCE = 0.005
+INT32_MIN, INT32_MAX = np.iinfo(np.int32).min, np.iinfo(np.int32).max
+
+
+def _nullable(arrow_type):
+    if pa.types.is_integer(arrow_type):
+        return pd.Int64Dtype()
+    if pa.types.is_boolean(arrow_type):
+        return pd.BooleanDtype()
+    return None
+
+
+def _decimals_as_float(table: pa.Table) -> pa.Table:
+    for index, field in enumerate(table.schema):
+        if pa.types.is_decimal(field.type):
+            table = table.set_column(index, field.name, table.column(index).cast(pa.float64()))
+    return table
+
+
+def _float32_ok(values: pd.Series) -> bool:
+    values = values.to_numpy()
+    with np.errstate(invalid="ignore", over="ignore"):
+        error = np.abs(values.astype(np.float32).astype(np.float64) - values)
+    # NaN stays NaN; too large values become inf and fail the check
+    return not np.any(error > FLOAT32_TOLERANCE)
+
+
+def compact_frame(table: pa.Table) -> pd.DataFrame:
+    """DataFrame of an Arrow result with compact dtypes."""
+    frame = _decimals_as_float(table).to_pandas(types_mapper=_nullable, date_as_object=False)
+    for name in frame.columns:
+        values = frame[name]
+        if name in CATEGORY_COLUMNS and pd.api.types.is_string_dtype(values.dtype):
+            frame[name] = values.astype("category")
+        elif isinstance(values.dtype, pd.Int64Dtype):
+            if values.isna().all() or (values.min() >= INT32_MIN and values.max() <= INT32_MAX):
+                frame[name] = values.astype("Int32")
+        elif values.dtype == np.float64 and _float32_ok(values):
+            frame[name] = values.astype(np.float32)
+    return frame
+
+
+def frame_bytes(frame: pd.DataFrame) -> int:
+    return int(frame.memory_usage(deep=True).sum())
+
+
+def memory_stats(table: pa.Table, frame: pd.DataFrame) -> dict:
+    """Size of the compact frame and of the same result with to_dataframe()'s default dtypes."""
+    default = table.to_pandas(types_mapper=_nullable)
+    return {"memory_bytes": frame_bytes(frame), "memory_bytes_before": frame_bytes(default)}
@@ -0,0 +1,136 @@
+"""
+Query performance records of the dashboard (dashboard_app.py).
+
+Every dashboard query is recorded with its panel, latency, bytes processed
+and billed, where it was answered from and its row count:
+
+- cache "streamlit": st.cache_data result, no query ran
+- cache "bigquery": BigQuery served the job from its result cache
+- cache "local": answered by the local DuckDB cache (dashboard_cache.py)
+- cache "miss": a BigQuery job ran
+- cache "prefetch": an order-list page fetched in the background before it was shown
+
+The records of the current rerun feed the sidebar performance panel. All
+records are also appended to a rolling JSONL log (PERF_LOG_PATH, last
+PERF_LOG_MAX_ENTRIES entries kept), which worst_queries() reads to find the
+slowest and most expensive queries across sessions. Records of DataFrame
+results also carry the frame's memory size, and its size with
+to_dataframe()'s default dtypes (see dashboard_frames.py).
+"""
+import datetime as dt
+import hashlib
+import json
+import os
+import threading
+
+import pandas as pd
+
+PERF_LOG_PATH = os.getenv("DASHBOARD_PERF_LOG", "dashboard_perf_log.jsonl")
+PERF_LOG_MAX_ENTRIES = int(os.getenv("DASHBOARD_PERF_LOG_MAX_ENTRIES", "20000"))
+# Stored query text is cut to this many characters
+QUERY_TEXT_CHARS = 500
+
+_log_lock = threading.Lock()
+_appended = 0
+
+
+def query_hash(query: str) -> str:
+    return hashlib.sha1(" ".join(query.split()).encode("utf-8")).hexdigest()[:12]
+
+
+def job_stats(job) -> dict:
+    """The cost fields of a finished BigQuery job."""
+    return {
+        "bytes_processed": job.total_bytes_processed or 0,
+        "bytes_billed": job.total_bytes_billed or 0,
+        "cache": "bigquery" if job.cache_hit else "miss",
+    }
+
+
+def make_record(panel: str, query: str, latency_ms: float, rows: int, cache: str,
+                bytes_processed: int = 0, bytes_billed: int = 0, memory_bytes: int = 0,
+                memory_bytes_before: int = 0) -> dict:
+    return {
+        "ts": dt.datetime.now(dt.timezone.utc).isoformat(timespec="seconds"),
+        "panel": panel,
+        "latency_ms": round(latency_ms, 1),
+        "bytes_processed": int(bytes_processed or 0),
+        "bytes_billed": int(bytes_billed or 0),
+        "cache": cache,
+        "rows": int(rows),
+        "memory_bytes": int(memory_bytes or 0),
+        "memory_bytes_before": int(memory_bytes_before or 0),
+        "query_hash": query_hash(query),
+        "query": " ".join(query.split())[:QUERY_TEXT_CHARS],
+    }
+
+
+def _trim_log():
+    with open(PERF_LOG_PATH, "r", encoding="utf-8") as f:
+        lines = f.readlines()
+    if len(lines) <= PERF_LOG_MAX_ENTRIES:
+        return
+    tmp_path = f"{PERF_LOG_PATH}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.writelines(lines[-PERF_LOG_MAX_ENTRIES:])
+    os.replace(tmp_path, PERF_LOG_PATH)
+
+
+def append_log(record: dict):
+    """Append one record to the rolling log (never raises)."""
+    global _appended
+    try:
+        with _log_lock:
+            with open(PERF_LOG_PATH, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            _appended += 1
+            # Trim now and then instead of on every append
+            if _appended % 500 == 0:
+                _trim_log()
+    except Exception as e:
+        print(f"⚠️ Warning: Could not write the dashboard perf log: {e}")
+
+
+def load_log() -> pd.DataFrame:
+    try:
+        with _log_lock:
+            return pd.read_json(PERF_LOG_PATH, lines=True)
+    except Exception:
+        return pd.DataFrame()
+
+
+def summarize(records: list) -> pd.DataFrame:
+    """One row per query of a rerun, for the sidebar panel."""
+    if not records:
+        return pd.DataFrame()
+    frame = pd.DataFrame(records)
+    return pd.DataFrame({
+        "Panel": frame["panel"],
+        "Süre (ms)": frame["latency_ms"],
+        "İşlenen MB": (frame["bytes_processed"] / 1024 ** 2).round(1),
+        "Faturalanan MB": (frame["bytes_billed"] / 1024 ** 2).round(1),
+        "Önbellek": frame["cache"],
+        "Satır": frame["rows"],
+        "Bellek KB": (frame["memory_bytes"] / 1024).round(1),
+        "Varsayılan KB": (frame["memory_bytes_before"] / 1024).round(1),
+    })
+
+
+def worst_queries(limit: int = 10, by: str = "latency_ms") -> pd.DataFrame:
+    """Queries of the log that actually ran, grouped by query text, worst first."""
+    log = load_log()
+    if log.empty:
+        return log
+    ran = log[log["cache"] != "streamlit"]
+    if ran.empty:
+        return ran
+    grouped = ran.groupby("query_hash").agg(
+        panel=("panel", "last"),
+        runs=("ts", "count"),
+        latency_ms=("latency_ms", "max"),
+        avg_latency_ms=("latency_ms", "mean"),
+        bytes_billed=("bytes_billed", "sum"),
+        last_run=("ts", "max"),
+        query=("query", "last"),
+    )
+    return grouped.sort_values(by, ascending=False).head(limit).reset_index()
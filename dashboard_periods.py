@@ -0,0 +1,171 @@
+"""
+Period-over-period comparison of the dashboard (dashboard_app.py).
+
+Every comparison (previous period, previous year, previous month, rolling
+windows) is computed from daily totals (distinct orders, revenue) of the
+current filters. Orders belong to a single day, so the totals of any
+period are sums of its days.
+
+PeriodStore keeps the daily totals per canonical filter state (selected
+cities and payment methods, sorted). When comparison mode is on, the days
+of every comparison type are requested together, and the missing ones are
+read in one query, so switching the comparison type reads nothing. Closed
+days (older than PERIOD_OPEN_DAYS) are kept until the dashboard is
+refreshed, since their data does not change; open days are read again
+after PERIOD_OPEN_TTL_SECONDS.
+"""
+import datetime as dt
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+
+import order_rollups
+
+SOURCE_TABLE = order_rollups.SOURCE_TABLE
+# Days up to today whose totals may still change
+PERIOD_OPEN_DAYS = int(os.getenv("DASHBOARD_PERIOD_OPEN_DAYS", "2"))
+PERIOD_OPEN_TTL_SECONDS = int(os.getenv("DASHBOARD_PERIOD_OPEN_TTL_SECONDS", "300"))
+# Least recently used filter states beyond this are dropped
+PERIOD_MAX_STATES = int(os.getenv("DASHBOARD_PERIOD_MAX_STATES", "200"))
+
+ROLLING_WINDOWS = {"Hareketli 7 Gün": 7, "Hareketli 28 Gün": 28}
+COMPARISONS = ["Önceki Dönem", "Önceki Yıl", "Önceki Ay", *ROLLING_WINDOWS]
+
+
+def _shift_months(day: dt.date, months: int) -> dt.date:
+    # Month ends are clamped (Mar 31 -> Feb 28/29)
+    return (pd.Timestamp(day) + pd.DateOffset(months=months)).date()
+
+
+def periods(start: dt.date, end: dt.date, comparison: str) -> tuple:
+    """(current, previous) date ranges of a comparison type."""
+    if comparison in ROLLING_WINDOWS:
+        # The last N days of the range against the N days before them
+        days = ROLLING_WINDOWS[comparison]
+        current = (end - dt.timedelta(days=days - 1), end)
+        return current, (current[0] - dt.timedelta(days=days), current[0] - dt.timedelta(days=1))
+    if comparison == "Önceki Yıl":
+        return (start, end), (_shift_months(start, -12), _shift_months(end, -12))
+    if comparison == "Önceki Ay":
+        return (start, end), (_shift_months(start, -1), _shift_months(end, -1))
+    length = (end - start).days + 1
+    return (start, end), (start - dt.timedelta(days=length), start - dt.timedelta(days=1))
+
+
+def all_periods(start: dt.date, end: dt.date) -> list:
+    """Date ranges of every comparison type, to be read together."""
+    return [period for comparison in COMPARISONS for period in periods(start, end, comparison)]
+
+
+def filter_state(cities, payment_methods, approximate: bool) -> tuple:
+    """Canonical cache key of the non-date filters (HLL totals kept apart from exact ones)."""
+    return tuple(sorted(set(cities))), tuple(sorted(set(payment_methods))), approximate
+
+
+def _runs(days: list) -> list:
+    """Consecutive days as (first, last) ranges."""
+    runs = []
+    for day in sorted(days):
+        if runs and day - runs[-1][1] == dt.timedelta(days=1):
+            runs[-1][1] = day
+        else:
+            runs.append([day, day])
+    return [tuple(run) for run in runs]
+
+
+def build_daily_query(filter_where: str, ranges: list, use_rollups: bool = False,
+                      local_table: str = None) -> str:
+    """Distinct orders and revenue per day of the given date ranges, in one query."""
+    if use_rollups and not local_table:
+        day = "order_date"
+        measures = "HLL_COUNT.MERGE(orders_sketch) AS orders, SUM(revenue) AS revenue"
+        table = f"`{order_rollups.rollup_table('orders')}`"
+    else:
+        day = "CAST(order_created_date_tr AS DATE)" if local_table else "DATE(order_created_date_tr)"
+        measures = "COUNT(DISTINCT order_id) AS orders, SUM(order_amount) AS revenue"
+        table = local_table or f"`{SOURCE_TABLE}`"
+    days = " OR ".join(f"{day} BETWEEN '{first}' AND '{last}'" for first, last in ranges)
+    return f"""
+    SELECT {day} AS day, {measures}
+    FROM {table}
+    WHERE ({days})
+      AND {filter_where}
+    GROUP BY day
+    """
+
+
+def totals(daily: pd.DataFrame, period: tuple) -> dict:
+    """Distinct orders and revenue of a date range from the daily totals."""
+    rows = daily[(daily["day"] >= period[0]) & (daily["day"] <= period[1])]
+    return {"orders": int(rows["orders"].sum()), "revenue": float(rows["revenue"].sum())}
+
+
+def growth(current: dict, previous: dict) -> tuple:
+    """(order growth %, revenue growth %), None where the previous period is empty."""
+    orders = (current["orders"] - previous["orders"]) / previous["orders"] * 100 if previous["orders"] else None
+    revenue = (
+        (current["revenue"] - previous["revenue"]) / previous["revenue"] * 100 if previous["revenue"] else None
+    )
+    return orders, revenue
+
+
+class PeriodStore:
+    """Daily totals per filter state; closed days are kept until clear()."""
+
+    def __init__(self):
+        self.states = OrderedDict()
+        self.lock = threading.Lock()
+
+    def clear(self):
+        with self.lock:
+            self.states.clear()
+
+    def missing_ranges(self, state: tuple, ranges: list) -> list:
+        """The parts of the ranges that have to be read (not cached, or open and stale)."""
+        with self.lock:
+            days = self.states.get(state, {})
+            now = time.monotonic()
+            needed = {first + dt.timedelta(days=offset)
+                      for first, last in ranges for offset in range((last - first).days + 1)}
+            return _runs([
+                day for day in needed
+                if day not in days or (days[day][2] is not None and days[day][2] < now)
+            ])
+
+    def daily(self, state: tuple, ranges: list, fetch) -> pd.DataFrame:
+        """
+        Daily totals (day, orders, revenue) of the ranges.
+
+        fetch(missing ranges) returns a frame of the days it read (days
+        without orders may be absent); it is only called when days are
+        missing.
+        """
+        missing = self.missing_ranges(state, ranges)
+        fetched = fetch(missing) if missing else None
+        with self.lock:
+            days = self.states.setdefault(state, {})
+            self.states.move_to_end(state)
+            while len(self.states) > PERIOD_MAX_STATES:
+                self.states.popitem(last=False)
+            if fetched is not None:
+                read = {
+                    pd.Timestamp(day).date(): (int(orders) if pd.notna(orders) else 0,
+                                               float(revenue) if pd.notna(revenue) else 0.0)
+                    for day, orders, revenue in zip(fetched["day"], fetched["orders"], fetched["revenue"])
+                }
+                today = dt.date.today()
+                expires = time.monotonic() + PERIOD_OPEN_TTL_SECONDS
+                for first, last in missing:
+                    for offset in range((last - first).days + 1):
+                        day = first + dt.timedelta(days=offset)
+                        orders, revenue = read.get(day, (0, 0.0))
+                        closed = (today - day).days >= PERIOD_OPEN_DAYS
+                        days[day] = (orders, revenue, None if closed else expires)
+            rows = [
+                (day, *days[day][:2]) for day in sorted(days)
+                if any(first <= day <= last for first, last in ranges)
+            ]
+        return pd.DataFrame(rows, columns=["day", "orders", "revenue"])
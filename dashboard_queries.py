@@ -0,0 +1,270 @@
+"""
+Query planner of the executive dashboard (dashboard_app.py).
+
+All aggregate panels (metrics, daily trend, heatmap, cities, payment,
+delivery status, products, vendors) are answered by one BigQuery job per
+filter state: a GROUPING SETS query returns one compact frame with a row
+per (grouping set, key), and split_panels() cuts it into the frames the
+panels draw. The order-items rows of the date range are scanned once
+instead of once per panel.
+
+With the daily rollups (order_rollups.py) the same frame comes from the
+rollup tables: GROUPING SETS over daily_order_rollup, plus the vendor and
+product rollups in the same job. With the local slice cache
+(dashboard_cache.py) the query runs on DuckDB instead of BigQuery.
+"""
+import numpy as np
+import pandas as pd
+
+import order_rollups
+
+SOURCE_TABLE = order_rollups.SOURCE_TABLE
+
+# (grouping set name, grouped columns); one set per panel, () = totals
+GROUPING_SETS = [
+    ("date", ["order_date"]),
+    ("heatmap", ["day_of_week", "hour"]),
+    ("city", ["city"]),
+    ("payment", ["payment_method"]),
+    ("delivery", ["delivery_status"]),
+    ("vendor", ["vendor_id"]),
+    ("product", ["product_name", "product_code_1"]),
+    ("total", []),
+]
+KEY_COLUMNS = [
+    "order_date", "day_of_week", "hour", "city", "payment_method",
+    "delivery_status", "vendor_id", "product_name", "product_code_1",
+]
+MEASURE_COLUMNS = ["unique_orders", "items", "revenue", "amount_items"]
+
+
+def _grouping_sql(sets: list, measures: str, source: str) -> str:
+    """GROUPING SETS over `source`, labelled with the set name in grouping_set."""
+    label = "\n".join(
+        f"    WHEN GROUPING({columns[0]}) = 0 THEN '{name}'" for name, columns in sets if columns
+    )
+    grouping_sets = ", ".join(f"({', '.join(columns)})" for _, columns in sets)
+    grouped = {column for _, columns in sets for column in columns}
+    keys = ",\n  ".join(column if column in grouped else f"NULL AS {column}" for column in KEY_COLUMNS)
+    return f"""
+SELECT
+  CASE
+{label}
+    ELSE 'total'
+  END AS grouping_set,
+  {keys},
+  {measures}
+FROM ({source})
+GROUP BY GROUPING SETS ({grouping_sets})"""
+
+
+def build_panel_query(where_clause: str, rollup_where: str = None, use_rollups: bool = False,
+                      local_table: str = None) -> str:
+    """
+    The one query behind all aggregate panels for a filter state.
+
+    local_table: DuckDB table of the local slice cache to query instead of
+    BigQuery (same columns as the source table).
+    """
+    if local_table:
+        # DuckDB: dayofweek() is 0 = Sunday, BigQuery DAYOFWEEK is 1 = Sunday
+        dates = """CAST(order_created_date_tr AS DATE) AS order_date,
+    dayofweek(order_created_date_tr) + 1 AS day_of_week,
+    hour(order_creation_timestamp) AS hour"""
+        table = local_table
+    else:
+        dates = """DATE(order_created_date_tr) AS order_date,
+    EXTRACT(DAYOFWEEK FROM order_created_date_tr) AS day_of_week,
+    EXTRACT(HOUR FROM order_creation_timestamp) AS hour"""
+        table = f"`{SOURCE_TABLE}`"
+    if local_table or not use_rollups:
+        source = f"""
+  SELECT
+    {dates},
+    city, payment_method, delivery_status, vendor_id, product_name, product_code_1,
+    order_id, order_amount
+  FROM {table}
+  WHERE {where_clause}
+    AND order_created_date_tr IS NOT NULL"""
+        measures = """COUNT(DISTINCT order_id) AS unique_orders,
+  COUNT(*) AS items,
+  SUM(order_amount) AS revenue,
+  COUNT(order_amount) AS amount_items"""
+        return _grouping_sql(GROUPING_SETS, measures, source)
+
+    measures = """HLL_COUNT.MERGE(orders_sketch) AS unique_orders,
+  SUM(items) AS items,
+  SUM(revenue) AS revenue,
+  SUM(amount_items) AS amount_items"""
+    rollup_sets = {name: columns for name, columns in GROUPING_SETS}
+    order_source = f"""
+  SELECT
+    order_date, EXTRACT(DAYOFWEEK FROM order_date) AS day_of_week, order_hour AS hour,
+    city, payment_method, delivery_status, orders_sketch, items, revenue, amount_items
+  FROM `{order_rollups.rollup_table("orders")}`
+  WHERE {rollup_where}"""
+    parts = [_grouping_sql(
+        [(name, columns) for name, columns in GROUPING_SETS if name not in ("vendor", "product")],
+        measures, order_source,
+    )]
+    for name, rollup in (("vendor", "vendors"), ("product", "products")):
+        columns = rollup_sets[name]
+        source = f"""
+  SELECT {', '.join(columns)}, orders_sketch, items, revenue, amount_items
+  FROM `{order_rollups.rollup_table(rollup)}`
+  WHERE {rollup_where}"""
+        parts.append(_grouping_sql([(name, columns)], measures, source))
+    return "\nUNION ALL\n".join(parts)
+
+
+def _average(frame: pd.DataFrame) -> pd.Series:
+    # float64 whatever the result dtypes (float32 revenue, nullable counts)
+    amount_items = frame["amount_items"].astype("float64")
+    return frame["revenue"].astype("float64") / amount_items.where(amount_items > 0)
+
+
+def _count(value) -> int:
+    return 0 if pd.isna(value) else int(value)
+
+
+def _top(frame: pd.DataFrame, key: list, limit: int = None) -> pd.DataFrame:
+    # Ties broken by key, so a top-N cut is the same on every run
+    frame = frame.dropna(subset=key[:1]).sort_values(
+        ["unique_orders"] + key, ascending=[False] + [True] * len(key), kind="stable"
+    )
+    return frame.head(limit) if limit else frame
+
+
+def split_panels(frame: pd.DataFrame) -> dict:
+    """Panel frames (same columns the per-panel queries returned) from the planner frame."""
+    sets = {name: part for name, part in frame.groupby("grouping_set", sort=False)}
+
+    def part(name: str) -> pd.DataFrame:
+        return sets.get(name, frame.iloc[0:0]).reset_index(drop=True)
+
+    total = part("total")
+    if total.empty:
+        total = pd.DataFrame([{"unique_orders": 0, "items": 0, "revenue": None, "amount_items": 0}])
+    total = total.iloc[0]
+    revenue = np.nan if pd.isna(total["revenue"]) else float(total["revenue"])
+    metrics = pd.DataFrame([{
+        "total_orders": _count(total["unique_orders"]),
+        "total_items": _count(total["items"]),
+        "total_revenue": revenue,
+        "avg_order_value": revenue / _count(total["amount_items"]) if _count(total["amount_items"]) else None,
+        "active_days": int(part("date")["order_date"].notna().sum()),
+        "unique_cities": int(part("city")["city"].notna().sum()),
+        "unique_vendors": int(part("vendor")["vendor_id"].notna().sum()),
+    }])
+
+    daily = part("date").dropna(subset=["order_date"])
+    daily = pd.DataFrame({
+        "date": daily["order_date"],
+        "unique_orders": daily["unique_orders"],
+        "total_revenue": daily["revenue"],
+        "avg_order_value": _average(daily),
+    }).sort_values("date", ascending=False).head(90)
+
+    heatmap = part("heatmap").dropna(subset=["day_of_week", "hour"])
+    heatmap = pd.DataFrame({
+        "day_of_week": heatmap["day_of_week"].astype(int),
+        "hour": heatmap["hour"].astype(int),
+        "unique_orders": heatmap["unique_orders"],
+    }).sort_values(["day_of_week", "hour"]).reset_index(drop=True)
+
+    city = _top(part("city"), ["city"], 10)
+    payment = _top(part("payment"), ["payment_method"])
+    delivery = _top(part("delivery"), ["delivery_status"])
+    products = _top(part("product"), ["product_name", "product_code_1"], 50)
+    vendors = _top(part("vendor"), ["vendor_id"], 50)
+
+    return {
+        "metrics": metrics,
+        "daily": daily.reset_index(drop=True),
+        "heatmap": heatmap,
+        "city": city[["city", "unique_orders", "revenue"]]
+        .rename(columns={"revenue": "total_revenue"}).reset_index(drop=True),
+        "payment": payment[["payment_method", "unique_orders", "revenue"]]
+        .rename(columns={"revenue": "total_revenue"}).reset_index(drop=True),
+        "delivery": delivery[["delivery_status", "unique_orders"]].reset_index(drop=True),
+        "products": pd.DataFrame({
+            "product_name": products["product_name"],
+            "product_code_1": products["product_code_1"],
+            "unique_orders": products["unique_orders"],
+            "total_items_sold": products["items"],
+            "total_revenue": products["revenue"],
+            "avg_price": _average(products),
+        }).reset_index(drop=True),
+        "vendors": pd.DataFrame({
+            "vendor_id": vendors["vendor_id"],
+            "unique_orders": vendors["unique_orders"],
+            "total_items": vendors["items"],
+            "total_revenue": vendors["revenue"],
+            "avg_order_value": _average(vendors),
+        }).reset_index(drop=True),
+    }
+
+
+def _literal(value) -> str:
+    """SQL literal of a cursor value (same text for BigQuery and DuckDB)."""
+    if isinstance(value, (int, float, np.integer, np.floating)) and not isinstance(value, bool):
+        return str(value)
+    if isinstance(value, pd.Timestamp) or hasattr(value, "isoformat"):
+        value = pd.Timestamp(value)
+        return f"'{value.date().isoformat() if value == value.normalize() else value.isoformat(sep=' ')}'"
+    return f"'{value}'"
+
+
+def build_orders_query(where_clause: str, table: str, limit: int = None, after: tuple = None,
+                       order: tuple = None) -> str:
+    """
+    Order-item rows of the order list and its exports, newest first.
+
+    after: (order_created_date_tr, order_id) cursor; only rows after it in
+    list order. order: the same pair; only the rows of that order.
+    """
+    if after is not None:
+        date, order_id = map(_literal, after)
+        where_clause = (f"{where_clause} AND (order_created_date_tr < {date} "
+                        f"OR (order_created_date_tr = {date} AND order_id > {order_id}))")
+    if order is not None:
+        date, order_id = map(_literal, order)
+        where_clause = f"{where_clause} AND order_created_date_tr = {date} AND order_id = {order_id}"
+    return f"""
+    SELECT
+      order_id,
+      order_created_date_tr AS tarih,
+      city AS sehir,
+      payment_method AS odeme_yontemi,
+      delivery_status AS teslimat_durumu,
+      vendor_id,
+      product_name AS urun_adi,
+      product_code_1 AS urun_kodu,
+      order_amount AS siparis_tutari,
+      order_creation_timestamp AS siparis_zamani
+    FROM {table}
+    WHERE {where_clause}
+      AND order_created_date_tr IS NOT NULL
+    ORDER BY order_created_date_tr DESC, order_id
+    {f"LIMIT {limit}" if limit else ""}
+    """
+
+
+def fetch_orders_page(fetch, where_clause: str, table: str, after: tuple, page_rows: int) -> tuple:
+    """
+    One page of the order list: (rows, cursor of the next page or None).
+
+    fetch runs a query and returns a DataFrame. Pages end on order
+    boundaries, so the (date, order_id) cursor never splits the items of an
+    order; an order with more items than a page is returned whole.
+    """
+    frame = fetch(build_orders_query(where_clause, table, page_rows + 1, after=after))
+    if len(frame) <= page_rows:
+        return frame, None
+    keys = list(zip(frame["tarih"], frame["order_id"]))
+    end = page_rows
+    while end > 0 and keys[end - 1] == keys[page_rows]:
+        end -= 1
+    if end == 0:
+        return fetch(build_orders_query(where_clause, table, order=keys[0])), keys[0]
+    return frame.iloc[:end], keys[end - 1]
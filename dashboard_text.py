@@ -0,0 +1,56 @@
+"""
+Turkish text normalization for the dashboard (dashboard_app.py).
+
+City, payment method, status and product columns repeat a handful of
+distinct values, so normalize_series() normalizes each distinct value once
+(pd.factorize, which reads categorical codes directly) and maps the results
+back. Single characters go through one precompiled translation table.
+Results are memoized in this module, which Streamlit keeps loaded across
+reruns.
+"""
+import functools
+
+import numpy as np
+import pandas as pd
+
+# Mojibake of UTF-8 text read as Latin-1, applied in this order
+MOJIBAKE_FIXES = [
+    ("Ä°", "I"), ("Ä±", "i"), ("Ã", "A"), ("Ã¼", "u"), ("Ã¶", "o"), ("Ã§", "c"),
+    ("Å", "S"), ("ÄŸ", "g"), ("0STANBUL", "ISTANBUL"),
+]
+MOJIBAKE_MARKERS = ("Ä", "Ã", "Å", "0STANBUL")
+TURKISH_ASCII = str.maketrans("ğĞüÜşŞıİöÖçÇ", "gGuUsSiIoOcC")
+NORMALIZE_CACHE_SIZE = 100_000
+
+
+@functools.lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+def _normalize_text(text: str) -> str:
+    text = text.strip()
+    if any(marker in text for marker in MOJIBAKE_MARKERS):
+        for old, new in MOJIBAKE_FIXES:
+            text = text.replace(old, new)
+    text = text.translate(TURKISH_ASCII)
+    upper = text.upper()
+    if 'ISTANBUL' in upper and 'AVRUPA' in upper:
+        text = 'ISTANBUL-AVRUPA'
+    elif 'ISTANBUL' in upper and 'ANADOLU' in upper:
+        text = 'ISTANBUL-ANADOLU'
+    return text.replace('  ', ' ')
+
+
+def normalize_turkish(text):
+    """ASCII form of one Turkish value (missing values are returned as they are)."""
+    if text is None or pd.isna(text):
+        return text
+    return _normalize_text(str(text))
+
+
+def normalize_series(values: pd.Series) -> pd.Series:
+    """normalize_turkish over a column, computed once per distinct value."""
+    codes, uniques = pd.factorize(values)
+    normalized = np.array([_normalize_text(str(value)) for value in uniques], dtype=object)
+    result = normalized.take(codes) if len(normalized) else np.empty(len(codes), dtype=object)
+    missing = codes < 0
+    if missing.any():
+        result[missing] = values.to_numpy(dtype=object)[missing]
+    return pd.Series(result, index=values.index, name=values.name, dtype=object)
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+Local dead-letter store for rows BigQuery rejected.
+
+insert_to_bigquery (main.py) no longer aborts a run when insertAll rejects
+some rows: the good rows of the batch are retried and the rejected ones are
+appended here with their error reasons, one NDJSON file per day:
+
+    DEAD_LETTER_DIR/YYYY-MM-DD.ndjson
+    {"table_id": ..., "row_key": ..., "failed_at": ..., "errors": [...], "row": {...}}
+
+A row already in the store (same table and business key) is not added again,
+so a bad row re-fetched by every incremental run is stored once. The keys
+of each store file are indexed in memory; a file is only read again when
+another process changed it (size or modification time differs).
+
+DEAD_LETTER_DIR defaults to a local directory, which is lost with the
+container on ephemeral filesystems (Cloud Run). Point it at durable
+storage, e.g. a Cloud Storage bucket mounted as a volume.
+
+After fixing the rows (edit the file) or the table schema, re-submit them:
+    python dead_letter.py list
+    python dead_letter.py replay
+    python dead_letter.py replay --file dead_letter/2025-11-04.ndjson
+"""
+import argparse
+import datetime as dt
+import glob
+import os
+import threading
+from collections import Counter
+
+import json_codec
+
+DEAD_LETTER_DIR = os.getenv("DEAD_LETTER_DIR", "dead_letter")
+# A file being replayed is renamed first, so rows dead-lettered again during
+# the replay land in a fresh file and a crashed replay is picked up next time
+REPLAYING_SUFFIX = ".replaying"
+
+_lock = threading.Lock()
+# path -> (size, mtime_ns, {table_id: set of row keys}) of the store files
+_key_index = {}
+
+
+def _store_files(include_replaying: bool = True) -> list:
+    paths = glob.glob(os.path.join(DEAD_LETTER_DIR, "*.ndjson"))
+    if include_replaying:
+        paths += glob.glob(os.path.join(DEAD_LETTER_DIR, f"*.ndjson{REPLAYING_SUFFIX}"))
+    return sorted(paths)
+
+
+def read_entries(path: str) -> list:
+    entries = []
+    with open(path, "rb") as f:
+        for line in f:
+            if line.strip():
+                entries.append(json_codec.loads(line))
+    return entries
+
+
+def iter_entries(include_replaying: bool = True):
+    """(path, entry) for every dead-lettered row in the store."""
+    for path in _store_files(include_replaying):
+        for entry in read_entries(path):
+            yield path, entry
+
+
+def _file_state(path: str) -> tuple:
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def _stored_keys(table_id: str) -> set:
+    """Row keys of table_id in the store; only files changed since the last call are read."""
+    # Files being replayed are about to be removed, so they do not count
+    paths = _store_files(include_replaying=False)
+    for path in set(_key_index) - set(paths):
+        del _key_index[path]
+    keys = set()
+    for path in paths:
+        try:
+            state = _file_state(path)
+        except FileNotFoundError:
+            continue
+        cached = _key_index.get(path)
+        if cached is None or cached[:2] != state:
+            by_table = {}
+            for entry in read_entries(path):
+                by_table.setdefault(entry.get("table_id"), set()).add(entry["row_key"])
+            cached = _key_index[path] = (*state, by_table)
+        keys |= cached[2].get(table_id, set())
+    return keys
+
+
+def record(table_id: str, rejected: list) -> int:
+    """
+    Append rejected rows to today's file.
+
+    rejected: [(row_key, row, errors)]. Returns how many rows were new to the
+    store (rows already dead-lettered for this table are skipped).
+    """
+    if not rejected:
+        return 0
+    with _lock:
+        stored = _stored_keys(table_id)
+        failed_at = dt.datetime.now().isoformat(timespec="seconds")
+        lines = []
+        new_keys = set()
+        for row_key, row, errors in rejected:
+            if row_key in stored:
+                continue
+            stored.add(row_key)
+            new_keys.add(row_key)
+            lines.append(json_codec.dumps_bytes({
+                "table_id": table_id,
+                "row_key": row_key,
+                "failed_at": failed_at,
+                "errors": errors,
+                "row": row,
+            }))
+        if lines:
+            os.makedirs(DEAD_LETTER_DIR, exist_ok=True)
+            path = os.path.join(DEAD_LETTER_DIR, f"{dt.date.today().isoformat()}.ndjson")
+            cached = _key_index.get(path)
+            current = cached is not None and os.path.exists(path) and cached[:2] == _file_state(path)
+            with open(path, "ab") as f:
+                f.write(b"\n".join(lines) + b"\n")
+            if current:
+                # Own append: extend the index instead of reading the file again
+                cached[2].setdefault(table_id, set()).update(new_keys)
+                _key_index[path] = (*_file_state(path), cached[2])
+            else:
+                _key_index.pop(path, None)
+    return len(lines)
+
+
+def error_reason(errors: list) -> str:
+    """First reason/message of an insertAll error list, for summaries."""
+    first = (errors or [{}])[0]
+    return f"{first.get('reason', '?')}: {first.get('message', '')}"[:120]
+
+
+def summarize() -> dict:
+    """Row counts per file, table and error reason."""
+    files = Counter()
+    tables = Counter()
+    reasons = Counter()
+    for path, entry in iter_entries():
+        files[os.path.basename(path)] += 1
+        tables[entry.get("table_id")] += 1
+        reasons[error_reason(entry.get("errors"))] += 1
+    return {"rows": sum(files.values()), "files": dict(files), "tables": dict(tables), "reasons": dict(reasons)}
+
+
+def replay(paths: list = None, ingest=None) -> dict:
+    """
+    Re-submit dead-lettered rows through the normal insert path.
+
+    Rows go through ingest_rows with the stream strategy, so anything that
+    reached BigQuery in the meantime is skipped as a duplicate, rows rejected
+    again are dead-lettered again (in today's file), and the dashboard
+    rollups and dimension catalog are refreshed like after any other write.
+    Replayed files are removed.
+    """
+    if ingest is None:
+        from main import ingest_rows
+
+        def ingest(rows, table_id):
+            return ingest_rows(rows, "stream", table_id=table_id)
+
+    totals = {"files": 0, "rows": 0, "inserted_rows": 0, "skipped_duplicates": 0, "dead_lettered_rows": 0}
+    for path in paths or _store_files():
+        replaying = path if path.endswith(REPLAYING_SUFFIX) else path + REPLAYING_SUFFIX
+        if replaying != path:
+            os.replace(path, replaying)
+        entries = read_entries(replaying)
+        by_table = {}
+        for entry in entries:
+            by_table.setdefault(entry["table_id"], []).append(entry["row"])
+        print(f"♻️ Replaying {len(entries):,} rows from {os.path.basename(path)}")
+        for table_id, rows in by_table.items():
+            result = ingest(rows, table_id=table_id)
+            for key in ("inserted_rows", "skipped_duplicates", "dead_lettered_rows"):
+                totals[key] += result.get(key, 0)
+        os.remove(replaying)
+        totals["files"] += 1
+        totals["rows"] += len(entries)
+    return totals
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description="Dead-lettered BigQuery rows")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("list", help="Summarize the dead-letter store")
+    replay_parser = sub.add_parser("replay", help="Re-submit dead-lettered rows")
+    replay_parser.add_argument("--file", action="append", help="Only these store files (repeatable)")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = _parse_args()
+    if args.command == "list":
+        summary = summarize()
+        print(f"☠️ {summary['rows']:,} dead-lettered rows in {DEAD_LETTER_DIR}/")
+        for title, counts in (("Files", summary["files"]), ("Tables", summary["tables"]),
+                              ("Reasons", summary["reasons"])):
+            if counts:
+                print(f"{title}:")
+                for name, count in sorted(counts.items(), key=lambda item: -item[1]):
+                    print(f"  {count:>8,}  {name}")
+    else:
+        totals = replay(args.file)
+        print(f"✅ Replayed {totals['rows']:,} rows from {totals['files']} files: "
+              f"{totals['inserted_rows']:,} inserted, {totals['skipped_duplicates']:,} already present, "
+              f"{totals['dead_lettered_rows']:,} rejected again")
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Dimension catalog behind the dashboard filters (dashboard_app.py).
+
+One row per distinct value of the filter dimensions of the order-items
+table (city, payment method, delivery status, vendor), with its normalized
+display form (dashboard_text.normalize_turkish). The dashboard reads this
+small table instead of running SELECT DISTINCT over the whole order table,
+and no longer normalizes every city per session.
+
+Ingest keeps it current: the distinct values of every written batch are
+compared with the values already known to the process, and only new ones
+are merged into the catalog (add_batch_values). Values are never removed;
+the catalog lists every value seen so far.
+
+Usage (initial build / repair, one scan of the source table):
+    python dimension_catalog.py rebuild
+"""
+import argparse
+import os
+import threading
+
+import pyarrow as pa
+import pyarrow.compute as pc
+from google.cloud import bigquery
+
+import order_rollups
+from dashboard_text import normalize_turkish
+
+PROJECT_ID = order_rollups.PROJECT_ID
+DATASET = order_rollups.DATASET
+SOURCE_TABLE = order_rollups.SOURCE_TABLE
+CATALOG_TABLE = f"{PROJECT_ID}.{DATASET}.dashboard_dimension_catalog"
+CATALOG_ENABLED = os.getenv("DIMENSION_CATALOG_ENABLED", "1") == "1"
+# New values per MERGE statement
+CATALOG_MERGE_VALUES = 10000
+
+# Dimension name = order-items column
+DIMENSIONS = ["city", "payment_method", "delivery_status", "vendor_id"]
+
+_known = None  # {dimension: set of values in the catalog}, loaded on first use
+_lock = threading.Lock()
+_table_ready = False
+
+
+def ensure_table(client):
+    global _table_ready
+    if _table_ready:
+        return
+    client.query(f"""
+    CREATE TABLE IF NOT EXISTS `{CATALOG_TABLE}` (
+      dimension STRING NOT NULL,
+      value STRING NOT NULL,
+      normalized_value STRING,
+      first_seen TIMESTAMP
+    )
+    CLUSTER BY dimension
+    """).result()
+    _table_ready = True
+
+
+def catalog_query(dimensions: list) -> str:
+    """Values of the given dimensions, sorted (duplicates of concurrent merges collapsed)."""
+    names = ", ".join(f"'{name}'" for name in dimensions)
+    return f"""
+    SELECT dimension, value, ANY_VALUE(normalized_value) AS normalized_value
+    FROM `{CATALOG_TABLE}`
+    WHERE dimension IN ({names})
+    GROUP BY dimension, value
+    ORDER BY dimension, value
+    """
+
+
+def _load_known(client) -> dict:
+    known = {name: set() for name in DIMENSIONS}
+    for row in client.query(f"SELECT dimension, value FROM `{CATALOG_TABLE}`").result():
+        known.setdefault(row["dimension"], set()).add(row["value"])
+    return known
+
+
+def batch_values(batch) -> dict:
+    """{dimension: distinct non-empty values} of an OrderBatch, as strings."""
+    values = {}
+    for name in DIMENSIONS:
+        if name not in batch.columns:
+            continue
+        column = batch.table.column(name)
+        if pa.types.is_dictionary(column.type):
+            column = column.cast(column.type.value_type)
+        values[name] = {str(value) for value in pc.unique(column).to_pylist() if value not in (None, "")}
+    return values
+
+
+def _merge(client, rows: list) -> int:
+    """Insert (dimension, value, normalized value) rows the catalog does not have yet."""
+    merged = 0
+    for start in range(0, len(rows), CATALOG_MERGE_VALUES):
+        chunk = rows[start:start + CATALOG_MERGE_VALUES]
+        job_config = bigquery.QueryJobConfig(query_parameters=[
+            bigquery.ArrayQueryParameter("dimensions", "STRING", [row[0] for row in chunk]),
+            bigquery.ArrayQueryParameter("values", "STRING", [row[1] for row in chunk]),
+            bigquery.ArrayQueryParameter("normalized", "STRING", [row[2] for row in chunk]),
+        ])
+        job = client.query(f"""
+        MERGE `{CATALOG_TABLE}` AS catalog
+        USING (
+          SELECT dimension, @values[OFFSET(position)] AS value, @normalized[OFFSET(position)] AS normalized_value
+          FROM UNNEST(@dimensions) AS dimension WITH OFFSET AS position
+        ) AS seen
+        ON catalog.dimension = seen.dimension AND catalog.value = seen.value
+        WHEN NOT MATCHED THEN
+          INSERT (dimension, value, normalized_value, first_seen)
+          VALUES (seen.dimension, seen.value, seen.normalized_value, CURRENT_TIMESTAMP())
+        """, job_config=job_config)
+        job.result()
+        merged += job.num_dml_affected_rows or 0
+    return merged
+
+
+def add_batch_values(client, values: dict) -> dict:
+    """Merge the values of a written batch (batch_values) that are new to the catalog (called by ingest)."""
+    global _known
+    with _lock:
+        ensure_table(client)
+        if _known is None:
+            _known = _load_known(client)
+        rows = sorted(
+            (name, value, normalize_turkish(value))
+            for name, seen in values.items() for value in seen - _known.get(name, set())
+        )
+        if not rows:
+            return {"status": "unchanged"}
+        merged = _merge(client, rows)
+        for name, value, _ in rows:
+            _known.setdefault(name, set()).add(value)
+    return {"status": "success", "new_values": len(rows), "inserted": merged}
+
+
+def rebuild(client) -> dict:
+    """Add every distinct dimension value of the source table (one scan)."""
+    global _known
+    ensure_table(client)
+    selects = "\nUNION ALL\n".join(f"""
+    SELECT DISTINCT '{name}' AS dimension, CAST({name} AS STRING) AS value
+    FROM `{SOURCE_TABLE}`
+    WHERE {name} IS NOT NULL""" for name in DIMENSIONS)
+    job = client.query(selects)
+    values = {}
+    for row in job.result():
+        if row["value"]:
+            values.setdefault(row["dimension"], set()).add(row["value"])
+    with _lock:
+        _known = None
+    result = add_batch_values(client, values)
+    return {**result, "bytes_processed": job.total_bytes_processed}
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description="Dimension catalog of the dashboard filters")
+    parser.add_argument("command", choices=["rebuild"])
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    _parse_args()
+    result = rebuild(bigquery.Client(project=PROJECT_ID, location="europe-west3"))
+    print(f"✅ Dimension catalog rebuilt: {result.get('new_values', 0):,} new values "
+          f"({(result['bytes_processed'] or 0) / 1024 ** 3:.2f} GB scanned)")
@@ -0,0 +1,227 @@
+"""
+Enrichment stage of the ingest pipeline: joins order rows against dimension
+tables held in memory, before the rows are written.
+
+Each Dimension maps a key column of the order rows (vendor_id, city, ...) to
+attribute columns of a BigQuery dimension table. Lookups are cached in
+process:
+
+- only the distinct keys of a batch are looked up; keys not cached yet are
+  loaded in one query per ENRICHMENT_QUERY_KEYS keys (unknown keys are
+  cached as "no match" too)
+- the cache is an LRU capped at ENRICHMENT_CACHE_SIZE keys per dimension
+- every ENRICHMENT_TTL_SECONDS the cached keys are refreshed incrementally:
+  only dimension rows whose updated_at moved past the last refresh are read
+
+The join itself is columnar (Arrow index_in + take), so the rows are
+enriched in the same pass that writes them; there is no SQL pass over the
+target table afterwards. ENRICHMENTS picks the dimensions (comma separated,
+empty = stage off); sinks opt in with Sink(enrich=True).
+"""
+import datetime as dt
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import pyarrow as pa
+import pyarrow.compute as pc
+from google.cloud import bigquery
+
+from order_batch import column_array, json_columns
+from order_rows import CONTENT_FIELDS, HASH_FIELDS
+
+ENRICHMENTS = os.getenv("ENRICHMENTS", "")
+ENRICHMENT_DATASET = os.getenv("ENRICHMENT_DATASET", "tazecicekdb.order_data")
+ENRICHMENT_TTL_SECONDS = int(os.getenv("ENRICHMENT_TTL_SECONDS", "900"))
+ENRICHMENT_CACHE_SIZE = int(os.getenv("ENRICHMENT_CACHE_SIZE", "200000"))
+ENRICHMENT_QUERY_KEYS = 10000
+# Incremental refreshes overlap the previous one by this much (clock skew)
+REFRESH_OVERLAP = dt.timedelta(minutes=1)
+
+
+class Dimension:
+    """A dimension table joined on one order column, with its key cache."""
+
+    def __init__(self, name: str, table: str, key: str, on: str, columns: dict,
+                 updated_column: str = "updated_at"):
+        overlap = set(columns.values()) & set(HASH_FIELDS + CONTENT_FIELDS)
+        if overlap:
+            # Row hashes are computed before enrichment, so hashed fields must not change
+            raise ValueError(f"Dimension {name} would overwrite hashed fields: {', '.join(sorted(overlap))}")
+        self.name = name
+        self.table = table
+        self.key = key
+        self.on = on
+        # {dimension column: output column}
+        self.columns = columns
+        # None = no change tracking; the cache is then dropped on expiry
+        self.updated_column = updated_column
+
+        self.cache = OrderedDict()  # key -> {output column: value} or None (no match)
+        self.watermark = None
+        self.refreshed_at = None
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "loaded": 0, "refreshed": 0, "evicted": 0}
+
+    @property
+    def table_id(self) -> str:
+        return self.table if self.table.count(".") == 2 else f"{ENRICHMENT_DATASET}.{self.table}"
+
+    def get_many(self, client, keys: list) -> dict:
+        """{key: attributes or None} for string keys, loading the ones not cached."""
+        with self.lock:
+            if self.refreshed_at is not None and time.monotonic() - self.refreshed_at >= ENRICHMENT_TTL_SECONDS:
+                self._refresh(client)
+            found = {}
+            misses = []
+            for key in keys:
+                if key in self.cache:
+                    self.cache.move_to_end(key)
+                    found[key] = self.cache[key]
+                else:
+                    misses.append(key)
+            self.stats["hits"] += len(found)
+            self.stats["misses"] += len(misses)
+            for start in range(0, len(misses), ENRICHMENT_QUERY_KEYS):
+                chunk = misses[start:start + ENRICHMENT_QUERY_KEYS]
+                loaded = self._query(client, chunk)
+                for key in chunk:
+                    found[key] = loaded.get(key)
+                    self._put(key, found[key])
+            return found
+
+    def _put(self, key: str, attributes):
+        self.cache[key] = attributes
+        self.cache.move_to_end(key)
+        while len(self.cache) > ENRICHMENT_CACHE_SIZE:
+            self.cache.popitem(last=False)
+            self.stats["evicted"] += 1
+
+    def _select(self, where: str) -> str:
+        columns = ", ".join(f"`{column}`" for column in self.columns)
+        latest = (
+            f"QUALIFY ROW_NUMBER() OVER (PARTITION BY `{self.key}` ORDER BY `{self.updated_column}` DESC) = 1"
+            if self.updated_column else ""
+        )
+        return f"""
+        SELECT CAST(`{self.key}` AS STRING) AS dim_key, {columns}
+        FROM `{self.table_id}`
+        WHERE {where}
+        {latest}
+        """
+
+    def _rows_to_attributes(self, rows) -> dict:
+        return {
+            row["dim_key"]: {output: row[column] for column, output in self.columns.items()}
+            for row in rows
+        }
+
+    def _query(self, client, keys: list) -> dict:
+        """Attributes of the given keys, straight from the dimension table."""
+        if self.refreshed_at is None:
+            # Changes made while this first load runs are picked up by the next refresh
+            self.watermark = dt.datetime.now(dt.timezone.utc) - REFRESH_OVERLAP
+            self.refreshed_at = time.monotonic()
+        job_config = bigquery.QueryJobConfig(query_parameters=[
+            bigquery.ArrayQueryParameter("keys", "STRING", keys),
+        ])
+        rows = client.query(
+            self._select(f"CAST(`{self.key}` AS STRING) IN UNNEST(@keys)"), job_config=job_config
+        ).result()
+        loaded = self._rows_to_attributes(rows)
+        self.stats["loaded"] += len(loaded)
+        return loaded
+
+    def _refresh(self, client):
+        """Update cached keys whose dimension rows changed since the last refresh."""
+        started = dt.datetime.now(dt.timezone.utc) - REFRESH_OVERLAP
+        if self.updated_column is None:
+            self.cache.clear()
+        else:
+            try:
+                job_config = bigquery.QueryJobConfig(query_parameters=[
+                    bigquery.ScalarQueryParameter("since", "TIMESTAMP", self.watermark),
+                ])
+                rows = client.query(
+                    self._select(f"`{self.updated_column}` > @since"), job_config=job_config
+                ).result()
+                changed = self._rows_to_attributes(rows)
+            except Exception as e:
+                # Keep serving the cached values; the next batch tries again
+                print(f"⚠️ Warning: Could not refresh dimension {self.name}: {e}")
+                return
+            updated = 0
+            for key, attributes in changed.items():
+                if key in self.cache:
+                    self.cache[key] = attributes
+                    updated += 1
+            self.stats["refreshed"] += updated
+            print(f"🔄 Dimension {self.name}: {len(changed):,} changed rows, {updated:,} cached keys updated")
+        self.watermark = started
+        self.refreshed_at = time.monotonic()
+
+
+DIMENSIONS = {
+    dimension.name: dimension
+    for dimension in (
+        Dimension(
+            "vendors", "dim_vendors", key="vendor_id", on="vendor_id",
+            columns={"vendor_name": "vendor_name", "vendor_city": "vendor_city", "vendor_type": "vendor_type"},
+        ),
+        Dimension(
+            "cities", "dim_cities", key="city", on="city",
+            columns={"city_normalized": "city_normalized", "region": "region"},
+        ),
+    )
+}
+
+
+def parse_enrichments(value: str = None) -> list:
+    """Dimension names from a comma-separated string (default: ENRICHMENTS)."""
+    names = [name.strip() for name in (ENRICHMENTS if value is None else value).split(",") if name.strip()]
+    unknown = [name for name in names if name not in DIMENSIONS]
+    if unknown:
+        raise ValueError(f"Unknown dimension(s): {', '.join(unknown)} (known: {', '.join(DIMENSIONS)})")
+    return names
+
+
+def _key_strings(batch, column: str):
+    """A batch column as Arrow strings, the form dimension keys are cached in."""
+    if column in json_columns(batch.table.schema):
+        return pa.array([None if v is None else str(v) for v in batch.column(column)], type=pa.string())
+    return batch.table.column(column).cast(pa.string())
+
+
+def enrich_batch(batch, client, names: list = None, target_columns: set = None):
+    """
+    Add the attribute columns of every selected dimension to an OrderBatch.
+
+    Columns missing from target_columns (the target table schema) are not
+    added. Rows without a match get nulls.
+    """
+    names = parse_enrichments() if names is None else names
+    for name in names:
+        dimension = DIMENSIONS[name]
+        outputs = {
+            column: output for column, output in dimension.columns.items()
+            if target_columns is None or output in target_columns
+        }
+        if not outputs or dimension.on not in batch.columns or not len(batch):
+            continue
+
+        started = time.time()
+        keys = _key_strings(batch, dimension.on)
+        distinct = [key for key in pc.unique(keys).to_pylist() if key is not None]
+        attributes = dimension.get_many(client, distinct)
+        # Position of every row's key in `distinct`; null when the key is null
+        positions = pc.index_in(keys, value_set=pa.array(distinct, type=pa.string()))
+        for output in outputs.values():
+            values, metadata = column_array(
+                [None if attributes[key] is None else attributes[key].get(output) for key in distinct]
+            )
+            batch = batch.with_column(output, values.take(positions), metadata)
+        matched = sum(attributes[key] is not None for key in distinct)
+        print(f"🧩 Enriched {len(batch):,} rows from {name}: {matched:,}/{len(distinct):,} keys matched "
+              f"({time.time() - started:.2f}s, {len(dimension.cache):,} cached)")
+    return batch
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+Bulk ingest of historical order exports (CSV, NDJSON or Parquet, optionally
+gzipped) without going through the API-shaped /fetch path.
+
+A file is streamed in chunks of FILE_CHUNK_ROWS rows; only one chunk is
+parsed while the previous one loads, so memory stays flat whatever the file
+size. Every chunk goes through the same steps as API rows:
+
+- the sink's normalization, plus coercion to the table's column types
+  (order_rows.coerce_row), so rows hash like their API/BigQuery twins
+- enrichment (enrichment.py) when the sink has it
+- business-key dedup inside the chunk, and a row_key for the rest
+- a load job appending the chunk to one per-file staging table
+
+One MERGE at the end inserts the rows whose business key is not in the
+table yet (duplicates across chunks are dropped there, first row wins) and
+updates changed CONTENT_FIELDS, like the 'merge' ingest strategy.
+
+Usage:
+    python file_ingest.py exports/orders_2024.csv.gz
+    python file_ingest.py exports/*.parquet --sink v1 --chunk-rows 50000
+Upload:
+    curl -X POST -F file=@orders_2024.csv.gz "$SERVICE_URL/ingest-file"
+"""
+import argparse
+import csv
+import gzip
+import io
+import os
+import resource
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from google.cloud import bigquery
+
+import dimension_catalog
+import json_codec
+import key_set
+import sinks
+from order_rows import coerce_row
+
+FILE_CHUNK_ROWS = int(os.getenv("FILE_CHUNK_ROWS", "100000"))
+FILE_FORMATS = ("csv", "ndjson", "parquet")
+# Staging column giving every row its position in the file (first row wins)
+FILE_ROW_COLUMN = "file_row"
+
+
+def detect_format(filename: str) -> str:
+    """File format from the file name (.csv, .ndjson/.jsonl/.json, .parquet; .gz allowed)."""
+    name = filename.lower()
+    if name.endswith(".gz"):
+        name = name[:-3]
+    for suffix, fmt in ((".csv", "csv"), (".ndjson", "ndjson"), (".jsonl", "ndjson"),
+                        (".json", "ndjson"), (".parquet", "parquet")):
+        if name.endswith(suffix):
+            return fmt
+    raise ValueError(f"Cannot tell the format of {filename}; pass one of: {', '.join(FILE_FORMATS)}")
+
+
+def _text_stream(fileobj, gzipped: bool):
+    if gzipped:
+        fileobj = gzip.GzipFile(fileobj=fileobj)
+    return io.TextIOWrapper(fileobj, encoding="utf-8-sig", newline="")
+
+
+def _json_shaped(record_batch: pa.RecordBatch) -> pa.RecordBatch:
+    """Dates, timestamps and decimals as text, the way the API and CSV exports carry them."""
+    arrays = [
+        column.cast(pa.string())
+        if pa.types.is_temporal(column.type) or pa.types.is_decimal(column.type) else column
+        for column in record_batch.columns
+    ]
+    return pa.RecordBatch.from_arrays(arrays, names=record_batch.schema.names)
+
+
+def iter_file_chunks(fileobj, fmt: str, gzipped: bool = False, chunk_rows: int = None):
+    """Yield the rows of a binary file object as lists of dicts, chunk_rows at a time."""
+    chunk_rows = chunk_rows or FILE_CHUNK_ROWS
+    if fmt == "parquet":
+        if gzipped:
+            raise ValueError("Parquet files are compressed internally; upload them without .gz")
+        for record_batch in pq.ParquetFile(fileobj).iter_batches(batch_size=chunk_rows):
+            yield _json_shaped(record_batch).to_pylist()
+        return
+
+    if fmt == "csv":
+        rows = csv.DictReader(_text_stream(fileobj, gzipped))
+    elif fmt == "ndjson":
+        rows = (json_codec.loads(line) for line in _text_stream(fileobj, gzipped) if line.strip())
+    else:
+        raise ValueError(f"Unknown file format: {fmt} (known: {', '.join(FILE_FORMATS)})")
+
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_rows:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def upload_options(filename: str = None, fmt: str = None, gzipped=None) -> tuple:
+    """(format, gzipped) of an upload from its file name and/or explicit query parameters."""
+    fmt = fmt or detect_format(filename or "")
+    if fmt not in FILE_FORMATS:
+        raise ValueError(f"Unknown file format: {fmt} (known: {', '.join(FILE_FORMATS)})")
+    if gzipped is None:
+        gzipped = bool(filename) and filename.lower().endswith(".gz")
+    return fmt, gzipped
+
+
+def spool_upload():
+    """Temporary file for a raw upload body (in memory up to 8 MB, then on disk)."""
+    return tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+
+
+def _peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def ingest_file(fileobj, fmt: str, gzipped: bool = False, sink_name: str = None, chunk_rows: int = None) -> dict:
+    """
+    Stream one export file into a sink table (default: the primary sink).
+
+    Returns the same counters as the 'merge' strategy plus file statistics.
+    """
+    import main
+
+    sink = sinks.SINKS[sink_name or sinks.PRIMARY_SINK]
+    table_id = main.sink_table_id(sink)
+    schema = main.get_table_schema(table_id)
+    columns = sorted(field.name for field in schema)
+    normalize = partial(
+        coerce_row,
+        normalize=main.sink_normalizer(sink),
+        types={field.name: field.field_type for field in schema},
+    )
+    staging_schema = list(schema) + [
+        bigquery.SchemaField("row_key", "STRING"),
+        bigquery.SchemaField(FILE_ROW_COLUMN, "INT64"),
+    ]
+    staging_id = main.staging_table_id(table_id)
+
+    started = time.time()
+    stats = {"chunks": 0, "rows_read": 0, "staged_rows": 0, "staged_bytes": 0, "skipped_duplicates": 0}
+    delivery_dates = set()
+    order_days = set()
+    # Filter values for the dashboard's dimension catalog (source table only)
+    dimension_values = {}
+    collect_dimensions = table_id == dimension_catalog.SOURCE_TABLE
+    order_column = main.order_day_column(columns)
+    main.create_staging_table(staging_id, staging_schema)
+    try:
+        # One load job in flight while the next chunk is parsed
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="file-load") as loader:
+            pending = None
+            for chunk in iter_file_chunks(fileobj, fmt, gzipped, chunk_rows):
+                first_row = stats["rows_read"]
+                stats["chunks"] += 1
+                stats["rows_read"] += len(chunk)
+                batch = main.enrich_sink_batch(main.to_order_batch(chunk, normalize), sink.name)
+                del chunk
+
+                row_digests = main.get_batch_key_digests(batch)
+                unique_positions = key_set.first_occurrences(row_digests)
+                stats["skipped_duplicates"] += len(row_digests) - len(unique_positions)
+                # None kept: rows without a delivery date are rolled up as well
+                delivery_dates.update(set(batch.column("order_delivery_date")) - {""})
+                order_days.update(main.batch_order_days(batch, order_column))
+                if collect_dimensions:
+                    for name, values in dimension_catalog.batch_values(batch).items():
+                        dimension_values.setdefault(name, set()).update(values)
+                encoded_rows = [
+                    json_codec.dumps_bytes({
+                        **row,
+                        "row_key": key_set.digest_hex(digest),
+                        FILE_ROW_COLUMN: first_row + int(position),
+                    })
+                    for row, digest, position in zip(
+                        batch.take(unique_positions).iter_rows(columns=columns),
+                        row_digests[unique_positions],
+                        unique_positions,
+                    )
+                ]
+                del batch, row_digests, unique_positions
+                stats["staged_rows"] += len(encoded_rows)
+                stats["staged_bytes"] += sum(len(row) + 1 for row in encoded_rows)
+
+                if pending is not None:
+                    pending.result()
+                pending = loader.submit(main.load_encoded_rows, staging_id, staging_schema, encoded_rows, True)
+                del encoded_rows
+                print(f"📄 Chunk {stats['chunks']}: {stats['rows_read']:,} rows read, "
+                      f"{stats['staged_rows']:,} staged (peak RSS {_peak_rss_mb():,.0f} MB)")
+            if pending is not None:
+                pending.result()
+
+        if not stats["staged_rows"]:
+            return {"inserted_rows": 0, "status": "empty", **stats}
+
+        print(f"🔀 Merging {stats['staged_rows']:,} staged file rows into {table_id} "
+              f"({len(delivery_dates):,} delivery dates)")
+        merge_job, updates_deferred, moved_from = main.merge_staging_table(
+            table_id, staging_id, set(columns), delivery_dates,
+            order_column=FILE_ROW_COLUMN, order_days=order_days,
+        )
+    finally:
+        main.bq_client.delete_table(staging_id, not_found_ok=True)
+
+    inserted, updated = main.merge_counts(merge_job)
+    stats["skipped_duplicates"] += stats["staged_rows"] - inserted - updated
+    result = {
+        "inserted_rows": inserted,
+        "updated_rows": updated,
+        "updates_deferred": updates_deferred,
+        "status": "success",
+        "strategy": "file",
+        "sink": sink.name,
+        "bytes_processed": merge_job.total_bytes_processed,
+        "bytes_billed": merge_job.total_bytes_billed,
+        "moved_from_dates": main.date_list(moved_from),
+        "elapsed_seconds": round(time.time() - started, 2),
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+        **stats,
+    }
+    main.refresh_rollups(table_id, result, delivery_dates | moved_from)
+    main.refresh_dimension_catalog(table_id, result, dimension_values)
+    return result
+
+
+def ingest_path(path: str, fmt: str = None, sink_name: str = None, chunk_rows: int = None) -> dict:
+    fmt = fmt or detect_format(path)
+    with open(path, "rb") as f:
+        return ingest_file(f, fmt, path.lower().endswith(".gz"), sink_name, chunk_rows)
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description="Bulk ingest of order export files")
+    parser.add_argument("paths", nargs="+", help="CSV / NDJSON / Parquet files (.gz allowed)")
+    parser.add_argument("--format", choices=FILE_FORMATS, default=None, help="Default: from the file name")
+    parser.add_argument("--sink", choices=list(sinks.SINKS), default=sinks.PRIMARY_SINK)
+    parser.add_argument("--chunk-rows", type=int, default=FILE_CHUNK_ROWS)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = _parse_args()
+    for path in args.paths:
+        result = ingest_path(path, args.format, args.sink, args.chunk_rows)
+        print(f"✅ {path}: {result['rows_read']:,} rows read, {result['inserted_rows']:,} inserted, "
+              f"{result.get('updated_rows', 0):,} updated, {result['skipped_duplicates']:,} duplicates "
+              f"in {result.get('elapsed_seconds', 0):.1f}s")
@@ -0,0 +1,482 @@
+#!/usr/bin/env python3
+"""
+Ingest pipeline benchmarks.
+
+Usage:
+    python ingest_benchmarks.py strategies --date 2025-11-04
+    python ingest_benchmarks.py batching --rows 100000
+    python ingest_benchmarks.py batching --rows 100000 --table PROJECT.DATASET.scratch_table
+    python ingest_benchmarks.py codec --rows 100000
+    python ingest_benchmarks.py memory --rows 100000
+    python ingest_benchmarks.py keyset --rows 1000000
+    python ingest_benchmarks.py pool --rows 300000 --days 30
+    python ingest_benchmarks.py loadtest --target flask=http://host-a --target async=http://host-b --path /sinks
+"""
+import argparse
+import gc
+import hashlib
+import json
+import random
+import time
+import tracemalloc
+import uuid
+
+import pyarrow as pa
+
+import insert_batches
+import json_codec
+import key_set
+import payload_archive
+from order_rows import HASH_FIELDS, normalize_row
+
+CITIES = ["İSTANBUL-AVRUPA", "İSTANBUL-ANADOLU", "ANKARA", "İZMİR", "BURSA", "ANTALYA", "KOCAELİ"]
+STATUSES = ["Teslim Edildi", "Yolda", "Hazırlanıyor", "İptal"]
+PAYMENTS = ["Kredi Kartı", "Havale", "Kapıda Ödeme"]
+
+
+def synthetic_rows(count: int, seed: int = 42, days: int = 1) -> list:
+    """API-shaped order item rows; some carry long additional_products lists."""
+    rng = random.Random(seed)
+    rows = []
+    for i in range(count):
+        day = f"2025-11-{1 + i % days:02d}"
+        extras = rng.choice([0, 0, 0, 1, 2, 5, 40])
+        rows.append({
+            "order_id": 1_000_000 + i // 2,
+            "order_code": f"TC{1_000_000 + i // 2}",
+            "product_code_1": f"P{rng.randint(1, 500):04d}",
+            "product_name": f"Kırmızı Gül Buketi {rng.randint(1, 500)}",
+            "user_id": rng.randint(1, 200_000),
+            "city": rng.choice(CITIES),
+            "district": f"İlçe {rng.randint(1, 40)}",
+            "neighborhood": f"Mahalle {rng.randint(1, 400)}",
+            "delivery_location_type": rng.choice(["Ev", "İş Yeri", "Hastane"]),
+            "vendor_id": rng.randint(1, 300),
+            "rider_id": rng.randint(1, 800),
+            "additional_products": [f"Ek Ürün {rng.randint(1, 90)} - Çikolata Kutusu" for _ in range(extras)],
+            "order_created_date": f"{day}T{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:00",
+            "order_creation_timestamp": f"{day}T{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:00+03:00",
+            "order_delivery_date": f"{day}T00:00:00",
+            "requested_delivery_date": f"{day}T00:00:00",
+            "delivery_status": rng.choice(STATUSES),
+            "payment_method": rng.choice(PAYMENTS),
+            "order_amount": round(rng.uniform(150, 3500), 2),
+            "product_price": round(rng.uniform(100, 3000), 2),
+            "discount_amount": round(rng.uniform(0, 200), 2),
+            "card_message": rng.choice(["", "İyi ki doğdun!", "Geçmiş olsun, sevgilerle."]),
+            "sender_name": f"Gönderen {rng.randint(1, 9999)}",
+            "receiver_name": f"Alıcı {rng.randint(1, 9999)}",
+            "channel": rng.choice(["web", "ios", "android"]),
+            "coupon_code": rng.choice([None, None, "INDIRIM10"]),
+            "is_corporate": rng.random() < 0.1,
+            "quantity": rng.randint(1, 3),
+            "currency": "TRY",
+            "source": "api",
+        })
+    return rows
+
+
+def bench_strategies(args):
+    """
+    Compare the 'stream' and 'merge' ingest strategies on one archived day.
+
+    Each strategy runs against its own scratch copy of the touched partitions,
+    so both see the same existing rows and neither affects the real table.
+    """
+    import main
+
+    rows = payload_archive.read_archived_day(args.date)
+    if not rows:
+        raise SystemExit(f"No archived payload for {args.date}")
+
+    dates = sorted({
+        main.normalize_row(row).get("order_delivery_date") for row in rows
+    } - {None})
+    date_list = ", ".join(f"DATE '{d}'" for d in dates) or "NULL"
+    source_id = f"{main.PROJECT_ID}.{main.DATASET}.{main.TABLE}"
+    source = main.bq_client.get_table(source_id)
+
+    results = {}
+    for strategy in ("stream", "merge"):
+        scratch_id = f"{main.PROJECT_ID}.{main.DATASET}._bench_{strategy}_{uuid.uuid4().hex[:8]}"
+        partition = f"PARTITION BY {source.time_partitioning.field}" if source.time_partitioning else ""
+        cluster = f"CLUSTER BY {', '.join(source.clustering_fields)}" if source.clustering_fields else ""
+        main.bq_client.query(f"""
+        CREATE TABLE `{scratch_id}` {partition} {cluster}
+        OPTIONS (expiration_timestamp = TIMESTAMP_ADD(CURRENT_TIMESTAMP(), INTERVAL 1 DAY))
+        AS SELECT * FROM `{source_id}` WHERE order_delivery_date IN ({date_list})
+        """).result()
+        try:
+            started = time.time()
+            result = main.ingest_rows(list(rows), strategy, table_id=scratch_id)
+            results[strategy] = {"seconds": time.time() - started, **result}
+        finally:
+            main.bq_client.delete_table(scratch_id, not_found_ok=True)
+
+    print(f"\n📊 {args.date}: {len(rows):,} payload rows, partitions: {', '.join(dates)}")
+    print(f"{'strategy':<10}{'seconds':>10}{'inserted':>10}{'skipped':>10}{'rows downloaded':>18}")
+    for strategy, result in results.items():
+        print(
+            f"{strategy:<10}{result['seconds']:>10.2f}{result['inserted_rows']:>10,}"
+            f"{result.get('skipped_duplicates', 0):>10,}{result.get('existing_rows_checked', 0):>18,}"
+        )
+
+
+def bench_batching(args):
+    """
+    Byte-aware batch packing vs fixed 2000-row batches.
+
+    Fixed batches are encoded the way insert_rows_json does it (one dict body
+    per request). Without --table nothing is sent: the rows/s column is a
+    model that adds an assumed round trip (--rtt-ms) per request. With
+    --table (a scratch table with the order-items schema; rows are really
+    inserted) both are sent with insertAll and timed.
+    """
+    rows = [normalize_row(row) for row in synthetic_rows(args.rows)]
+    limit = 10 * 1024 * 1024
+    if args.table:
+        _bench_batching_measured(rows, args.table)
+        return
+
+    started = time.perf_counter()
+    fixed_sizes = []
+    for i in range(0, len(rows), 2000):
+        body = {"rows": [{"insertId": str(uuid.uuid4()), "json": row} for row in rows[i:i + 2000]]}
+        fixed_sizes.append(len(json.dumps(body).encode("utf-8")))
+    fixed_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    packed_sizes = [batch_bytes for _, batch_bytes in insert_batches.pack_batches(rows)]
+    packed_seconds = time.perf_counter() - started
+
+    rtt = args.rtt_ms / 1000
+    print(f"\n📊 {len(rows):,} rows, MODELED (no requests sent, assumed round trip {args.rtt_ms} ms)")
+    print(f"{'batching':<14}{'requests':>10}{'max MB':>10}{'>10MB':>8}{'encode s':>10}{'modeled rows/s':>16}")
+    for name, sizes, seconds in (
+        ("fixed 2000", fixed_sizes, fixed_seconds),
+        ("byte-aware", packed_sizes, packed_seconds),
+    ):
+        modeled = seconds + len(sizes) * rtt
+        print(
+            f"{name:<14}{len(sizes):>10}{max(sizes) / 1024 ** 2:>10.2f}"
+            f"{sum(size > limit for size in sizes):>8}{seconds:>10.2f}{len(rows) / modeled:>16,.0f}"
+        )
+
+
+def _bench_batching_measured(rows: list, table_id: str):
+    """Insert the rows into table_id both ways and time the requests."""
+    from google.cloud import bigquery
+
+    client = bigquery.Client(project=table_id.split(".")[0])
+    results = {}
+    started = time.perf_counter()
+    requests = 0
+    for i in range(0, len(rows), 2000):
+        errors = client.insert_rows_json(table_id, rows[i:i + 2000])
+        requests += 1
+        if errors:
+            raise SystemExit(f"Insert into {table_id} failed: {errors[0]}")
+    results["fixed 2000"] = (requests, time.perf_counter() - started)
+
+    started = time.perf_counter()
+    requests = 0
+    for batch, _ in insert_batches.pack_batches(rows):
+        errors = insert_batches.insert_encoded_rows(client, table_id, batch)
+        requests += 1
+        if errors:
+            raise SystemExit(f"Insert into {table_id} failed: {errors[0]}")
+    results["byte-aware"] = (requests, time.perf_counter() - started)
+
+    print(f"\n📊 {len(rows):,} rows, MEASURED against {table_id} ({2 * len(rows):,} rows inserted)")
+    print(f"{'batching':<14}{'requests':>10}{'seconds':>10}{'rows/s':>12}")
+    for name, (requests, seconds) in results.items():
+        print(f"{name:<14}{requests:>10}{seconds:>10.2f}{len(rows) / seconds:>12,.0f}")
+
+
+def _best_of(func, repeat: int = 3) -> float:
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def bench_codec(args):
+    """Stdlib json vs json_codec on each JSON hot spot of the ingest path."""
+    raw = synthetic_rows(args.rows)
+    rows = [normalize_row(row) for row in raw]
+    body = json.dumps(raw).encode("utf-8")
+    bq_rows = [json.dumps(row) for row in rows]  # TO_JSON_STRING(t) stand-in
+    hash_dicts = [{f: row[f] for f in HASH_FIELDS if f in row} for row in rows]
+
+    stdlib_hash = [json.dumps(h, sort_keys=True, ensure_ascii=False) for h in hash_dicts]
+    if stdlib_hash != [json_codec.hash_dumps(h) for h in hash_dicts]:
+        raise SystemExit("❌ hash_dumps output differs from json.dumps")
+
+    spots = [
+        ("API body decode", lambda: json.loads(body), lambda: json_codec.loads(body)),
+        ("hash key encode",
+         lambda: [json.dumps(h, sort_keys=True, ensure_ascii=False) for h in hash_dicts],
+         lambda: [json_codec.hash_dumps(h) for h in hash_dicts]),
+        ("existing row decode",
+         lambda: [json.loads(r) for r in bq_rows],
+         lambda: [json_codec.loads(r) for r in bq_rows]),
+        ("insert encode",
+         lambda: [json.dumps(r, ensure_ascii=False).encode("utf-8") for r in rows],
+         lambda: [json_codec.dumps_bytes(r) for r in rows]),
+    ]
+    print(f"\n📊 {len(rows):,} rows, codec backend: {json_codec.BACKEND} (hash keys identical ✅)")
+    print(f"{'hot spot':<22}{'stdlib s':>10}{'codec s':>10}{'speedup':>10}")
+    for name, baseline, candidate in spots:
+        base_seconds = _best_of(baseline)
+        codec_seconds = _best_of(candidate)
+        print(f"{name:<22}{base_seconds:>10.3f}{codec_seconds:>10.3f}{base_seconds / codec_seconds:>9.1f}x")
+
+
+def _retained_bytes(build) -> tuple:
+    """(retained, peak) bytes of what build() returns: Python heap + Arrow buffers."""
+    gc.collect()
+    arrow_before = pa.total_allocated_bytes()
+    tracemalloc.start()
+    result = build()
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    arrow = pa.total_allocated_bytes() - arrow_before
+    return result, current + arrow, peak + arrow
+
+
+def bench_memory(args):
+    """Memory per row: list of normalized dicts vs columnar OrderBatch."""
+    import ingest_pool
+
+    body = json.dumps(synthetic_rows(args.rows)).encode("utf-8")
+
+    dicts, dict_bytes, dict_peak = _retained_bytes(
+        lambda: [normalize_row(row) for row in json_codec.loads(body)]
+    )
+    del dicts
+    batch, batch_bytes, batch_peak = _retained_bytes(
+        lambda: ingest_pool.build_batch(json_codec.loads(body))
+    )
+
+    print(f"\n📊 {args.rows:,} rows")
+    print(f"{'representation':<18}{'bytes/row':>12}{'total MB':>10}{'peak MB':>10}")
+    for name, total, peak in (
+        ("list of dicts", dict_bytes, dict_peak),
+        ("OrderBatch", batch_bytes, batch_peak),
+    ):
+        print(f"{name:<18}{total / args.rows:>12,.0f}{total / 1024 ** 2:>10.1f}{peak / 1024 ** 2:>10.1f}")
+    print(f"Retained memory reduced {dict_bytes / batch_bytes:.1f}x, "
+          f"peak {batch_peak / 1024 ** 2:.1f} MB vs {dict_peak / 1024 ** 2:.1f} MB")
+    dictionary = [f.name for f in batch.table.schema if pa.types.is_dictionary(f.type)]
+    print(f"Dictionary-encoded columns: {', '.join(dictionary)}")
+
+
+def bench_keyset(args):
+    """
+    Existing-row key index: dict of hex keys vs key_set.RowKeySet.
+
+    Keys are random md5 digests; half of the probes are members. Both
+    structures must agree on every probe (no false negatives, no false
+    positives after the exact stage).
+    """
+    count = args.rows
+    rng = random.Random(42)
+    digests = [hashlib.md5(rng.randbytes(16)).digest() for _ in range(count)]
+    contents = [hashlib.md5(rng.randbytes(16)).digest() for _ in range(count)]
+    probes = digests[::2] + [hashlib.md5(rng.randbytes(16)).digest() for _ in range(count // 2)]
+
+    def build_dict():
+        return {d.hex(): c.hex() for d, c in zip(digests, contents)}
+
+    def build_keyset():
+        keys = key_set.RowKeySet(expected_keys=count)
+        for i in range(0, count, 50_000):
+            keys.add_many(
+                key_set.digests_to_array(digests[i:i + 50_000]),
+                key_set.digest_values(contents[i:i + 50_000]),
+            )
+        keys.lookup(key_set.digests_to_array(probes[:1]))  # compaction
+        return keys
+
+    started = time.perf_counter()
+    index, dict_bytes, dict_peak = _retained_bytes(build_dict)
+    dict_build = time.perf_counter() - started
+    started = time.perf_counter()
+    expected = [index.get(p.hex()) for p in probes]
+    dict_lookup = time.perf_counter() - started
+    del index
+
+    started = time.perf_counter()
+    keys, keyset_bytes, keyset_peak = _retained_bytes(build_keyset)
+    keyset_build = time.perf_counter() - started
+    probe_array = key_set.digests_to_array(probes)
+    started = time.perf_counter()
+    found, values = keys.lookup(probe_array)
+    keyset_lookup = time.perf_counter() - started
+    bloom_hits = int(keys.might_contain(probe_array).sum())
+
+    members = [e is not None for e in expected]
+    if found.tolist() != members:
+        raise SystemExit("❌ RowKeySet membership differs from the dict")
+    expected_values = key_set.digest_values([bytes.fromhex(e) for e in expected if e is not None])
+    if not (values[found] == expected_values).all():
+        raise SystemExit("❌ RowKeySet values differ from the dict")
+
+    negatives = len(probes) - sum(members)
+    print(f"\n📊 {count:,} existing keys, {len(probes):,} probes (membership identical ✅)")
+    print(f"{'index':<12}{'total MB':>10}{'peak MB':>10}{'bytes/key':>11}{'build s':>10}{'lookup s':>10}")
+    for name, total, peak, build, lookup in (
+        ("dict (hex)", dict_bytes, dict_peak, dict_build, dict_lookup),
+        ("RowKeySet", keyset_bytes, keyset_peak, keyset_build, keyset_lookup),
+    ):
+        print(f"{name:<12}{total / 1024 ** 2:>10.1f}{peak / 1024 ** 2:>10.1f}{total / count:>11.0f}"
+              f"{build:>10.2f}{lookup:>10.2f}")
+    print(f"Bloom stage passed {bloom_hits - sum(members):,} of {negatives:,} non-members to the exact "
+          f"check ({(bloom_hits - sum(members)) / max(negatives, 1):.2%})")
+
+
+def bench_pool(args):
+    """
+    Normalize + hash in-process vs in the ingest_pool worker processes.
+
+    Two stages on the same month-sized synthetic payload: building the
+    OrderBatch from API rows, and hashing existing rows (TO_JSON_STRING text).
+    """
+    import os
+
+    import ingest_pool
+
+    raw = synthetic_rows(args.rows, days=args.days)
+    row_jsons = [json.dumps(row) for row in map(normalize_row, raw)]
+    workers = args.workers or os.cpu_count() or 1
+
+    def run(pool_workers: int) -> dict:
+        ingest_pool.shutdown()
+        ingest_pool.PARALLEL_WORKERS = pool_workers
+        ingest_pool.PARALLEL_MIN_ROWS = 1
+        if pool_workers > 1:
+            ingest_pool.build_batch(raw[:1000])  # start the workers outside the timing
+        started = time.perf_counter()
+        batch = ingest_pool.build_batch(raw)
+        build_seconds = time.perf_counter() - started
+        started = time.perf_counter()
+        hashed = sum(len(keys) for keys, _, _ in ingest_pool.hash_existing_rows(iter(row_jsons), len(row_jsons)))
+        existing_seconds = time.perf_counter() - started
+        return {"batch": batch, "hashed": hashed, "build": build_seconds, "existing": existing_seconds}
+
+    serial = run(1)
+    pooled = run(workers)
+    ingest_pool.shutdown()
+    if serial["batch"].to_rows() != pooled["batch"].to_rows() or \
+            not (serial["batch"].key_digests == pooled["batch"].key_digests).all():
+        raise SystemExit("❌ Pool output differs from the in-process result")
+
+    print(f"\n📊 {args.rows:,} rows over {args.days} days, {os.cpu_count()} CPUs, "
+          f"chunks of {ingest_pool.PARALLEL_CHUNK_ROWS:,} (output identical ✅)")
+    print(f"{'mode':<16}{'build batch s':>15}{'existing rows s':>17}{'rows/s':>12}")
+    for name, result in (("in-process", serial), (f"pool x{workers}", pooled)):
+        seconds = result["build"] + result["existing"]
+        print(f"{name:<16}{result['build']:>15.2f}{result['existing']:>17.2f}{2 * args.rows / seconds:>12,.0f}")
+    print(f"Speedup: build {serial['build'] / pooled['build']:.1f}x, "
+          f"existing rows {serial['existing'] / pooled['existing']:.1f}x")
+
+
+def bench_loadtest(args):
+    """
+    Concurrent requests against running deployments (e.g. main.py under
+    gunicorn vs async_main.py under uvicorn), one target after the other.
+
+    --path is required. Read-only routes (/, /sinks) are safe against
+    production; ingest routes (/fetch, /replay) call the orders API and write
+    the production tables once per request, and concurrent stream ingests of
+    the same day can insert a new row once per request.
+    """
+    import asyncio
+
+    import httpx
+
+    if not args.target:
+        raise SystemExit("Pass at least one --target NAME=URL")
+    if not args.path:
+        raise SystemExit("Pass the request --path (e.g. /sinks; ingest paths write to the production tables)")
+
+    async def run_target(base_url: str) -> dict:
+        latencies = []
+        statuses = {}
+        queue = asyncio.Queue()
+        for _ in range(args.requests):
+            queue.put_nowait(None)
+
+        async def client_loop(client):
+            while not queue.empty():
+                queue.get_nowait()
+                started = time.perf_counter()
+                try:
+                    response = await client.get(args.path)
+                    status = response.status_code
+                except httpx.HTTPError as e:
+                    status = type(e).__name__
+                latencies.append(time.perf_counter() - started)
+                statuses[status] = statuses.get(status, 0) + 1
+
+        async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout) as client:
+            started = time.perf_counter()
+            await asyncio.gather(*(client_loop(client) for _ in range(args.concurrency)))
+            elapsed = time.perf_counter() - started
+        latencies.sort()
+        return {
+            "ok": statuses.get(200, 0),
+            "statuses": statuses,
+            "p50": latencies[len(latencies) // 2],
+            "p95": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+            "max": latencies[-1],
+            "rps": len(latencies) / elapsed,
+        }
+
+    results = {}
+    for target in args.target:
+        name, _, url = target.partition("=")
+        print(f"🚀 {name}: {args.requests} x GET {url}{args.path} ({args.concurrency} concurrent)")
+        results[name] = asyncio.run(run_target(url))
+
+    print(f"\n{'target':<12}{'ok':>6}{'p50 s':>9}{'p95 s':>9}{'max s':>9}{'req/s':>9}  statuses")
+    for name, result in results.items():
+        print(f"{name:<12}{result['ok']:>6}{result['p50']:>9.2f}{result['p95']:>9.2f}{result['max']:>9.2f}"
+              f"{result['rps']:>9.2f}  {result['statuses']}")
+
+
+BENCHMARKS = {
+    "strategies": bench_strategies,
+    "batching": bench_batching,
+    "codec": bench_codec,
+    "memory": bench_memory,
+    "keyset": bench_keyset,
+    "pool": bench_pool,
+    "loadtest": bench_loadtest,
+}
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description="Ingest pipeline benchmarks")
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS))
+    parser.add_argument("--date", help="Archived day to use (YYYY-MM-DD)")
+    parser.add_argument("--rows", type=int, default=100_000, help="Synthetic payload size")
+    parser.add_argument("--rtt-ms", type=float, default=150, help="Assumed insertAll round trip (modeled batching)")
+    parser.add_argument("--table", help="Scratch table for a measured batching run (rows are inserted)")
+    parser.add_argument("--days", type=int, default=1, help="Days covered by the synthetic payload")
+    parser.add_argument("--workers", type=int, default=0, help="Pool size (default: one per CPU)")
+    parser.add_argument("--target", action="append", help="NAME=BASE_URL of a deployment (repeatable)")
+    parser.add_argument("--path", default=None, help="Request path for loadtest (required)")
+    parser.add_argument("--requests", type=int, default=40, help="Requests per target")
+    parser.add_argument("--concurrency", type=int, default=20, help="Concurrent clients per target")
+    parser.add_argument("--timeout", type=float, default=600, help="Per-request timeout (seconds)")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = _parse_args()
+    BENCHMARKS[args.benchmark](args)
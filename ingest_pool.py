@@ -0,0 +1,173 @@
+"""
+Process pool for the CPU-bound part of ingest: normalization and hashing.
+
+normalize_row and the md5 business-key / content hashes are pure Python and
+used to run on one core. At PARALLEL_MIN_ROWS rows and above the work is
+split into chunks of PARALLEL_CHUNK_ROWS and run in worker processes:
+
+- API rows: a worker normalizes and hashes its chunk and builds the columnar
+  OrderBatch for it; only Arrow IPC bytes and digest arrays come back
+- existing BigQuery rows: a worker decodes TO_JSON_STRING text and returns
+  digest arrays only
+
+Chunks travel to the workers as marshal bytes: API rows are JSON-shaped, and
+marshal encodes them about 3x faster than pickle. Smaller runs (most
+incremental fetches) stay in-process. Workers are started with forkserver
+and import order_rows / order_batch / key_set, never main.py.
+"""
+import marshal
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import json_codec
+import key_set
+from order_batch import OrderBatch
+from order_rows import get_row_content_digest, get_row_hash_digest, normalize_row
+
+PARALLEL_MIN_ROWS = int(os.getenv("PARALLEL_MIN_ROWS", "50000"))
+PARALLEL_CHUNK_ROWS = int(os.getenv("PARALLEL_CHUNK_ROWS", "20000"))
+# Rows normalized and pivoted at a time within a process (bounds the peak)
+BUILD_CHUNK_ROWS = int(os.getenv("BUILD_CHUNK_ROWS", "5000"))
+# 0 = one worker per CPU; 1 disables the pool
+PARALLEL_WORKERS = int(os.getenv("PARALLEL_WORKERS", "0")) or (os.cpu_count() or 1)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Shared worker pool, started on first use (None when PARALLEL_WORKERS < 2)."""
+    global _pool
+    if PARALLEL_WORKERS < 2:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            context = multiprocessing.get_context("forkserver")
+            _pool = ProcessPoolExecutor(max_workers=PARALLEL_WORKERS, mp_context=context)
+            print(f"🧮 Started ingest pool with {PARALLEL_WORKERS} worker processes")
+        return _pool
+
+
+def shutdown():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
+
+
+def _build(rows: list, normalize=normalize_row) -> OrderBatch:
+    """
+    Normalize, hash and pivot rows in this process.
+
+    Rows are handled BUILD_CHUNK_ROWS at a time, so only one chunk of
+    normalized dicts is alive next to the input rows and the Arrow chunks
+    built so far; the chunks are stacked at the end.
+    """
+    parts = [_build_part(chunk, normalize) for chunk in _chunks(rows, BUILD_CHUNK_ROWS)]
+    if len(parts) == 1:
+        return parts[0]
+    if not parts:
+        return _build_part([], normalize)
+    return OrderBatch.concat(parts)
+
+
+def _build_part(rows: list, normalize=normalize_row) -> OrderBatch:
+    normalized = [normalize(row) for row in rows]
+    key_digests = key_set.digests_to_array([get_row_hash_digest(row) for row in normalized])
+    content_values = key_set.digest_values([get_row_content_digest(row) for row in normalized])
+    batch = OrderBatch.from_rows(normalized)
+    batch.key_digests = key_digests
+    batch.content_values = content_values
+    return batch
+
+
+def _build_chunk(payload: bytes, normalize=normalize_row) -> tuple:
+    """Worker side of build_batch."""
+    batch = _build(marshal.loads(payload), normalize)
+    return batch.to_ipc(), batch.key_digests, batch.content_values
+
+
+def _chunks(items, size: int):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _map_chunks(pool, func, chunks, *args):
+    """
+    Run func(chunk, *args) over marshalled chunks in the pool; results in
+    input order. args must be picklable (module-level functions, partials).
+
+    At most two chunks per worker are in flight, so neither the input nor
+    the encoded chunks are ever held in memory as a whole.
+    """
+    in_flight = deque()
+    for chunk in chunks:
+        in_flight.append(pool.submit(func, marshal.dumps(chunk), *args))
+        if len(in_flight) >= 2 * PARALLEL_WORKERS:
+            yield in_flight.popleft().result()
+    while in_flight:
+        yield in_flight.popleft().result()
+
+
+def build_batch(rows, normalize=normalize_row) -> OrderBatch:
+    """Raw API rows -> OrderBatch with key digests and content hashes attached."""
+    rows = rows if isinstance(rows, list) else list(rows)
+    pool = get_pool() if len(rows) >= PARALLEL_MIN_ROWS else None
+    if pool is None:
+        return _build(rows, normalize)
+
+    try:
+        parts = [
+            OrderBatch.from_ipc(*part)
+            for part in _map_chunks(pool, _build_chunk, _chunks(rows, PARALLEL_CHUNK_ROWS), normalize)
+        ]
+    except Exception as e:
+        print(f"⚠️ Ingest pool failed ({type(e).__name__}: {e}), normalizing in-process")
+        shutdown()
+        return _build(rows, normalize)
+    return OrderBatch.concat(parts)
+
+
+def _hash_json_chunk(row_jsons, normalize=normalize_row) -> tuple:
+    """(key digests, content hashes, rows read) for TO_JSON_STRING rows."""
+    if isinstance(row_jsons, bytes):
+        row_jsons = marshal.loads(row_jsons)
+    key_digests = []
+    content_digests = []
+    for text in row_jsons:
+        # Parse BigQuery JSON, normalize it, then hash using business key
+        # This ensures same order item gets same hash even if timestamps differ
+        try:
+            row = normalize(json_codec.loads(text))
+            key_digests.append(get_row_hash_digest(row))
+            content_digests.append(get_row_content_digest(row))
+        except Exception as e:
+            # If parsing fails, skip this row (it is not treated as existing)
+            print(f"⚠️ Warning: Could not parse row from BigQuery: {e}")
+    return key_set.digests_to_array(key_digests), key_set.digest_values(content_digests), len(row_jsons)
+
+
+def hash_existing_rows(row_jsons, total_rows: int = None, normalize=normalize_row):
+    """
+    Yield (key digests, content hashes, rows read) per chunk of existing rows.
+
+    row_jsons is consumed lazily, so the BigQuery result is never held in
+    memory as a whole.
+    """
+    chunks = _chunks(row_jsons, PARALLEL_CHUNK_ROWS)
+    pool = get_pool() if (total_rows or 0) >= PARALLEL_MIN_ROWS else None
+    if pool is None:
+        for chunk in chunks:
+            yield _hash_json_chunk(chunk, normalize)
+        return
+    yield from _map_chunks(pool, _hash_json_chunk, chunks, normalize)
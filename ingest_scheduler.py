@@ -0,0 +1,253 @@
+"""
+In-process adaptive ingest scheduler.
+
+Replaces the external Cloud Scheduler jobs (see SCHEDULE_GUIDE.md) with a
+background thread inside the ingest service:
+
+- morning:   08:05, today 00:00-08:00 (mode=morning)
+- incremental: 08:10-23:55, today (mode=incremental), adaptive interval
+- final:     23:59, today (mode=incremental)
+- catch-up:  00:30, yesterday's full day (late-arriving orders)
+
+The incremental interval follows the observed new-row rate: it backs off
+while fetches insert nothing and tightens during order peaks.
+
+Only one gunicorn worker runs the scheduler (file lock); its state is written
+to SCHEDULER_STATE_FILE so /schedule can be answered by any worker.
+
+The lock file lives on the container's own filesystem, so it only elects a
+leader within one instance: every instance of a scaled-out service would
+run its own scheduler and repeat the same fetches. Deploy the service with
+a single instance (Cloud Run: --min-instances=1 --max-instances=1).
+"""
+import collections
+import datetime as dt
+import fcntl
+import json
+import os
+import threading
+import time
+
+# === CONFIG ===
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "0") == "1"
+SCHEDULER_LOCK_FILE = os.getenv("SCHEDULER_LOCK_FILE", "/tmp/ingest_scheduler.lock")
+SCHEDULER_STATE_FILE = os.getenv("SCHEDULER_STATE_FILE", "/tmp/ingest_scheduler_state.json")
+
+TZ = dt.timezone(dt.timedelta(hours=3))  # Europe/Istanbul = UTC+3
+MORNING_AT = dt.time(8, 5)
+INCREMENTAL_START = dt.time(8, 10)
+INCREMENTAL_END = dt.time(23, 55)
+FINAL_AT = dt.time(23, 59)
+CATCHUP_AT = dt.time(0, 30)
+# Fixed jobs missed by more than this (e.g. service was down) are skipped;
+# the next incremental fetch covers the whole day anyway
+MISSED_JOB_GRACE = dt.timedelta(hours=1)
+
+BASE_INTERVAL_MIN = float(os.getenv("SCHEDULER_BASE_INTERVAL_MIN", "5"))
+MIN_INTERVAL_MIN = float(os.getenv("SCHEDULER_MIN_INTERVAL_MIN", "2"))
+MAX_INTERVAL_MIN = float(os.getenv("SCHEDULER_MAX_INTERVAL_MIN", "30"))
+PEAK_ROWS_PER_MIN = float(os.getenv("SCHEDULER_PEAK_ROWS_PER_MIN", "20"))
+BACKOFF_FACTOR = 1.5
+RATE_SMOOTHING = 0.5  # EWMA weight of the latest observation
+DECISION_HISTORY = 50
+
+
+def next_interval(interval_min: float, rate_ewma: float, inserted_rows: int) -> tuple:
+    """
+    Adapt the incremental interval to the observed new-row rate.
+
+    Returns (new_interval_minutes, reason).
+    """
+    if inserted_rows == 0:
+        return min(MAX_INTERVAL_MIN, interval_min * BACKOFF_FACTOR), "no new rows, backing off"
+    if rate_ewma >= PEAK_ROWS_PER_MIN:
+        return max(MIN_INTERVAL_MIN, interval_min / 2), f"peak ({rate_ewma:.1f} rows/min)"
+    if interval_min > BASE_INTERVAL_MIN:
+        return max(BASE_INTERVAL_MIN, interval_min / BACKOFF_FACTOR), "new rows, returning to base"
+    return min(BASE_INTERVAL_MIN, interval_min * BACKOFF_FACTOR), "steady"
+
+
+class AdaptiveScheduler:
+    """Background scheduler calling run_fetch(mode=..., date=...) -> (body, status)."""
+
+    def __init__(self, run_fetch):
+        self.run_fetch = run_fetch
+        self.interval_min = BASE_INTERVAL_MIN
+        self.rate_ewma = 0.0
+        self.last_incremental_at = None
+        self.done = set()  # (job, date) pairs already run or skipped
+        self.next_job = None
+        self.decisions = collections.deque(maxlen=DECISION_HISTORY)
+        self.is_leader = False
+        self._lock_handle = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    # --- scheduling ---
+    def _fixed_jobs(self, now: dt.datetime) -> list:
+        today = now.date()
+        yesterday = today - dt.timedelta(days=1)
+        return [
+            ("catchup", dt.datetime.combine(today, CATCHUP_AT, TZ), {"mode": "incremental", "date": yesterday.isoformat()}),
+            ("morning", dt.datetime.combine(today, MORNING_AT, TZ), {"mode": "morning", "date": today.isoformat()}),
+            ("final", dt.datetime.combine(today, FINAL_AT, TZ), {"mode": "incremental", "date": today.isoformat()}),
+        ]
+
+    def plan(self, now: dt.datetime) -> tuple:
+        """Return the next (job, due_at, fetch_kwargs) from `now`."""
+        candidates = []
+        for job, due_at, kwargs in self._fixed_jobs(now):
+            key = (job, due_at.date().isoformat())
+            if key in self.done:
+                continue
+            if now - due_at > MISSED_JOB_GRACE:
+                self.done.add(key)
+                self._record(now, job, kwargs, None, "missed, skipped")
+                continue
+            candidates.append((due_at, job, kwargs))
+
+        window_start = dt.datetime.combine(now.date(), INCREMENTAL_START, TZ)
+        window_end = dt.datetime.combine(now.date(), INCREMENTAL_END, TZ)
+        if self.last_incremental_at:
+            due_at = self.last_incremental_at + dt.timedelta(minutes=self.interval_min)
+        else:
+            due_at = now
+        due_at = max(due_at, window_start)
+        if due_at > window_end:
+            # Window is over for today; start again tomorrow morning
+            due_at = window_start + dt.timedelta(days=1)
+        candidates.append((due_at, "incremental", {"mode": "incremental", "date": due_at.date().isoformat()}))
+
+        # Tomorrow's fixed jobs when today's are all done
+        tomorrow = dt.datetime.combine(now.date() + dt.timedelta(days=1), dt.time(0, 0), TZ)
+        for job, due_at, kwargs in self._fixed_jobs(tomorrow):
+            candidates.append((due_at, job, kwargs))
+
+        due_at, job, kwargs = min(candidates, key=lambda c: c[0])
+        return job, due_at, kwargs
+
+    def run_job(self, job: str, kwargs: dict, now: dt.datetime, due_at: dt.datetime) -> dict:
+        """Run one job and adapt the incremental interval from its result."""
+        started = time.time()
+        try:
+            body, status = self.run_fetch(**kwargs)
+        except Exception as e:
+            body, status = {"error": str(e)}, 500
+        elapsed = round(time.time() - started, 2)
+
+        inserted = (body.get("bq_status") or {}).get("inserted_rows", 0) if status == 200 else None
+        if job in ("catchup", "morning", "final"):
+            self.done.add((job, due_at.date().isoformat()))
+            reason = "fixed job"
+        elif status != 200:
+            self.interval_min = BASE_INTERVAL_MIN
+            reason = f"fetch failed ({status}), reset to base"
+        else:
+            if self.last_incremental_at:
+                minutes = max((now - self.last_incremental_at).total_seconds() / 60, 1e-6)
+                rate = inserted / minutes
+                self.rate_ewma = RATE_SMOOTHING * rate + (1 - RATE_SMOOTHING) * self.rate_ewma
+            self.interval_min, reason = next_interval(self.interval_min, self.rate_ewma, inserted)
+        if job in ("incremental", "final"):
+            self.last_incremental_at = now
+
+        return self._record(now, job, kwargs, {
+            "status": status,
+            "row_count": body.get("row_count"),
+            "inserted_rows": inserted,
+            "seconds": elapsed,
+            "error": body.get("error"),
+        }, reason)
+
+    def _record(self, now, job, kwargs, result, reason) -> dict:
+        decision = {
+            "at": now.isoformat(),
+            "job": job,
+            **kwargs,
+            "result": result,
+            "reason": reason,
+            "interval_min": round(self.interval_min, 2),
+            "rate_rows_per_min": round(self.rate_ewma, 2),
+        }
+        self.decisions.append(decision)
+        return decision
+
+    # --- thread / leader election ---
+    def _try_lock(self) -> bool:
+        handle = open(SCHEDULER_LOCK_FILE, "a")
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            handle.close()
+            return False
+        self._lock_handle = handle
+        return True
+
+    def _loop(self):
+        while not self._stop.is_set() and not self._try_lock():
+            self._stop.wait(60)
+        self.is_leader = True
+        print(f"⏰ Ingest scheduler started (pid {os.getpid()})")
+
+        while not self._stop.is_set():
+            now = dt.datetime.now(TZ)
+            job, due_at, kwargs = self.plan(now)
+            self.next_job = {"job": job, "due_at": due_at.isoformat(), **kwargs}
+            self._save_state()
+            wait_seconds = (due_at - now).total_seconds()
+            if wait_seconds > 0:
+                # Wake up at least every minute so the plan stays fresh
+                self._stop.wait(min(wait_seconds, 60))
+                continue
+            decision = self.run_job(job, kwargs, now, due_at)
+            print(f"⏰ Scheduler ran {job} {kwargs.get('date')}: {decision['reason']} "
+                  f"(next interval {decision['interval_min']} min)")
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="ingest-scheduler", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    # --- state ---
+    def snapshot(self) -> dict:
+        return {
+            "enabled": True,
+            "leader_pid": os.getpid(),
+            "next_job": self.next_job,
+            "interval_min": round(self.interval_min, 2),
+            "rate_rows_per_min": round(self.rate_ewma, 2),
+            "last_incremental_at": self.last_incremental_at.isoformat() if self.last_incremental_at else None,
+            "config": {
+                "base_interval_min": BASE_INTERVAL_MIN,
+                "min_interval_min": MIN_INTERVAL_MIN,
+                "max_interval_min": MAX_INTERVAL_MIN,
+                "peak_rows_per_min": PEAK_ROWS_PER_MIN,
+                "morning_at": MORNING_AT.isoformat("minutes"),
+                "incremental_window": f"{INCREMENTAL_START.isoformat('minutes')}-{INCREMENTAL_END.isoformat('minutes')}",
+                "final_at": FINAL_AT.isoformat("minutes"),
+                "catchup_at": CATCHUP_AT.isoformat("minutes"),
+            },
+            "decisions": list(self.decisions),
+        }
+
+    def _save_state(self):
+        try:
+            tmp_path = f"{SCHEDULER_STATE_FILE}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self.snapshot(), f)
+            os.replace(tmp_path, SCHEDULER_STATE_FILE)
+        except Exception as e:
+            print(f"⚠️ Warning: Could not save scheduler state: {e}")
+
+    def read_state(self) -> dict:
+        """Scheduler state as seen from any worker."""
+        if self.is_leader:
+            return self.snapshot()
+        try:
+            with open(SCHEDULER_STATE_FILE) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"enabled": SCHEDULER_ENABLED, "next_job": None, "decisions": []}
@@ -0,0 +1,96 @@
+"""
+insertAll request packing for the streaming ingest path.
+
+Rows are serialized once (json_codec) and packed into requests by encoded
+size; the encoded rows are then sent as they are. The BigQuery client is
+passed in, so packing can be used (and benchmarked) without credentials.
+"""
+import os
+import uuid
+
+from google.cloud import bigquery
+
+import json_codec
+
+# Streaming insert batches are packed by encoded size, capped by row count
+MAX_BATCH_ROWS = int(os.getenv("MAX_BATCH_ROWS", "10000"))  # insertAll allows 50,000
+MAX_BATCH_BYTES = int(os.getenv("MAX_BATCH_BYTES", str(8 * 1024 * 1024)))  # insertAll request limit is 10 MB
+# Pre-encoded insertAll requests use the client's private _call_api, checked
+# against these google-cloud-bigquery major versions; other versions (or
+# RAW_INSERT_ALL=0) use the public insert_rows_json instead
+RAW_INSERT_ALL = os.getenv("RAW_INSERT_ALL", "1") == "1"
+RAW_INSERT_ALL_VERSIONS = ("3",)
+
+# insertAll request framing around the encoded rows
+REQUEST_ENVELOPE_BYTES = len(b'{"rows":[]}')
+ROW_ENVELOPE_BYTES = len(b'{"insertId":"00000000-0000-0000-0000-000000000000","json":},')
+
+_raw_insert_all = RAW_INSERT_ALL and bigquery.__version__.split(".")[0] in RAW_INSERT_ALL_VERSIONS
+
+
+def pack_batches(rows, max_rows: int = None, max_bytes: int = None):
+    """
+    Serialize each row once and pack the encoded rows into insertAll batches.
+
+    Yields (encoded_rows, request_bytes). A batch closes when the next row
+    would exceed max_bytes or max_rows; a single oversized row goes alone.
+    """
+    max_rows = max_rows or MAX_BATCH_ROWS
+    max_bytes = max_bytes or MAX_BATCH_BYTES
+    batch = []
+    batch_bytes = REQUEST_ENVELOPE_BYTES
+    for row in rows:
+        encoded = json_codec.dumps_bytes(row)
+        size = len(encoded) + ROW_ENVELOPE_BYTES
+        if batch and (len(batch) >= max_rows or batch_bytes + size > max_bytes):
+            yield batch, batch_bytes
+            batch = []
+            batch_bytes = REQUEST_ENVELOPE_BYTES
+        batch.append(encoded)
+        batch_bytes += size
+    if batch:
+        yield batch, batch_bytes
+
+
+def insert_encoded_rows(client, table_id: str, encoded_rows: list) -> list:
+    """
+    Stream pre-encoded JSON rows (bytes) via tabledata.insertAll.
+
+    Equivalent to client.insert_rows_json, but sends the rows as already
+    encoded by pack_batches instead of serializing them a second time.
+    Returns insert errors in the same format as insert_rows_json.
+    """
+    global _raw_insert_all
+    if _raw_insert_all and callable(getattr(client, "_call_api", None)):
+        try:
+            return _insert_encoded_rows_raw(client, table_id, encoded_rows)
+        except TypeError as e:
+            # The private signature changed: use the public API from now on
+            print(f"⚠️ Warning: Raw insertAll unavailable, using insert_rows_json: {e}")
+            _raw_insert_all = False
+    return client.insert_rows_json(table_id, [json_codec.loads(encoded) for encoded in encoded_rows])
+
+
+def _insert_encoded_rows_raw(client, table_id: str, encoded_rows: list) -> list:
+    project, dataset, table = table_id.split(".")
+    body = b"".join([
+        b'{"rows":[',
+        b",".join(
+            b'{"insertId":"' + str(uuid.uuid4()).encode() + b'","json":' + encoded + b"}"
+            for encoded in encoded_rows
+        ),
+        b"]}",
+    ])
+    # Every row carries an insertId, so the request is safe to retry
+    response = client._call_api(
+        bigquery.DEFAULT_RETRY,
+        span_name="BigQuery.insertRowsJson",
+        method="POST",
+        path=f"/projects/{project}/datasets/{dataset}/tables/{table}/insertAll",
+        data=body,
+        content_type="application/json",
+    )
+    return [
+        {"index": int(error["index"]), "errors": error["errors"]}
+        for error in response.get("insertErrors", ())
+    ]
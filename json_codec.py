@@ -0,0 +1,55 @@
+"""
+JSON codec for the ingest path.
+
+Uses orjson when it is installed and falls back to the stdlib json module.
+
+hash_dumps() always produces exactly what
+json.dumps(obj, sort_keys=True, ensure_ascii=False) produces, on every
+backend: row hash keys already stored in BigQuery depend on those bytes.
+"""
+import json
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on the environment
+    orjson = None
+
+BACKEND = "orjson" if orjson is not None else "json"
+
+# json.dumps() builds a new encoder on every call when options are passed;
+# reusing one instance gives the same output without that overhead
+_hash_encoder = json.JSONEncoder(sort_keys=True, ensure_ascii=False)
+
+
+def hash_dumps(obj) -> str:
+    """Stable encoding for hash keys (byte-identical to the stdlib format)."""
+    return _hash_encoder.encode(obj)
+
+
+if orjson is not None:
+
+    def loads(data):
+        """Decode JSON from str or bytes."""
+        return orjson.loads(data)
+
+    def dumps_bytes(obj) -> bytes:
+        """Compact UTF-8 JSON."""
+        return orjson.dumps(obj)
+
+    def dumps(obj, sort_keys: bool = False) -> str:
+        """Compact JSON text."""
+        return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS if sort_keys else 0).decode("utf-8")
+
+else:
+
+    def loads(data):
+        """Decode JSON from str or bytes."""
+        return json.loads(data)
+
+    def dumps_bytes(obj) -> bytes:
+        """Compact UTF-8 JSON."""
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    def dumps(obj, sort_keys: bool = False) -> str:
+        """Compact JSON text."""
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), sort_keys=sort_keys)
@@ -0,0 +1,143 @@
+"""
+Compact membership structures for row keys (md5 business-key digests).
+
+Month payloads used to keep millions of 32-character hex strings in Python
+sets. Here keys are 16-byte digests held as pairs of uint64:
+
+- first_occurrences(): in-batch dedup with one vectorized unique pass
+- RowKeySet: Bloom filter in front of sorted digest arrays; Bloom negatives
+  are final (no false negatives), Bloom positives are confirmed exactly
+"""
+import math
+
+import numpy as np
+
+DEFAULT_EXPECTED_KEYS = 1_000_000
+DEFAULT_FP_RATE = 0.01
+
+
+def digests_to_array(digests: list) -> np.ndarray:
+    """16-byte digests (bytes) -> (n, 2) uint64 array [hi, lo]."""
+    if not digests:
+        return np.empty((0, 2), dtype=np.uint64)
+    return np.frombuffer(b"".join(digests), dtype=">u8").astype(np.uint64).reshape(-1, 2)
+
+
+def digest_values(digests: list) -> np.ndarray:
+    """16-byte digests -> uint64 of their first 8 bytes (change detection)."""
+    return np.frombuffer(b"".join(d[:8] for d in digests), dtype=">u8").astype(np.uint64)
+
+
+def digest_hex(digest: np.ndarray) -> str:
+    """One [hi, lo] row back to the 32-character hex key."""
+    return digest.astype(">u8").tobytes().hex()
+
+
+def first_occurrences(digests: np.ndarray) -> np.ndarray:
+    """Positions of the first occurrence of every distinct key, in input order."""
+    if len(digests) == 0:
+        return np.empty(0, dtype=np.int64)
+    keyed = np.ascontiguousarray(digests).view(np.dtype((np.void, 16))).ravel()
+    _, positions = np.unique(keyed, return_index=True)
+    return np.sort(positions)
+
+
+class RowKeySet:
+    """
+    Set of row keys with an optional uint64 value per key.
+
+    Keys are added in bulk (add_many) and queried in bulk (lookup). Memory is
+    about 24 bytes per key plus ~1.2 bytes per expected key for the filter.
+    """
+
+    def __init__(self, expected_keys: int = None, fp_rate: float = DEFAULT_FP_RATE):
+        if expected_keys is None:
+            expected_keys = DEFAULT_EXPECTED_KEYS
+        expected_keys = max(expected_keys, 1024)
+        bits = math.ceil(-expected_keys * math.log(fp_rate) / math.log(2) ** 2)
+        self._bit_count = np.uint64(bits)
+        self._hash_count = max(1, round(bits / expected_keys * math.log(2)))
+        self._words = np.zeros((bits + 63) // 64, dtype=np.uint64)
+        self._chunks = []  # (digests, values) added since the last compaction
+        self._hi = np.empty(0, dtype=np.uint64)
+        self._lo = np.empty(0, dtype=np.uint64)
+        self._values = np.empty(0, dtype=np.uint64)
+
+    def __len__(self) -> int:
+        return len(self._hi) + sum(len(chunk) for chunk, _ in self._chunks)
+
+    @property
+    def nbytes(self) -> int:
+        pending = sum(d.nbytes + v.nbytes for d, v in self._chunks)
+        return self._words.nbytes + self._hi.nbytes + self._lo.nbytes + self._values.nbytes + pending
+
+    def _bit_positions(self, digests: np.ndarray) -> np.ndarray:
+        # Double hashing over the digest halves (md5 is already uniform)
+        hi = digests[:, 0]
+        lo = digests[:, 1] | np.uint64(1)
+        steps = np.arange(self._hash_count, dtype=np.uint64)
+        with np.errstate(over="ignore"):
+            return (hi[:, None] + steps[None, :] * lo[:, None]) % self._bit_count
+
+    def add_many(self, digests: np.ndarray, values: np.ndarray = None):
+        """Add (n, 2) uint64 digests, with optional uint64 values."""
+        if len(digests) == 0:
+            return
+        if values is None:
+            values = np.zeros(len(digests), dtype=np.uint64)
+        positions = self._bit_positions(digests).ravel()
+        np.bitwise_or.at(
+            self._words, positions >> np.uint64(6), np.uint64(1) << (positions & np.uint64(63))
+        )
+        self._chunks.append((np.ascontiguousarray(digests), np.asarray(values, dtype=np.uint64)))
+
+    def _compact(self):
+        if not self._chunks:
+            return
+        digests = np.concatenate([np.column_stack([self._hi, self._lo])] + [d for d, _ in self._chunks])
+        values = np.concatenate([self._values] + [v for _, v in self._chunks])
+        self._chunks = []
+        order = np.lexsort((digests[:, 1], digests[:, 0]))
+        self._hi = np.ascontiguousarray(digests[order, 0])
+        self._lo = np.ascontiguousarray(digests[order, 1])
+        self._values = values[order]
+
+    def might_contain(self, digests: np.ndarray) -> np.ndarray:
+        """Bloom filter stage: False is definitive, True needs confirmation."""
+        positions = self._bit_positions(digests)
+        bits = (self._words[positions >> np.uint64(6)] >> (positions & np.uint64(63))) & np.uint64(1)
+        return bits.all(axis=1)
+
+    def lookup(self, digests: np.ndarray) -> tuple:
+        """
+        Exact membership for (n, 2) digests.
+
+        Returns (found: bool array, values: uint64 array, 0 where not found).
+        """
+        found = np.zeros(len(digests), dtype=bool)
+        values = np.zeros(len(digests), dtype=np.uint64)
+        if len(digests) == 0 or len(self) == 0:
+            return found, values
+
+        self._compact()
+        candidates = np.flatnonzero(self.might_contain(digests))
+        if len(candidates) == 0:
+            return found, values
+
+        # Sorted needles keep searchsorted cache-friendly
+        candidates = candidates[np.argsort(digests[candidates, 0], kind="stable")]
+        hi = digests[candidates, 0]
+        lo = digests[candidates, 1]
+        index = np.searchsorted(self._hi, hi, side="left")
+        last = len(self._hi) - 1
+        active = np.ones(len(candidates), dtype=bool)
+        while active.any():
+            # Walk runs of equal high words (almost always length 0 or 1)
+            clipped = np.minimum(index, last)
+            active &= (index <= last) & (self._hi[clipped] == hi)
+            match = active & (self._lo[clipped] == lo)
+            found[candidates[match]] = True
+            values[candidates[match]] = self._values[clipped[match]]
+            active &= ~match
+            index += 1
+        return found, values
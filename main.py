@@ -7,10 +7,38 @@ import time
 import gc
 import sys  # noqa: F401  # kept in case of future use
 import resource
-import hashlib
-import json
+import io
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from google.cloud import bigquery
 
+import dead_letter
+import dimension_catalog
+import enrichment
+import file_ingest
+import ingest_pool
+import ingest_scheduler
+import insert_batches
+import json_codec
+import key_set
+import order_rollups
+import payload_archive
+import sinks
+from insert_batches import pack_batches
+from order_batch import OrderBatch
+from order_rows import (  # noqa: F401  # re-exported for scripts using main.*
+    CONTENT_FIELDS,
+    HASH_FIELDS,
+    get_row_content_digest,
+    get_row_content_hash,
+    get_row_hash_digest,
+    get_row_hash_key,
+    normalize_row,
+    project_row,
+)
+
 app = Flask(__name__)
 
 # === CONFIG ===
@@ -20,10 +48,31 @@ TABLE = "order_items_clean_v3_enriched_partitioned_clustered"
 API_URL = "https://apiorders.tazecicek.com/api/order-items/by-period"
 API_USER = os.getenv("API_USER")
 API_PASS = os.getenv("API_PASSWORD")
-BATCH_SIZE = 2000  # RAM-friendly batch size
+# Rows rejected only because another row failed ('stopped') or by a transient
+# error are re-sent; anything else goes to the dead-letter store
+RETRYABLE_INSERT_REASONS = {"stopped", "backendError", "internalError", "timeout"}
+INSERT_RETRY_LIMIT = 3
+# insertAll requests sent in parallel per ingest run (1 = one after another)
+INSERT_CONCURRENCY = max(1, int(os.getenv("INSERT_CONCURRENCY", "1")))
+# Ingest strategy: 'stream' (Python dedup + streaming insert) or
+# 'merge' (staging table load + server-side MERGE)
+INGEST_STRATEGY = os.getenv("INGEST_STRATEGY", "stream")
+# Per-run staging tables expire on their own if a run dies before cleanup
+STAGING_TABLE_TTL_HOURS = 6
+# Stored copies of a batch's rows are looked up by order day (the delivery
+# date can change, see stored_rows_filter), in the delivery-date partitions
+# up to this many days after the order day
+DELIVERY_DATE_WINDOW_DAYS = int(os.getenv("DELIVERY_DATE_WINDOW_DAYS", "60"))
+# Order-day column of the sink tables, in order of preference
+ORDER_DAY_COLUMNS = ("order_created_date_tr", "order_created_date")
+# Keep a compressed copy of every API payload for replay (see payload_archive.py);
+# on by default only when the archive is on durable storage
+ARCHIVE_ENABLED = os.getenv("ARCHIVE_ENABLED", "1" if payload_archive.ARCHIVE_DURABLE else "0") == "1"
 
 # Metadata table for tracking last fetch timestamp
 METADATA_TABLE = f"{PROJECT_ID}.{DATASET}.fetch_metadata"
+# Per-sink outcome of every fetch (append-only, see record_sink_progress)
+SINK_PROGRESS_TABLE = f"{PROJECT_ID}.{DATASET}.fetch_sink_progress"
 
 # BigQuery client with location specified
 bq_client = bigquery.Client(project=PROJECT_ID, location="europe-west3")
@@ -96,100 +145,127 @@ def update_last_fetch_timestamp(date: str, timestamp: dt.datetime):
     except Exception as e:
         print(f"Warning: Could not update last fetch timestamp: {e}")
 
-def normalize_row(row: dict) -> dict:
-    """Simplify Turkish characters, convert additional_products list to string, and map column names."""
-    clean = {}
-    for k, v in row.items():
-        key = (
-            k.replace("ğ", "g")
-            .replace("ü", "u")
-            .replace("ş", "s")
-            .replace("ı", "i")
-            .replace("ö", "o")
-            .replace("ç", "c")
-        )
-        # Map order_created_date to order_created_date_tr for enriched table
-        if key == "order_created_date":
-            key = "order_created_date_tr"
-            # Convert datetime string to date format (YYYY-MM-DD) if needed
-            if isinstance(v, str) and "T" in v:
-                v = v.split("T")[0]  # Extract date part only
-        
-        # Convert delivery dates from TIMESTAMP to DATE (YYYY-MM-DD only)
-        if key in ["order_delivery_date", "requested_delivery_date"]:
-            if isinstance(v, str) and "T" in v:
-                v = v.split("T")[0]  # Extract date part only
-        
-        if key == "additional_products" and isinstance(v, list):
-            clean[key] = ", ".join(map(str, v))
-        else:
-            clean[key] = v
-    return clean
 
+def insert_encoded_rows(table_id: str, encoded_rows: list) -> list:
+    """Stream rows encoded by pack_batches (see insert_batches.py)."""
+    return insert_batches.insert_encoded_rows(bq_client, table_id, encoded_rows)
 
-def get_row_hash_key(row: dict) -> str:
+
+def _is_duplicate_error(errors: list) -> bool:
+    message = str((errors or [{}])[0].get("message", "")).lower()
+    return "duplicate" in message or "already exists" in message
+
+
+def insert_batch_with_retries(table_id: str, encoded_rows: list) -> dict:
     """
-    Create a hash based on business key fields only (not timestamps).
-    This ensures same order item gets same hash even if timestamps differ.
-    
-    NOTE: order_code is NOT included in hash because it's added later.
-    Including it would cause duplicates when backfilling old data.
-    """
-    # Fields that define a unique order item (business key)
-    # Exclude timestamps and other auto-generated fields
-    # Exclude order_code (it's derived from order_id, adding it causes duplicate issues)
-    hash_fields = [
-        'order_id',
-        'product_code_1',
-        'user_id',
-        'city',
-        'district',
-        'neighborhood',
-        'delivery_location_type',
-        'vendor_id',
-        'rider_id',
-        'additional_products',
-        'product_name',
-        'order_created_date_tr',
-        # Add other core fields but NOT timestamps or order_code
-    ]
-    
-    hash_dict = {}
-    for field in hash_fields:
-        if field in row:
-            hash_dict[field] = row[field]
-    
-    # Create deterministic hash
-    hash_json = json.dumps(hash_dict, sort_keys=True, ensure_ascii=False)
-    return hashlib.md5(hash_json.encode('utf-8')).hexdigest()
+    Insert one packed batch, retrying the rows that were not at fault.
+
+    insertAll rejects the whole request when any row is invalid: the bad rows
+    carry their own error and every other row is reported as 'stopped'.
+    Stopped (and transiently failed) rows are re-sent without the bad ones.
+    Returns {"inserted", "duplicates", "rejected": [(row, errors)]}.
+    """
+    inserted = 0
+    duplicates = 0
+    rejected = []
+    pending = encoded_rows
+    for attempt in range(INSERT_RETRY_LIMIT + 1):
+        errors = {error["index"]: error["errors"] for error in insert_encoded_rows(table_id, pending)}
+        retry = []
+        for index, encoded in enumerate(pending):
+            row_errors = errors.get(index)
+            if not row_errors:
+                inserted += 1
+            elif _is_duplicate_error(row_errors):
+                duplicates += 1
+            elif all(e.get("reason") in RETRYABLE_INSERT_REASONS for e in row_errors):
+                retry.append((encoded, row_errors))
+            else:
+                rejected.append((json_codec.loads(encoded), row_errors))
+        if not retry:
+            break
+        if attempt == INSERT_RETRY_LIMIT:
+            rejected.extend((json_codec.loads(encoded), row_errors) for encoded, row_errors in retry)
+            break
+        print(f"🔁 Retrying {len(retry)} rows ({len(rejected)} rejected so far)")
+        pending = [encoded for encoded, _ in retry]
+        time.sleep(0.5 * (attempt + 1))
+    return {"inserted": inserted, "duplicates": duplicates, "rejected": rejected}
+
+
+def sink_table_id(sink: sinks.Sink) -> str:
+    return f"{PROJECT_ID}.{DATASET}.{sink.table}"
+
 
+def sink_normalizer(sink: sinks.Sink):
+    """Row mapping for a sink, restricted to its table's columns if configured."""
+    if not sink.schema_columns_only:
+        return sink.normalize
+    columns = frozenset(field.name for field in get_table_schema(sink_table_id(sink)))
+    # A partial of module-level functions, so pool workers can unpickle it
+    return partial(project_row, normalize=sink.normalize, columns=columns)
 
-def insert_to_bigquery(rows: list) -> dict:
+
+def table_normalizer(table_id: str = None):
+    """Row mapping of the sink writing to table_id (normalize_row for other tables)."""
+    for sink in sinks.SINKS.values():
+        if table_id == sink_table_id(sink):
+            return sink_normalizer(sink)
+    return normalize_row
+
+
+def to_order_batch(rows, normalize=normalize_row) -> OrderBatch:
+    """
+    Normalize raw API rows into a columnar OrderBatch (batches pass through).
+
+    Row hashes are computed on the way in; large payloads are split across
+    the ingest_pool worker processes.
+    """
+    if isinstance(rows, OrderBatch):
+        return rows
+    return ingest_pool.build_batch(rows, normalize)
+
+
+def get_batch_key_digests(batch: OrderBatch):
+    """Business key digests of a batch as an (n, 2) uint64 array (see key_set)."""
+    if batch.key_digests is not None:
+        return batch.key_digests
+    return key_set.digests_to_array(
+        [get_row_hash_digest(row) for row in batch.iter_rows(columns=HASH_FIELDS)]
+    )
+
+
+def get_batch_content_values(batch: OrderBatch):
+    """Content hash of every row in a batch, truncated to uint64 (see key_set)."""
+    if batch.content_values is not None:
+        return batch.content_values
+    return key_set.digest_values(
+        [get_row_content_digest(row) for row in batch.iter_rows(columns=CONTENT_FIELDS)]
+    )
+
+
+def insert_to_bigquery(rows, table_id: str = None) -> dict:
     """Insert data into BigQuery in batches. Uses MERGE to prevent exact duplicate rows."""
     if not rows:
         return {"inserted_rows": 0, "status": "empty"}
 
-    table_id = f"{PROJECT_ID}.{DATASET}.{TABLE}"
+    table_id = table_id or f"{PROJECT_ID}.{DATASET}.{TABLE}"
+    normalize = table_normalizer(table_id)
     total_inserted = 0
     skipped_duplicates = 0
 
+    # Rows travel as a columnar batch; dicts are rebuilt only when writing
+    batch = to_order_batch(rows, normalize)
+    # Business keys as packed 16-byte digests, not hex strings (see key_set.py)
+    row_digests = get_batch_key_digests(batch)
+
     # First, remove exact duplicates from the input data
     # This prevents inserting the same row multiple times in one batch
     # Use business key hash (order_id + product + user, etc.) not full row
-    seen_hashes = set()
-    unique_rows = []
-    for row in rows:
-        normalized = normalize_row(row)
-        # Use business key hash instead of full row hash
-        # This ignores timestamps that may differ between API calls
-        row_hash = get_row_hash_key(normalized)
-        if row_hash not in seen_hashes:
-            seen_hashes.add(row_hash)
-            unique_rows.append(normalized)
-        else:
-            skipped_duplicates += 1
+    unique_positions = key_set.first_occurrences(row_digests)
+    skipped_duplicates += len(row_digests) - len(unique_positions)
     
-    if not unique_rows:
+    if len(unique_positions) == 0:
         return {
             "inserted_rows": 0,
             "skipped_duplicates": skipped_duplicates,
@@ -198,18 +274,19 @@ def insert_to_bigquery(rows: list) -> dict:
 
     # Check for existing data for the date range to avoid re-inserting
     # Extract dates from the data (use order_delivery_date as partition field)
-    delivery_dates_in_batch = set()
-    for row in unique_rows:
-        if "order_delivery_date" in row and row["order_delivery_date"]:
-            delivery_dates_in_batch.add(row["order_delivery_date"])
+    delivery_dates_in_batch = set(batch.column("order_delivery_date")) - {None, ""}
+    table_columns = {field.name for field in get_table_schema(table_id)}
+    order_days = batch_order_days(batch, order_day_column(table_columns))
     
     # If we have dates, check if data already exists in BigQuery
     # Important: Parse BigQuery JSON and normalize it to match our format
-    existing_hashes = set()
-    if delivery_dates_in_batch:
+    # Business key digest -> content hash of the stored row
+    existing_keys = None
+    row_count = 0
+    if delivery_dates_in_batch or order_days:
         try:
-            # Use order_delivery_date (partition field) for optimal query performance
-            date_filter = " OR ".join([f"order_delivery_date = '{d}'" for d in delivery_dates_in_batch])
+            # Order days and the delivery-date partitions their rows can be in
+            date_filter = stored_rows_filter("t", table_columns, delivery_dates_in_batch, order_days)
             # Optimize: Use clustering and partitioning for faster queries
             # Also add timeout configuration
             job_config = bigquery.QueryJobConfig(
@@ -221,23 +298,19 @@ def insert_to_bigquery(rows: list) -> dict:
             FROM `{table_id}` t
             WHERE {date_filter}
             """
-            print(f"🔍 Checking existing data for delivery dates: {', '.join(delivery_dates_in_batch)}")
+            print(f"🔍 Checking existing data for order days: {', '.join(sorted(order_days))} "
+                  f"(delivery dates: {', '.join(sorted(delivery_dates_in_batch))})")
             result = bq_client.query(query, job_config=job_config).result()
+            existing_keys = key_set.RowKeySet(expected_keys=result.total_rows)
             row_count = 0
-            for row in result:
-                row_count += 1
-                # Parse BigQuery JSON, normalize it, then hash using business key
-                # This ensures same order item gets same hash even if timestamps differ
-                try:
-                    bq_row_dict = json.loads(row.row_json)
-                    normalized_bq_row = normalize_row(bq_row_dict)
-                    # Use business key hash instead of full row hash
-                    row_hash = get_row_hash_key(normalized_bq_row)
-                    existing_hashes.add(row_hash)
-                except (json.JSONDecodeError, Exception) as e:
-                    # If parsing fails, skip this row (don't add to existing_hashes)
-                    print(f"⚠️ Warning: Could not parse row from BigQuery: {e}")
-            print(f"✅ Found {row_count:,} existing rows in BigQuery ({len(existing_hashes):,} unique hashes)")
+            # Decoded, normalized and hashed in chunks (in worker processes for large results)
+            for key_digests, content_values, rows_read in ingest_pool.hash_existing_rows(
+                (row.row_json for row in result), result.total_rows, normalize
+            ):
+                row_count += rows_read
+                existing_keys.add_many(key_digests, content_values)
+            print(f"✅ Found {row_count:,} existing rows in BigQuery "
+                  f"({len(existing_keys):,} keys, {existing_keys.nbytes / 1024 ** 2:.1f} MB key set)")
         except Exception as e:
             # If query fails, proceed with insert (might be permissions or schema issue)
             print(f"⚠️ Warning: Could not check existing data: {e}")
@@ -246,24 +319,30 @@ def insert_to_bigquery(rows: list) -> dict:
             print(f"   Traceback: {traceback.format_exc()}")
             print(f"   ⚠️ Proceeding without duplicate check - duplicates may be inserted!")
 
-    # Filter out rows that already exist in BigQuery
-    new_rows = []
-    duplicate_examples = []  # For debugging
-    
-    for row in unique_rows:
-        # Use business key hash (same method as BigQuery comparison above)
-        row_hash = get_row_hash_key(row)
-        if row_hash not in existing_hashes:
-            new_rows.append(row)
-        else:
-            skipped_duplicates += 1
-            # Log first few duplicates for debugging
-            if len(duplicate_examples) < 3:
-                duplicate_examples.append({
-                    "order_id": row.get("order_id"),
-                    "hash": row_hash[:16],
-                    "sample": str(row)[:100]
-                })
+    # Filter out rows that already exist in BigQuery; existing rows whose
+    # mutable fields changed go to the update path instead
+    # Bloom filter first, exact digest check only for its positive hits
+    if existing_keys is not None and len(existing_keys):
+        found, stored_content = existing_keys.lookup(row_digests[unique_positions])
+        content_values = get_batch_content_values(batch)[unique_positions]
+        changed = found & (stored_content != content_values)
+        new_positions = unique_positions[~found].tolist()
+        changed_positions = unique_positions[changed].tolist()
+        existing_positions = unique_positions[found & ~changed]
+        del found, stored_content, content_values, changed
+    else:
+        new_positions = unique_positions.tolist()
+        changed_positions = []
+        existing_positions = unique_positions[:0]
+    existing_keys = None
+    skipped_duplicates += len(existing_positions)
+    # Log first few duplicates for debugging
+    duplicate_positions = existing_positions[:3].tolist()
+    duplicate_examples = [
+        {"order_id": row.get("order_id"), "hash": key_set.digest_hex(row_digests[position])[:16],
+         "sample": str(row)[:100]}
+        for position, row in zip(duplicate_positions, batch.take(duplicate_positions).iter_rows())
+    ]
     
     # Debug logging
     if skipped_duplicates > 0:
@@ -271,42 +350,65 @@ def insert_to_bigquery(rows: list) -> dict:
         if duplicate_examples:
             print(f"   Sample duplicates: {duplicate_examples}")
 
-    if not new_rows:
+    update_result = None
+    if changed_positions:
+        print(f"✏️ {len(changed_positions)} existing rows have changed {', '.join(CONTENT_FIELDS)}")
+        changed_rows_batch = batch.take(changed_positions)
+        update_result = update_changed_rows(
+            changed_rows_batch, table_id, delivery_dates_in_batch,
+            batch_order_days(changed_rows_batch, order_day_column(table_columns)),
+        )
+        del changed_rows_batch
+
+    if not new_positions:
         return {
             "inserted_rows": 0,
             "skipped_duplicates": skipped_duplicates,
             "status": "all_existing",
+            "update": update_result,
         }
 
-    # Insert remaining unique rows
-    for i in range(0, len(new_rows), BATCH_SIZE):
-        batch = new_rows[i : i + BATCH_SIZE]
-        
-        # Insert directly - BigQuery will handle schema mismatches
-        errors = bq_client.insert_rows_json(table_id, batch)
-        
-        if errors:
-            # Check if errors are just duplicates (safe to skip)
-            # or actual schema/data issues (should raise)
-            has_critical_error = False
-            for error in errors:
-                error_msg = str(error.get("errors", [{}])[0].get("message", "")).lower()
-                # Skip duplicate errors but raise on other issues
-                if "duplicate" not in error_msg and "already exists" not in error_msg:
-                    has_critical_error = True
-                    break
-            
-            if has_critical_error:
-                raise Exception(f"Batch {i // BATCH_SIZE + 1} failed: {errors[:2]}")
-            else:
-                # Duplicate errors - count skipped rows
-                skipped_duplicates += len([e for e in errors if e.get("errors")])
-        else:
-            total_inserted += len(batch)
+    new_rows = batch.take(new_positions)
+    del batch, row_digests, unique_positions, existing_positions, new_positions
 
-        batch.clear()
-        gc.collect()
-        time.sleep(0.5)
+    # Insert remaining unique rows (JSON encoding happens only here);
+    # up to INSERT_CONCURRENCY insertAll requests are in flight at once
+    dead_lettered = 0
+    batch_stats = {"batches": 0, "rows": 0, "bytes": 0, "max_batch_rows": 0, "max_batch_bytes": 0}
+
+    def finish(batch_no: int, future):
+        nonlocal total_inserted, skipped_duplicates, dead_lettered
+        result = future.result()
+        total_inserted += result["inserted"]
+        skipped_duplicates += result["duplicates"]
+        if result["rejected"]:
+            dead_lettered += len(result["rejected"])
+            stored = dead_letter.record(table_id, [
+                (get_row_hash_key(row), row, errors) for row, errors in result["rejected"]
+            ])
+            print(f"☠️ Batch {batch_no}: {len(result['rejected'])} rows rejected "
+                  f"({stored} new in the dead-letter store), e.g. "
+                  f"{dead_letter.error_reason(result['rejected'][0][1])}")
+
+    in_flight = deque()
+    with ThreadPoolExecutor(max_workers=INSERT_CONCURRENCY) as insert_pool:
+        for batch_no, (batch, batch_bytes) in enumerate(pack_batches(new_rows.iter_rows()), start=1):
+            batch_stats["batches"] += 1
+            batch_stats["rows"] += len(batch)
+            batch_stats["bytes"] += batch_bytes
+            batch_stats["max_batch_rows"] = max(batch_stats["max_batch_rows"], len(batch))
+            batch_stats["max_batch_bytes"] = max(batch_stats["max_batch_bytes"], batch_bytes)
+
+            # Insert directly; rows BigQuery rejects go to the dead-letter store
+            in_flight.append((batch_no, insert_pool.submit(insert_batch_with_retries, table_id, batch)))
+            del batch
+            if len(in_flight) >= INSERT_CONCURRENCY:
+                finish(*in_flight.popleft())
+                gc.collect()
+                if INSERT_CONCURRENCY == 1:
+                    time.sleep(0.5)
+        while in_flight:
+            finish(*in_flight.popleft())
 
     # Visibility check
     try:
@@ -320,18 +422,538 @@ def insert_to_bigquery(rows: list) -> dict:
         "skipped_duplicates": skipped_duplicates,
         "status": "success",
         "verified_visible_rows": visible_count,
+        "existing_rows_checked": row_count,
+        "dead_lettered_rows": dead_lettered,
+        "batch_stats": batch_stats,
+        "update": update_result,
     }
 
 
+_table_schemas = {}
+
+
+def get_table_schema(table_id: str) -> list:
+    """Schema of a BigQuery table, cached for the lifetime of the process."""
+    if table_id not in _table_schemas:
+        _table_schemas[table_id] = bq_client.get_table(table_id).schema
+    return _table_schemas[table_id]
+
+
+def staging_table_id(table_id: str) -> str:
+    project, dataset, table = table_id.split(".")
+    return f"{project}.{dataset}._staging_{table}_{uuid.uuid4().hex[:12]}"
+
+
+def create_staging_table(staging_id: str, schema: list):
+    """Create a staging table that expires on its own after STAGING_TABLE_TTL_HOURS."""
+    staging_table = bigquery.Table(staging_id, schema=schema)
+    staging_table.expires = dt.datetime.now(dt.timezone.utc) + dt.timedelta(hours=STAGING_TABLE_TTL_HOURS)
+    bq_client.create_table(staging_table)
+
+
+def load_encoded_rows(table_id: str, schema: list, encoded_rows: list, append: bool = False):
+    """Load NDJSON-encoded rows into a table with one load job."""
+    load_job = bq_client.load_table_from_file(
+        io.BytesIO(b"\n".join(encoded_rows)),
+        table_id,
+        job_config=bigquery.LoadJobConfig(
+            source_format=bigquery.SourceFormat.NEWLINE_DELIMITED_JSON,
+            schema=schema,
+            write_disposition=(
+                bigquery.WriteDisposition.WRITE_APPEND if append else bigquery.WriteDisposition.WRITE_TRUNCATE
+            ),
+        ),
+    )
+    return load_job.result()
+
+
+def load_staging_table(staging_id: str, schema: list, encoded_rows: list):
+    """Create a self-expiring staging table and load NDJSON rows into it."""
+    create_staging_table(staging_id, schema)
+    load_encoded_rows(staging_id, schema, encoded_rows)
+
+
+def order_day_column(columns) -> str:
+    """The order-day column of a table (None if it has none)."""
+    return next((column for column in ORDER_DAY_COLUMNS if column in columns), None)
+
+
+def batch_order_days(batch: OrderBatch, column: str) -> set:
+    """Distinct order days (YYYY-MM-DD) of a batch."""
+    if not column:
+        return set()
+    return {str(value)[:10] for value in batch.column(column) if value not in (None, "")}
+
+
+def stored_rows_filter(alias: str, columns: set, delivery_dates: set, order_days: set = None) -> str:
+    """
+    SQL filter on `alias` for the stored copies of a batch's rows.
+
+    order_delivery_date is a content field, so a stored copy may sit in
+    another delivery-date partition than the new row. With the batch's order
+    days (part of the business key, never changed) the copies are looked up
+    by order day, in the NULL partition and the partitions from the earliest
+    order day to DELIVERY_DATE_WINDOW_DAYS after the latest one. Without
+    order days only the batch's own delivery dates are searched.
+    """
+    dates = sorted(d for d in delivery_dates if d)
+    column = order_day_column(columns)
+    if not (order_days and column):
+        conditions = []
+        if dates:
+            conditions.append(f"{alias}.order_delivery_date IN ({', '.join(f'DATE {d!r}' for d in dates)})")
+        if None in delivery_dates:
+            conditions.append(f"{alias}.order_delivery_date IS NULL")
+        return f"({' OR '.join(conditions)})" if conditions else "FALSE"
+    days = sorted(order_days)
+    day_filter = f"DATE({alias}.{column}) IN ({', '.join(f'DATE {d!r}' for d in days)})"
+    if "order_delivery_date" not in columns:
+        return day_filter
+    first = min([days[0]] + dates)
+    last = max([(dt.date.fromisoformat(days[-1]) + dt.timedelta(days=DELIVERY_DATE_WINDOW_DAYS)).isoformat()]
+               + dates)
+    return (f"{day_filter} AND ({alias}.order_delivery_date IS NULL "
+            f"OR {alias}.order_delivery_date BETWEEN DATE '{first}' AND DATE '{last}')")
+
+
+def _merge_conditions(columns: set, delivery_dates: set, order_days: set = None) -> tuple:
+    """(partition_filter, key_match, content_changed) SQL fragments for T/S MERGEs."""
+    # Match on the business key with NULL-safe comparison; the partition
+    # filter restricts the target scan (see stored_rows_filter)
+    key_match = "\n            AND ".join(
+        f"T.{field} IS NOT DISTINCT FROM S.{field}"
+        for field in HASH_FIELDS if field in columns
+    )
+    partition_filter = stored_rows_filter("T", columns, delivery_dates, order_days)
+    content_changed = " OR ".join(
+        f"T.{field} IS DISTINCT FROM S.{field}"
+        for field in CONTENT_FIELDS if field in columns
+    ) or "FALSE"
+    return partition_filter, key_match, content_changed
+
+
+def moved_delivery_dates(table_id: str, source: str, columns: set, partition_filter: str, key_match: str) -> set:
+    """
+    Stored delivery dates of the rows whose delivery date the staged rows
+    (source) change, read before the MERGE moves them. Their rollup rows need
+    a refresh as well; only computed for the rollups' source table.
+    """
+    if table_id != order_rollups.SOURCE_TABLE or not order_rollups.ROLLUPS_ENABLED:
+        return set()
+    if "order_delivery_date" not in columns:
+        return set()
+    rows = bq_client.query(f"""
+    SELECT DISTINCT T.order_delivery_date AS day
+    FROM `{table_id}` T
+    JOIN {source} S
+    ON {partition_filter} AND {key_match}
+    WHERE T.order_delivery_date IS DISTINCT FROM S.order_delivery_date
+    """).result()
+    return {None if row["day"] is None else str(row["day"])[:10] for row in rows}
+
+
+def date_list(dates: set) -> list:
+    """Dates for a JSON result, None (NULL partition) last."""
+    return sorted(d for d in dates if d) + ([None] if None in dates else [])
+
+
+def _is_streaming_buffer_error(error: Exception) -> bool:
+    return "streaming buffer" in str(error).lower()
+
+
+def update_changed_rows(batch: OrderBatch, table_id: str, delivery_dates: set, order_days: set = None) -> dict:
+    """
+    Apply changed CONTENT_FIELDS of already-ingested rows in one partition-scoped MERGE.
+
+    Rows still in the streaming buffer cannot be updated by DML yet; in that
+    case the update is deferred and the next run picks the change up again.
+    """
+    if not len(batch):
+        return {"updated_rows": 0, "status": "empty"}
+
+    schema = get_table_schema(table_id)
+    fields = set(HASH_FIELDS) | set(CONTENT_FIELDS)
+    staging_schema = [field for field in schema if field.name in fields]
+    columns = {field.name for field in staging_schema}
+    encoded_rows = [
+        json_codec.dumps_bytes(row)
+        for row in batch.iter_rows(columns=[field.name for field in staging_schema])
+    ]
+    partition_filter, key_match, content_changed = _merge_conditions(columns, delivery_dates, order_days)
+    updates = ",\n                ".join(
+        f"{field} = S.{field}" for field in CONTENT_FIELDS if field in columns
+    )
+
+    staging_id = staging_table_id(table_id)
+    try:
+        load_staging_table(staging_id, staging_schema, encoded_rows)
+        moved_from = moved_delivery_dates(table_id, f"`{staging_id}`", columns, partition_filter, key_match)
+        update_query = f"""
+        MERGE `{table_id}` T
+        USING `{staging_id}` S
+        ON {partition_filter} AND {key_match}
+        WHEN MATCHED AND ({content_changed}) THEN
+            UPDATE SET
+                {updates}
+        """
+        print(f"✏️ Updating {len(encoded_rows):,} changed rows in {table_id}")
+        update_job = bq_client.query(update_query)
+        update_job.result()
+    except Exception as e:
+        if not _is_streaming_buffer_error(e):
+            raise
+        print(f"⚠️ Update deferred, rows still in streaming buffer: {e}")
+        return {"updated_rows": 0, "deferred_rows": len(encoded_rows), "status": "deferred"}
+    finally:
+        bq_client.delete_table(staging_id, not_found_ok=True)
+
+    return {
+        "updated_rows": update_job.num_dml_affected_rows or 0,
+        "status": "success",
+        "bytes_processed": update_job.total_bytes_processed,
+        "moved_from_dates": date_list(moved_from),
+    }
+
+
+def merge_staging_table(table_id: str, staging_id: str, columns: set, delivery_dates: set,
+                        order_column: str = None, order_days: set = None) -> tuple:
+    """
+    MERGE a staging table (target columns plus row_key) into table_id.
+
+    Rows sharing a row_key are merged once (the first by order_column, if
+    given, which is not copied). Returns (merge_job, updates_deferred,
+    moved_from): moved_from are the old delivery dates of the rows whose
+    delivery date changed (see moved_delivery_dates).
+    """
+    partition_filter, key_match, content_changed = _merge_conditions(columns, delivery_dates, order_days)
+    updates = ", ".join(f"{field} = S.{field}" for field in CONTENT_FIELDS if field in columns)
+    update_clause = f"""
+        WHEN MATCHED AND ({content_changed}) THEN
+            UPDATE SET {updates}""" if updates else ""
+    excluded = "row_key" + (f", {order_column}" if order_column else "")
+    order_by = f" ORDER BY {order_column}" if order_column else ""
+
+    def merge_query(with_updates: bool) -> str:
+        return f"""
+        MERGE `{table_id}` T
+        USING (
+            SELECT * EXCEPT({excluded})
+            FROM `{staging_id}`
+            QUALIFY ROW_NUMBER() OVER (PARTITION BY row_key{order_by}) = 1
+        ) S
+        ON {partition_filter} AND {key_match}{update_clause if with_updates else ""}
+        WHEN NOT MATCHED THEN
+            INSERT ROW
+        """
+
+    moved_from = moved_delivery_dates(table_id, f"`{staging_id}`", columns, partition_filter, key_match)
+    try:
+        merge_job = bq_client.query(merge_query(with_updates=True))
+        merge_job.result()
+        return merge_job, False, moved_from
+    except Exception as e:
+        # Matched rows still in the streaming buffer (stream strategy)
+        # cannot be updated yet: insert now, update on a later run
+        if not (update_clause and _is_streaming_buffer_error(e)):
+            raise
+        print(f"⚠️ Updates deferred, rows still in streaming buffer: {e}")
+        merge_job = bq_client.query(merge_query(with_updates=False))
+        merge_job.result()
+        # Deferred updates moved nothing yet
+        return merge_job, True, set()
+
+
+def merge_counts(merge_job) -> tuple:
+    """(inserted, updated) rows of a finished MERGE job."""
+    dml_stats = merge_job.dml_stats
+    inserted = dml_stats.inserted_row_count if dml_stats else (merge_job.num_dml_affected_rows or 0)
+    updated = dml_stats.updated_row_count if dml_stats else 0
+    return inserted, updated
+
+
+def merge_to_bigquery(rows, table_id: str = None) -> dict:
+    """
+    Insert data with server-side dedup instead of downloading existing rows.
+
+    The batch is loaded into a per-run staging table (target schema plus a
+    computed row_key), then a single MERGE inserts the rows whose business key
+    is not yet stored (looked up by order day, see stored_rows_filter) and
+    updates the CONTENT_FIELDS of matched rows whose values changed.
+    """
+    if not rows:
+        return {"inserted_rows": 0, "status": "empty"}
+
+    table_id = table_id or f"{PROJECT_ID}.{DATASET}.{TABLE}"
+    schema = get_table_schema(table_id)
+    columns = {field.name for field in schema}
+
+    # Dedup inside the batch locally (cheap, no existing rows involved)
+    batch = to_order_batch(rows, table_normalizer(table_id))
+    row_digests = get_batch_key_digests(batch)
+    unique_positions = key_set.first_occurrences(row_digests)
+    skipped_duplicates = len(row_digests) - len(unique_positions)
+    delivery_dates_in_batch = set(batch.column("order_delivery_date")) - {None, ""}
+    order_days = batch_order_days(batch, order_day_column(columns))
+    staged_rows = [
+        json_codec.dumps_bytes({**row, "row_key": key_set.digest_hex(digest)})
+        for row, digest in zip(
+            batch.take(unique_positions).iter_rows(columns=sorted(columns)),
+            row_digests[unique_positions],
+        )
+    ]
+    del batch, row_digests, unique_positions
+
+    staging_id = staging_table_id(table_id)
+    staged_count = len(staged_rows)
+
+    try:
+        load_staging_table(
+            staging_id, list(schema) + [bigquery.SchemaField("row_key", "STRING")], staged_rows
+        )
+        staged_rows.clear()
+        gc.collect()
+        print(f"🔀 Merging {staged_count:,} staged rows into {table_id} "
+              f"(partitions: {', '.join(sorted(delivery_dates_in_batch)) or 'none'})")
+        merge_job, updates_deferred, moved_from = merge_staging_table(
+            table_id, staging_id, columns, delivery_dates_in_batch, order_days=order_days
+        )
+    finally:
+        bq_client.delete_table(staging_id, not_found_ok=True)
+
+    inserted, updated = merge_counts(merge_job)
+    return {
+        "inserted_rows": inserted,
+        "updated_rows": updated,
+        "updates_deferred": updates_deferred,
+        "skipped_duplicates": skipped_duplicates + (staged_count - inserted - updated),
+        "status": "success",
+        "strategy": "merge",
+        "bytes_processed": merge_job.total_bytes_processed,
+        "bytes_billed": merge_job.total_bytes_billed,
+        "moved_from_dates": date_list(moved_from),
+    }
+
+
+INGEST_STRATEGIES = {
+    "stream": insert_to_bigquery,
+    "merge": merge_to_bigquery,
+}
+
+
+def ingest_rows(rows, strategy: str = None, table_id: str = None) -> dict:
+    """Run the configured ingest strategy ('stream' or 'merge') on raw API rows or an OrderBatch."""
+    strategy = strategy or INGEST_STRATEGY
+    if strategy not in INGEST_STRATEGIES:
+        raise ValueError(f"Unknown ingest strategy: {strategy}")
+    table_id = table_id or f"{PROJECT_ID}.{DATASET}.{TABLE}"
+    if not rows:
+        return INGEST_STRATEGIES[strategy](rows, table_id=table_id)
+    batch = to_order_batch(rows, table_normalizer(table_id))
+    del rows
+    # None stays in: rows without a delivery date have rollup rows as well
+    delivery_dates = set(batch.column("order_delivery_date")) - {""}
+    dimension_values = (
+        dimension_catalog.batch_values(batch) if table_id == dimension_catalog.SOURCE_TABLE else {}
+    )
+    result = INGEST_STRATEGIES[strategy](batch, table_id=table_id)
+    refresh_rollups(table_id, result, delivery_dates | moved_from_dates(result))
+    refresh_dimension_catalog(table_id, result, dimension_values)
+    return result
+
+
+def changed_rows(result: dict) -> int:
+    """Rows an ingest strategy inserted or updated."""
+    return result.get("inserted_rows", 0) + result.get("updated_rows", 0) + (
+        (result.get("update") or {}).get("updated_rows", 0)
+    )
+
+
+def moved_from_dates(result: dict) -> set:
+    """Old delivery dates of the rows an ingest strategy moved to another delivery date."""
+    return set(result.get("moved_from_dates") or []) | set(
+        (result.get("update") or {}).get("moved_from_dates") or []
+    )
+
+
+def refresh_rollups(table_id: str, result: dict, delivery_dates: set):
+    """
+    Bring the dashboard rollups (order_rollups.py) up to date after a write
+    to their source table. A failed refresh does not fail the write; it is
+    reported in result["rollups"] with the delivery dates left stale, which
+    backfill.py refreshes again and /fetch callers can repair with
+    `order_rollups.py rebuild`.
+    """
+    if not order_rollups.ROLLUPS_ENABLED or table_id != order_rollups.SOURCE_TABLE:
+        return
+    if not changed_rows(result):
+        return
+    try:
+        result["rollups"] = order_rollups.refresh_delivery_dates(bq_client, delivery_dates)
+        print(f"📊 Refreshed dashboard rollups for {len(delivery_dates)} delivery dates")
+    except Exception as e:
+        print(f"⚠️ Warning: Could not refresh dashboard rollups: {e}")
+        result["rollups"] = {
+            "status": "error",
+            "error": str(e),
+            "delivery_dates": order_rollups.delivery_date_list(delivery_dates),
+        }
+
+
+def refresh_dimension_catalog(table_id: str, result: dict, dimension_values: dict):
+    """
+    Add the new filter values of a write (dimension_catalog.py). A failed
+    update is only reported: the next batch with the same values, or
+    `dimension_catalog.py rebuild`, adds them.
+    """
+    if not dimension_catalog.CATALOG_ENABLED or table_id != dimension_catalog.SOURCE_TABLE:
+        return
+    if not dimension_values or not changed_rows(result):
+        return
+    try:
+        result["dimension_catalog"] = dimension_catalog.add_batch_values(bq_client, dimension_values)
+        if result["dimension_catalog"]["status"] == "success":
+            print(f"🗂️ Added {result['dimension_catalog']['new_values']} new values to the dimension catalog")
+    except Exception as e:
+        print(f"⚠️ Warning: Could not update the dimension catalog: {e}")
+        result["dimension_catalog"] = {"status": "error", "error": str(e)}
+
+
+def build_sink_batches(rows, sink_names: list) -> dict:
+    """
+    One OrderBatch per sink from a single parsed payload, each mapped with
+    the sink's normalization. A sink whose batch cannot be built maps to its
+    error result instead.
+    """
+    batches = {}
+    for name in sink_names:
+        try:
+            batches[name] = enrich_sink_batch(to_order_batch(rows, sink_normalizer(sinks.SINKS[name])), name)
+        except Exception as e:
+            print(f"⚠️ Sink {name}: could not build batch: {e}")
+            batches[name] = {"status": "error", "error": str(e)}
+    return batches
+
+
+def enrich_sink_batch(batch: OrderBatch, sink_name: str) -> OrderBatch:
+    """
+    Join the configured dimensions into a sink's batch (see enrichment.py).
+
+    Only columns the sink table has are added. A failed dimension lookup
+    fails the sink: rows written without their attributes would stay that way.
+    """
+    sink = sinks.SINKS[sink_name]
+    names = enrichment.parse_enrichments()
+    if not sink.enrich or not names:
+        return batch
+    columns = {field.name for field in get_table_schema(sink_table_id(sink))}
+    return enrichment.enrich_batch(batch, bq_client, names, target_columns=columns)
+
+
+def write_sink_batches(batches: dict, strategy: str = None, fetch_key: str = None, row_count: int = 0) -> dict:
+    """
+    Write each sink's batch; a failing sink does not stop the others.
+
+    Every sink's outcome is recorded in SINK_PROGRESS_TABLE when fetch_key is
+    given. Returns {sink name: result}.
+    """
+    results = {}
+    for name in list(batches):
+        result = batches.pop(name)  # an error result if the batch could not be built
+        if isinstance(result, OrderBatch):
+            try:
+                result = ingest_rows(result, strategy, table_id=sink_table_id(sinks.SINKS[name]))
+            except Exception as e:
+                print(f"⚠️ Sink {name} failed: {e}")
+                result = {"status": "error", "error": str(e)}
+        results[name] = result
+        if fetch_key:
+            record_sink_progress(fetch_key, name, row_count, results[name])
+    return results
+
+
+def ingest_to_sinks(rows, strategy: str = None, sink_names: list = None) -> dict:
+    """Raw API rows -> every selected sink (default: INGEST_SINKS); {sink name: result}."""
+    return write_sink_batches(build_sink_batches(rows, sink_names or sinks.parse_sinks()), strategy)
+
+
+_sink_progress_table_ready = False
+
+
+def record_sink_progress(fetch_key: str, sink_name: str, row_count: int, result: dict):
+    """Append one sink's outcome for a fetch (day or month) to SINK_PROGRESS_TABLE."""
+    global _sink_progress_table_ready
+    try:
+        if not _sink_progress_table_ready:
+            bq_client.query(f"""
+            CREATE TABLE IF NOT EXISTS `{SINK_PROGRESS_TABLE}` (
+                fetch_key STRING,
+                sink STRING,
+                table_id STRING,
+                status STRING,
+                row_count INT64,
+                inserted_rows INT64,
+                updated_rows INT64,
+                error STRING,
+                recorded_at TIMESTAMP
+            )
+            """).result()
+            _sink_progress_table_ready = True
+
+        job_config = bigquery.QueryJobConfig(query_parameters=[
+            bigquery.ScalarQueryParameter("fetch_key", "STRING", fetch_key),
+            bigquery.ScalarQueryParameter("sink", "STRING", sink_name),
+            bigquery.ScalarQueryParameter("table_id", "STRING", sink_table_id(sinks.SINKS[sink_name])),
+            bigquery.ScalarQueryParameter("status", "STRING", result.get("status")),
+            bigquery.ScalarQueryParameter("row_count", "INT64", row_count),
+            bigquery.ScalarQueryParameter("inserted_rows", "INT64", result.get("inserted_rows", 0)),
+            bigquery.ScalarQueryParameter(
+                "updated_rows", "INT64", (result.get("update") or {}).get("updated_rows", result.get("updated_rows", 0))
+            ),
+            bigquery.ScalarQueryParameter("error", "STRING", result.get("error")),
+        ])
+        bq_client.query(f"""
+        INSERT INTO `{SINK_PROGRESS_TABLE}`
+            (fetch_key, sink, table_id, status, row_count, inserted_rows, updated_rows, error, recorded_at)
+        VALUES
+            (@fetch_key, @sink, @table_id, @status, @row_count, @inserted_rows, @updated_rows, @error, CURRENT_TIMESTAMP())
+        """, job_config=job_config).result()
+    except Exception as e:
+        print(f"⚠️ Warning: Could not record progress of sink {sink_name}: {e}")
+
+
+def get_sink_progress(fetch_key: str = None) -> list:
+    """Latest recorded outcome per sink (and per fetch key, unless one is given)."""
+    where = "WHERE fetch_key = @fetch_key" if fetch_key else ""
+    job_config = bigquery.QueryJobConfig(query_parameters=[
+        bigquery.ScalarQueryParameter("fetch_key", "STRING", fetch_key),
+    ])
+    query = f"""
+    SELECT *
+    FROM `{SINK_PROGRESS_TABLE}`
+    {where}
+    QUALIFY ROW_NUMBER() OVER (PARTITION BY fetch_key, sink ORDER BY recorded_at DESC) = 1
+    ORDER BY fetch_key DESC, sink
+    LIMIT 500
+    """
+    return [dict(row.items()) for row in bq_client.query(query, job_config=job_config).result()]
+
+
 # === ROUTES ===
+SERVICE_INFO = {
+    "message": "Order Items Ingest v3 (memory-safe, optimized) is running",
+    "endpoints": [
+        "/fetch?date=YYYY-MM or YYYY-MM-DD",
+        "/replay?from=YYYY-MM-DD&to=YYYY-MM-DD",
+        "/sinks?date=YYYY-MM-DD",
+        "POST /ingest-file (CSV / NDJSON / Parquet export)",
+        "/schedule",
+    ],
+}
+
+
 @app.route("/")
 def index():
-    return jsonify(
-        {
-            "message": "Order Items Ingest v3 (memory-safe, optimized) is running",
-            "endpoints": ["/fetch?date=YYYY-MM or YYYY-MM-DD"],
-        }
-    )
+    return jsonify(SERVICE_INFO)
 
 
 @app.route("/fetch")
@@ -347,13 +969,78 @@ def fetch():
     - mode: Optional. 'morning' (for 08:05 job, 00:00-08:00) or 'incremental' (for 5-min intervals)
     - start_hour: Optional. Start hour for morning mode (default: 0)
     - end_hour: Optional. End hour for morning mode (default: 8)
+    - strategy: Optional. 'stream' or 'merge' (default: INGEST_STRATEGY)
+    - sinks: Optional. Comma-separated sink tables to write (default: INGEST_SINKS)
     """
-    date = request.args.get("date")
-    days_back = request.args.get("days_back")
-    mode = request.args.get("mode", "incremental")  # 'morning' or 'incremental'
-    start_hour = int(request.args.get("start_hour", 0))  # Default: 00:00
-    end_hour = int(request.args.get("end_hour", 8))  # Default: 08:00
-    
+    strategy = request.args.get("strategy", INGEST_STRATEGY)
+    if strategy not in INGEST_STRATEGIES:
+        return jsonify({"error": f"Unknown strategy: {strategy}"}), 400
+    try:
+        sink_names = sinks.parse_sinks(request.args.get("sinks"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    body, status = run_fetch(
+        date=request.args.get("date"),
+        days_back=request.args.get("days_back"),
+        mode=request.args.get("mode", "incremental"),  # 'morning' or 'incremental'
+        start_hour=int(request.args.get("start_hour", 0)),  # Default: 00:00
+        end_hour=int(request.args.get("end_hour", 8)),  # Default: 08:00
+        strategy=strategy,
+        sink_names=sink_names,
+    )
+    return jsonify(body), status
+
+
+def run_fetch(
+    date: str = None,
+    days_back=None,
+    mode: str = "incremental",
+    start_hour: int = 0,
+    end_hour: int = 8,
+    strategy: str = None,
+    sink_names: list = None,
+) -> tuple:
+    """
+    Fetch one day/month from the API and ingest it (shared by /fetch, the
+    scheduler and backfill.py). mode='backfill' ingests the whole payload
+    without touching the incremental fetch metadata.
+
+    Returns (response_body, http_status). async_main.py runs the same steps
+    with an async HTTP client.
+    """
+    strategy = strategy or INGEST_STRATEGY
+    date = resolve_fetch_date(date, days_back, mode)
+    last_timestamp = get_incremental_timestamp(date, mode)
+
+    try:
+        content, error_body, status = fetch_payload(date)
+        if content is None:
+            return error_body, status
+
+        # Decoded straight into the call, so ingest_payload can release the dicts
+        return ingest_payload(
+            json_codec.loads(content), date, mode, start_hour, end_hour, strategy, last_timestamp, sink_names
+        )
+    except Exception as e:
+        return {"error": str(e)}, 500
+
+
+def fetch_payload(date: str) -> tuple:
+    """
+    Raw API response body of a day/month: (content, None, 200), or
+    (None, error_body, http_status) when the API call failed.
+    """
+    r = requests.post(
+        API_URL, auth=(API_USER, API_PASS), json=api_payload(date), timeout=180
+    )
+    if r.status_code != 200:
+        return None, {"error": f"API error: {r.status_code}", "body": r.text}, r.status_code
+    return r.content, None, 200
+
+
+def resolve_fetch_date(date: str = None, days_back=None, mode: str = "incremental") -> str:
+    """The day (YYYY-MM-DD) or month (YYYY-MM) a fetch covers."""
     # If no date provided, determine based on mode or days_back
     if not date:
         now = dt.datetime.now(dt.timezone(dt.timedelta(hours=3)))  # Europe/Istanbul = UTC+3
@@ -368,7 +1055,11 @@ def fetch():
         else:
             # For incremental updates (every 5 min from 08:10): fetch today's data
             date = now.strftime("%Y-%m-%d")
-    
+    return date
+
+
+def get_incremental_timestamp(date: str, mode: str):
+    """Last fetch timestamp for incremental day fetches (None otherwise)."""
     # For incremental mode, try to get last fetch timestamp to optimize API call
     last_timestamp = None
     if mode == "incremental" and len(date) == 10:  # Only for Day format
@@ -378,111 +1069,245 @@ def fetch():
             if last_timestamp.tzinfo is None:
                 last_timestamp = last_timestamp.replace(tzinfo=dt.timezone(dt.timedelta(hours=3)))
             print(f"Incremental mode: Last fetch was at {last_timestamp}")
-    
+    return last_timestamp
+
+
+def api_payload(date: str) -> dict:
     # Determine payload based on date format
     # API only supports: {"yearMonth": "2025-08"} or {"day": "2025-10-23"}
     # No timestamp filtering available, so we fetch full day/month
     # Duplicate prevention handles filtering on our side
-    payload = {"yearMonth": date} if len(date) == 7 else {"day": date}
+    return {"yearMonth": date} if len(date) == 7 else {"day": date}
 
-    try:
-        r = requests.post(
-            API_URL, auth=(API_USER, API_PASS), json=payload, timeout=180
-        )
-        if r.status_code != 200:
-            return (
-                jsonify({"error": f"API error: {r.status_code}", "body": r.text}),
-                r.status_code,
-            )
 
-        data = r.json()
-        original_data_count = len(data) if isinstance(data, list) else 0
+def ingest_payload(
+    data,
+    date: str,
+    mode: str,
+    start_hour: int,
+    end_hour: int,
+    strategy: str,
+    last_timestamp=None,
+    sink_names: list = None,
+    archive: bool = True,
+) -> tuple:
+    """
+    Archive, filter and ingest a decoded API payload into every selected sink,
+    then update the fetch metadata. Returns (response_body, http_status) like
+    run_fetch; bq_status is the primary sink's result, sinks has all of them.
+    archive=False skips the archive (retries of an already archived payload).
+    """
+    sink_names = sink_names or sinks.parse_sinks()
+    # Archive the raw payload before any filtering so it can be replayed
+    if archive and ARCHIVE_ENABLED and isinstance(data, list):
+        try:
+            archived = payload_archive.archive_payload(date, data)
+            if archived:
+                print(f"📼 Archived payload: {archived}")
+        except Exception as e:
+            print(f"⚠️ Warning: Could not archive payload: {e}")
+
+    original_data_count = len(data) if isinstance(data, list) else 0
+    
+    # Filter data for morning mode (00:00 to 08:00 today)
+    if mode == "morning" and isinstance(data, list):
+        # Recalculate now for filtering
+        now_for_filter = dt.datetime.now(dt.timezone(dt.timedelta(hours=3)))  # Europe/Istanbul = UTC+3
+        today_date = now_for_filter.date()
         
-        # Filter data for morning mode (00:00 to 08:00 today)
-        if mode == "morning" and isinstance(data, list):
-            # Recalculate now for filtering
-            now_for_filter = dt.datetime.now(dt.timezone(dt.timedelta(hours=3)))  # Europe/Istanbul = UTC+3
-            today_date = now_for_filter.date()
-            
-            # Define time range: today 00:00 to 08:00
-            start_time = now_for_filter.replace(hour=start_hour, minute=0, second=0, microsecond=0)
-            end_time = now_for_filter.replace(hour=end_hour, minute=0, second=0, microsecond=0)
+        # Define time range: today 00:00 to 08:00
+        start_time = now_for_filter.replace(hour=start_hour, minute=0, second=0, microsecond=0)
+        end_time = now_for_filter.replace(hour=end_hour, minute=0, second=0, microsecond=0)
+        
+        filtered_data = []
+        for row in data:
+            # Try to extract timestamp from various possible fields
+            timestamp_str = None
+            for field in ['order_created_date', 'order_creation_timestamp', 'created_at', 'timestamp', 'date']:
+                if field in row and row[field]:
+                    timestamp_str = row[field]
+                    break
             
-            filtered_data = []
-            for row in data:
-                # Try to extract timestamp from various possible fields
-                timestamp_str = None
-                for field in ['order_created_date', 'order_creation_timestamp', 'created_at', 'timestamp', 'date']:
-                    if field in row and row[field]:
-                        timestamp_str = row[field]
-                        break
-                
-                if timestamp_str:
-                    try:
-                        # Parse timestamp (could be ISO format or date string)
-                        if isinstance(timestamp_str, str):
-                            if 'T' in timestamp_str:
-                                row_time = dt.datetime.fromisoformat(timestamp_str.replace('Z', '+00:00'))
-                            else:
-                                # Date only, assume midnight
-                                row_time = dt.datetime.fromisoformat(timestamp_str + 'T00:00:00+03:00')
+            if timestamp_str:
+                try:
+                    # Parse timestamp (could be ISO format or date string)
+                    if isinstance(timestamp_str, str):
+                        if 'T' in timestamp_str:
+                            row_time = dt.datetime.fromisoformat(timestamp_str.replace('Z', '+00:00'))
                         else:
-                            continue
-                        
-                        # Convert to Istanbul timezone if needed
-                        if row_time.tzinfo is None:
-                            row_time = row_time.replace(tzinfo=dt.timezone(dt.timedelta(hours=3)))
-                        
-                        # Filter: keep only today 00:00 to 07:59 range
-                        row_date = row_time.date()
-                        
-                        if row_date == today_date:
-                            # Today: keep only 00:00-08:00 (before end_hour, inclusive)
-                            if start_hour <= row_time.hour < end_hour:
-                                filtered_data.append(row)
-                    except (ValueError, TypeError):
-                        # If timestamp parsing fails, include the row (safe fallback)
-                        # But only if it's today's date
-                        if 'order_created_date_tr' in row or 'order_created_date' in row:
-                            row_date_str = row.get('order_created_date_tr') or row.get('order_created_date')
-                            if row_date_str and str(row_date_str) == today_date.strftime("%Y-%m-%d"):
-                                filtered_data.append(row)
-                else:
-                    # If no timestamp found, check date field
-                    row_date_str = row.get('order_created_date_tr') or row.get('order_created_date')
-                    if row_date_str and str(row_date_str) == today_date.strftime("%Y-%m-%d"):
-                        # Include all rows for today if no timestamp (safe fallback)
-                        filtered_data.append(row)
-            
-            data = filtered_data
-            print(f"Morning mode: Filtered {original_data_count} rows to {len(data)} rows (00:00-{end_hour:02d}:00 range, inclusive)")
-        
-        result = insert_to_bigquery(data)
-        
-        # Update last fetch timestamp for incremental mode
-        if mode == "incremental" and len(date) == 10 and result.get("status") == "success":
-            current_timestamp = dt.datetime.now(dt.timezone(dt.timedelta(hours=3)))
-            update_last_fetch_timestamp(date, current_timestamp)
-        
-        response_data = {
-            "status": "ok", 
-            "mode": mode,
-            "date": date,
-            "row_count": len(data), 
-            "bq_status": result
-        }
-        
-        if mode == "morning":
-            response_data["note"] = f"Morning fetch: Coverage from {start_hour:02d}:00 to {end_hour:02d}:00 today"
-        elif mode == "incremental" and last_timestamp:
-            response_data["last_fetch"] = last_timestamp.isoformat()
-            response_data["note"] = "Incremental fetch: Only new data since last fetch will be inserted (duplicate prevention)"
+                            # Date only, assume midnight
+                            row_time = dt.datetime.fromisoformat(timestamp_str + 'T00:00:00+03:00')
+                    else:
+                        continue
+                    
+                    # Convert to Istanbul timezone if needed
+                    if row_time.tzinfo is None:
+                        row_time = row_time.replace(tzinfo=dt.timezone(dt.timedelta(hours=3)))
+                    
+                    # Filter: keep only today 00:00 to 07:59 range
+                    row_date = row_time.date()
+                    
+                    if row_date == today_date:
+                        # Today: keep only 00:00-08:00 (before end_hour, inclusive)
+                        if start_hour <= row_time.hour < end_hour:
+                            filtered_data.append(row)
+                except (ValueError, TypeError):
+                    # If timestamp parsing fails, include the row (safe fallback)
+                    # But only if it's today's date
+                    if 'order_created_date_tr' in row or 'order_created_date' in row:
+                        row_date_str = row.get('order_created_date_tr') or row.get('order_created_date')
+                        if row_date_str and str(row_date_str) == today_date.strftime("%Y-%m-%d"):
+                            filtered_data.append(row)
+            else:
+                # If no timestamp found, check date field
+                row_date_str = row.get('order_created_date_tr') or row.get('order_created_date')
+                if row_date_str and str(row_date_str) == today_date.strftime("%Y-%m-%d"):
+                    # Include all rows for today if no timestamp (safe fallback)
+                    filtered_data.append(row)
         
-        return jsonify(response_data)
+        data = filtered_data
+        print(f"Morning mode: Filtered {original_data_count} rows to {len(data)} rows (00:00-{end_hour:02d}:00 range, inclusive)")
+    
+    # Columnar from here on; the raw dicts are released before the writers run
+    row_count = len(data)
+    batches = build_sink_batches(data, sink_names)
+    del data
+    sink_results = write_sink_batches(batches, strategy, fetch_key=date, row_count=row_count)
+    del batches
+    result = sink_results.get(sinks.PRIMARY_SINK) or sink_results[sink_names[0]]
+    
+    # Update last fetch timestamp for incremental mode (driven by the primary sink)
+    primary_status = (sink_results.get(sinks.PRIMARY_SINK) or {}).get("status")
+    if mode == "incremental" and len(date) == 10 and primary_status == "success":
+        current_timestamp = dt.datetime.now(dt.timezone(dt.timedelta(hours=3)))
+        update_last_fetch_timestamp(date, current_timestamp)
+    
+    response_data = {
+        "status": "ok", 
+        "mode": mode,
+        "strategy": strategy,
+        "date": date,
+        "row_count": row_count, 
+        "bq_status": result,
+        "sinks": sink_results,
+    }
+    
+    if mode == "morning":
+        response_data["note"] = f"Morning fetch: Coverage from {start_hour:02d}:00 to {end_hour:02d}:00 today"
+    elif mode == "incremental" and last_timestamp:
+        response_data["last_fetch"] = last_timestamp.isoformat()
+        response_data["note"] = "Incremental fetch: Only new data since last fetch will be inserted (duplicate prevention)"
+    
+    return response_data, 200
+
+
+@app.route("/replay")
+def replay():
+    """
+    Re-ingest archived API payloads without calling the API.
+
+    Query parameters:
+    - from: Start date (YYYY-MM-DD)
+    - to: Optional. End date (YYYY-MM-DD), defaults to `from`
+    - strategy: Optional. 'stream' or 'merge' (default: INGEST_STRATEGY)
+    - sinks: Optional. Comma-separated sink tables to write (default: INGEST_SINKS)
+    """
+    start = request.args.get("from") or request.args.get("date")
+    end = request.args.get("to") or start
+    strategy = request.args.get("strategy", INGEST_STRATEGY)
+    if not start:
+        return jsonify({"error": "Missing 'from' parameter"}), 400
+    if strategy not in INGEST_STRATEGIES:
+        return jsonify({"error": f"Unknown strategy: {strategy}"}), 400
+    try:
+        sink_names = sinks.parse_sinks(request.args.get("sinks"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        summary = payload_archive.replay_days(
+            start, end, lambda rows: ingest_to_sinks(rows, strategy, sink_names)
+        )
+        return jsonify({"status": "ok", "from": start, "to": end, **summary})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
+@app.route("/ingest-file", methods=["POST"])
+def ingest_file():
+    """
+    Bulk-ingest an export file (see file_ingest.py).
+
+    Send the file as multipart field `file` (format from its name) or as the
+    raw request body. Query parameters:
+    - format: Optional. csv, ndjson or parquet (required for raw bodies)
+    - gzip: Optional. 1 if a raw body is gzipped
+    - sink: Optional. Target sink (default: the primary sink)
+    - chunk_rows: Optional. Rows per chunk (default: FILE_CHUNK_ROWS)
+    """
+    upload = request.files.get("file")
+    sink_name = request.args.get("sink", sinks.PRIMARY_SINK)
+    if sink_name not in sinks.SINKS:
+        return jsonify({"error": f"Unknown sink: {sink_name}"}), 400
+    try:
+        fmt, gzipped = file_ingest.upload_options(
+            upload.filename if upload else None,
+            request.args.get("format"),
+            request.args.get("gzip") == "1" if "gzip" in request.args else None,
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        if upload:
+            # Multipart uploads are already spooled to a temporary file by Werkzeug
+            result = file_ingest.ingest_file(
+                upload.stream, fmt, gzipped, sink_name, request.args.get("chunk_rows", type=int)
+            )
+        else:
+            with file_ingest.spool_upload() as body:
+                for piece in iter(lambda: request.stream.read(1024 * 1024), b""):
+                    body.write(piece)
+                body.seek(0)
+                result = file_ingest.ingest_file(
+                    body, fmt, gzipped, sink_name, request.args.get("chunk_rows", type=int)
+                )
+        return jsonify({"status": "ok", "format": fmt, "bq_status": result})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/sinks")
+def sink_progress():
+    """
+    Latest outcome per sink table.
+
+    Query parameters:
+    - date: Optional. Fetch key (YYYY-MM-DD or YYYY-MM); all recent fetches if omitted
+    """
+    try:
+        return jsonify({
+            "configured": sinks.parse_sinks(),
+            "progress": get_sink_progress(request.args.get("date")),
+        })
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/schedule")
+def schedule():
+    """Built-in scheduler state: next job, current interval and recent decisions."""
+    return jsonify(scheduler.read_state())
+
+
+# === SCHEDULER ===
+# Owns the morning / incremental / catch-up fetches when SCHEDULER_ENABLED=1
+# (never inside ingest_pool workers, which import this script as __mp_main__)
+scheduler = ingest_scheduler.AdaptiveScheduler(run_fetch)
+if ingest_scheduler.SCHEDULER_ENABLED and __name__ != "__mp_main__":
+    scheduler.start()
+
+
 # === MAIN ===
 if __name__ == "__main__":
     print("✅ Flask app starting on port 8080")
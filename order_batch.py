@@ -0,0 +1,303 @@
+"""
+Columnar in-memory batch of order rows.
+
+The ingest pipeline carries rows as an Arrow table instead of a list of
+~30-key dicts: numbers are typed arrays and low-cardinality text columns
+(city, district, vendor, status, ...) are dictionary-encoded. Rows become
+dicts again only at the writer boundary (OrderBatch.iter_rows).
+"""
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+import json_codec
+
+# Always dictionary-encoded; other text columns are encoded when their
+# distinct/total ratio is at most DICTIONARY_MAX_RATIO
+DICTIONARY_COLUMNS = {
+    "city",
+    "district",
+    "neighborhood",
+    "delivery_location_type",
+    "vendor_id",
+    "rider_id",
+    "delivery_status",
+    "payment_method",
+    "product_code_1",
+    "product_name",
+    "order_created_date_tr",
+    "order_delivery_date",
+    "requested_delivery_date",
+}
+DICTIONARY_MAX_RATIO = 0.5
+ROW_CHUNK_SIZE = 5000
+
+# Columns that do not fit a single Arrow type are stored as JSON text
+JSON_ENCODING = b"json"
+
+_MISSING = object()
+# Column name prefix carrying the missing-key masks through to_ipc()
+MISSING_PREFIX = "__missing__."
+
+
+def column_array(values: list):
+    """Build a typed Arrow array, or JSON text if the values are mixed/nested.
+
+    Returns (array, field_metadata).
+    """
+    kinds = {type(v) for v in values if v is not None}
+    if kinds <= {str}:
+        return pa.array(values, type=pa.string()), None
+    if kinds == {bool}:
+        return pa.array(values, type=pa.bool_()), None
+    if kinds == {int}:
+        try:
+            return pa.array(values, type=pa.int64()), None
+        except OverflowError:
+            pass
+    if kinds == {float}:
+        return pa.array(values, type=pa.float64()), None
+    encoded = [None if v is None else json_codec.dumps(v, sort_keys=True) for v in values]
+    return pa.array(encoded, type=pa.string()), {b"encoding": JSON_ENCODING}
+
+
+def rows_to_table(rows: list) -> pa.Table:
+    """Pivot a list of dicts into an Arrow table (missing keys become nulls)."""
+    columns = []
+    for row in rows:
+        for key in row:
+            if key not in columns:
+                columns.append(key)
+
+    fields = []
+    arrays = []
+    for name in columns:
+        array, metadata = column_array([row.get(name) for row in rows])
+        fields.append(pa.field(name, array.type, metadata=metadata))
+        arrays.append(array)
+    return pa.Table.from_arrays(arrays, schema=pa.schema(fields))
+
+
+def json_columns(schema: pa.Schema) -> set:
+    """Names of the columns stored as JSON text."""
+    return {
+        field.name for field in schema
+        if field.metadata and field.metadata.get(b"encoding") == JSON_ENCODING
+    }
+
+
+def decode_columns(record_batch: pa.RecordBatch, encoded: set = None) -> dict:
+    """Python lists per column, with JSON text columns decoded."""
+    encoded = json_columns(record_batch.schema) if encoded is None else encoded
+    columns = {}
+    for name in record_batch.schema.names:
+        values = record_batch.column(name).to_pylist()
+        if name in encoded:
+            values = [None if v is None else json_codec.loads(v) for v in values]
+        columns[name] = values
+    return columns
+
+
+class OrderBatch:
+    """Normalized order rows held column by column."""
+
+    def __init__(self, table: pa.Table, missing: dict = None, key_digests=None, content_values=None):
+        self.table = table
+        # {column: BooleanArray} for columns some rows did not have at all;
+        # kept so those rows serialize (and hash) exactly like the dicts did
+        self.missing = missing or {}
+        # Row hashes computed while building the batch (see ingest_pool):
+        # (n, 2) uint64 business key digests and uint64 content hashes
+        self.key_digests = key_digests
+        self.content_values = content_values
+
+    @classmethod
+    def from_rows(cls, rows, normalize=None) -> "OrderBatch":
+        """Build a batch from raw dicts, normalizing each row on the way in."""
+        columns = {}
+        count = 0
+        for row in rows:
+            if normalize is not None:
+                row = normalize(row)
+            for key in row:
+                if key not in columns:
+                    columns[key] = [_MISSING] * count
+            for key, values in columns.items():
+                values.append(row.get(key, _MISSING))
+            count += 1
+
+        fields = []
+        arrays = []
+        missing = {}
+        for name in list(columns):
+            values = columns.pop(name)
+            if any(v is _MISSING for v in values):
+                missing[name] = pa.array([v is _MISSING for v in values], type=pa.bool_())
+                values = [None if v is _MISSING else v for v in values]
+            array, metadata = column_array(values)
+            del values
+            if metadata is None and _should_dictionary_encode(name, array):
+                array = array.dictionary_encode()
+            fields.append(pa.field(name, array.type, metadata=metadata))
+            arrays.append(array)
+        return cls(pa.Table.from_arrays(arrays, schema=pa.schema(fields)), missing)
+
+    def __len__(self) -> int:
+        return self.table.num_rows
+
+    @property
+    def columns(self) -> list:
+        return self.table.column_names
+
+    @property
+    def nbytes(self) -> int:
+        return self.table.nbytes + sum(mask.nbytes for mask in self.missing.values())
+
+    def column(self, name: str) -> list:
+        """One column as a Python list (empty if the column does not exist)."""
+        if name not in self.table.column_names:
+            return []
+        values = self.table.column(name).to_pylist()
+        if name in json_columns(self.table.schema):
+            values = [None if v is None else json_codec.loads(v) for v in values]
+        return values
+
+    def with_column(self, name: str, array, metadata: dict = None) -> "OrderBatch":
+        """
+        This batch plus one column present in every row (replaced if it
+        exists). Row hashes are kept, so the column must not be hashed.
+        """
+        if not isinstance(array, (pa.Array, pa.ChunkedArray)):
+            array, metadata = column_array(array)
+        if metadata is None and _should_dictionary_encode(name, array):
+            array = array.dictionary_encode()
+        field = pa.field(name, array.type, metadata=metadata)
+        table = self.table
+        if name in table.column_names:
+            table = table.set_column(table.column_names.index(name), field, array)
+        else:
+            table = table.append_column(field, array)
+        missing = {column: mask for column, mask in self.missing.items() if column != name}
+        return OrderBatch(table, missing, self.key_digests, self.content_values)
+
+    def take(self, indices) -> "OrderBatch":
+        """Rows at the given positions, as a new batch."""
+        positions = indices
+        indices = pa.array(indices, type=pa.int64())
+        return OrderBatch(
+            self.table.take(indices),
+            {name: mask.take(indices) for name, mask in self.missing.items()},
+            None if self.key_digests is None else self.key_digests[positions],
+            None if self.content_values is None else self.content_values[positions],
+        )
+
+    @classmethod
+    def concat(cls, batches: list) -> "OrderBatch":
+        """
+        Stack batches built separately (e.g. per worker chunk) into one.
+
+        Columns whose Arrow type differs between chunks (an all-null chunk,
+        dictionary vs plain text, int vs JSON) are rebuilt from their values.
+        """
+        batches = [batch for batch in batches if len(batch)]
+        if len(batches) == 1:
+            return batches[0]
+        if not batches:
+            return cls(pa.table({}))
+
+        names = []
+        for batch in batches:
+            for name in batch.columns:
+                if name not in names:
+                    names.append(name)
+
+        fields = []
+        arrays = []
+        missing = {}
+        for name in names:
+            present = [name in batch.columns for batch in batches]
+            if not all(present) or any(name in batch.missing for batch in batches):
+                missing[name] = pa.chunked_array([
+                    batch.missing[name] if name in batch.missing
+                    else pa.array([not has] * len(batch), type=pa.bool_())
+                    for batch, has in zip(batches, present)
+                ])
+            chunks = [batch.table.column(name) for batch, has in zip(batches, present) if has]
+            field = next(batch.table.schema.field(name) for batch, has in zip(batches, present) if has)
+            same_type = all(
+                batch.table.schema.field(name).equals(field, check_metadata=True)
+                for batch, has in zip(batches, present) if has
+            )
+            if all(present) and same_type:
+                array = pa.chunked_array([c for chunk in chunks for c in chunk.chunks], type=field.type)
+                metadata = field.metadata
+            else:
+                values = []
+                for batch, has in zip(batches, present):
+                    values.extend(batch.column(name) if has else [None] * len(batch))
+                array, metadata = column_array(values)
+                del values
+                if metadata is None and _should_dictionary_encode(name, array):
+                    array = array.dictionary_encode()
+            fields.append(pa.field(name, array.type, metadata=metadata))
+            arrays.append(array)
+
+        table = pa.Table.from_arrays(arrays, schema=pa.schema(fields)).unify_dictionaries()
+        digests = [batch.key_digests for batch in batches]
+        values = [batch.content_values for batch in batches]
+        return cls(
+            table,
+            {name: mask.combine_chunks() for name, mask in missing.items()},
+            np.concatenate(digests) if all(d is not None for d in digests) else None,
+            np.concatenate(values) if all(v is not None for v in values) else None,
+        )
+
+    def to_ipc(self) -> bytes:
+        """Serialize for another process (Arrow IPC stream; hashes travel separately)."""
+        table = self.table
+        for name, mask in self.missing.items():
+            table = table.append_column(MISSING_PREFIX + name, mask)
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes()
+
+    @classmethod
+    def from_ipc(cls, data: bytes, key_digests=None, content_values=None) -> "OrderBatch":
+        table = pa.ipc.open_stream(data).read_all()
+        masks = [name for name in table.column_names if name.startswith(MISSING_PREFIX)]
+        missing = {name[len(MISSING_PREFIX):]: table.column(name).combine_chunks() for name in masks}
+        return cls(table.drop_columns(masks), missing, key_digests, content_values)
+
+    def iter_rows(self, columns: list = None, chunk_size: int = ROW_CHUNK_SIZE):
+        """Yield rows as dicts, one chunk of columns decoded at a time."""
+        table = self.table if columns is None else self.table.select(
+            [name for name in columns if name in self.table.column_names]
+        )
+        encoded = json_columns(table.schema)
+        offset = 0
+        for record_batch in table.to_batches(max_chunksize=chunk_size):
+            values = decode_columns(record_batch, encoded)
+            missing = {
+                name: mask.slice(offset, record_batch.num_rows).to_pylist()
+                for name, mask in self.missing.items() if name in values
+            }
+            names = list(values)
+            for i in range(record_batch.num_rows):
+                row = {name: values[name][i] for name in names}
+                for name, mask in missing.items():
+                    if mask[i]:
+                        del row[name]
+                yield row
+            offset += record_batch.num_rows
+
+    def to_rows(self) -> list:
+        return list(self.iter_rows())
+
+
+def _should_dictionary_encode(name: str, array: pa.Array) -> bool:
+    if name in DICTIONARY_COLUMNS:
+        return True
+    if not pa.types.is_string(array.type) or len(array) == 0:
+        return False
+    return pc.count_distinct(array).as_py() <= DICTIONARY_MAX_RATIO * len(array)
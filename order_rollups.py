@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+Daily rollup tables behind the executive dashboard (dashboard_app.py).
+
+The dashboard panels aggregate the raw order-items table by date, hour,
+city, payment method, delivery status, vendor and product. The rollups hold
+those aggregates per day, so a panel reads a few thousand rollup rows
+instead of scanning the order items of the whole date range:
+
+- daily_order_rollup: day, hour, city, payment method, delivery status
+- daily_product_rollup: day, city, payment method, product
+- daily_vendor_rollup: day, city, payment method, vendor
+
+Every rollup row also carries the delivery date, the partition column of
+the order-items table. After each write, ingest recomputes the rollup rows
+of the delivery dates it touched, rows without a delivery date included
+(refresh_delivery_dates), scanning only those partitions. Item counts and
+revenue are summed exactly. Distinct orders are kept as HLL++ sketches
+(HLL_COUNT.MERGE): exact for small counts, within ~0.5% for large ones.
+
+Usage (initial build / repair):
+    python order_rollups.py rebuild --from 2025-01-01 --to 2025-11-30
+"""
+import argparse
+import datetime as dt
+import os
+import threading
+import time
+
+from google.cloud import bigquery
+
+PROJECT_ID = "tazecicekdb"
+DATASET = "order_data"
+SOURCE_TABLE = f"{PROJECT_ID}.{DATASET}.order_items_clean_v3_enriched_partitioned_clustered"
+ROLLUPS_ENABLED = os.getenv("ROLLUPS_ENABLED", "1") == "1"
+# BigQuery aborts one of two transactions changing the same tables at once
+CONCURRENT_UPDATE_RETRIES = int(os.getenv("ROLLUP_CONCURRENT_UPDATE_RETRIES", "4"))
+CONCURRENT_UPDATE_BACKOFF_SECONDS = 2
+
+# Grouping columns shared by every rollup: (rollup column, source expression)
+COMMON_DIMENSIONS = [
+    ("order_date", "DATE(order_created_date_tr)"),
+    ("delivery_date", "order_delivery_date"),
+    ("city", "city"),
+    ("payment_method", "payment_method"),
+]
+MEASURES = [
+    ("orders_sketch", "HLL_COUNT.INIT(order_id)"),
+    ("items", "COUNT(*)"),
+    ("revenue", "SUM(order_amount)"),
+    # Items with an amount, for AVG(order_amount) = revenue / amount_items
+    ("amount_items", "COUNT(order_amount)"),
+]
+ROLLUP_TABLES = {
+    "orders": (f"{PROJECT_ID}.{DATASET}.daily_order_rollup", [
+        ("order_hour", "EXTRACT(HOUR FROM order_creation_timestamp)"),
+        ("delivery_status", "delivery_status"),
+    ]),
+    "products": (f"{PROJECT_ID}.{DATASET}.daily_product_rollup", [
+        ("product_name", "product_name"),
+        ("product_code_1", "product_code_1"),
+    ]),
+    "vendors": (f"{PROJECT_ID}.{DATASET}.daily_vendor_rollup", [
+        ("vendor_id", "vendor_id"),
+    ]),
+}
+
+_tables_ready = False
+# One rollup transaction at a time per process (ingest threads, backfill days)
+_refresh_lock = threading.Lock()
+
+
+def rollup_table(name: str) -> str:
+    return ROLLUP_TABLES[name][0]
+
+
+def _select(name: str, where: str) -> str:
+    dimensions = COMMON_DIMENSIONS + ROLLUP_TABLES[name][1]
+    columns = ",\n          ".join(
+        f"{expression} AS {column}" for column, expression in dimensions + MEASURES
+    )
+    group_by = ", ".join(column for column, _ in dimensions)
+    return f"""
+        SELECT
+          {columns}
+        FROM `{SOURCE_TABLE}`
+        WHERE ({where})
+          AND order_created_date_tr IS NOT NULL
+        GROUP BY {group_by}"""
+
+
+def ensure_tables(client):
+    """Create the rollup tables (schema taken from the source columns) if missing."""
+    global _tables_ready
+    if _tables_ready:
+        return
+    for name in ROLLUP_TABLES:
+        client.query(f"""
+        CREATE TABLE IF NOT EXISTS `{rollup_table(name)}`
+        PARTITION BY order_date
+        CLUSTER BY city, payment_method, delivery_date
+        AS {_select(name, "FALSE")}
+        """).result()
+    _tables_ready = True
+
+
+def _is_concurrent_update(error: Exception) -> bool:
+    return "concurrent update" in str(error).lower()
+
+
+def _recompute(client, delete_where: str, source_where: str, parameters: list):
+    """
+    Replace the rollup rows of one slice in a single transaction. Runs under
+    the process-wide lock; a transaction aborted by a concurrent update from
+    another process is retried with backoff.
+    """
+    ensure_tables(client)
+    statements = ["BEGIN TRANSACTION;"]
+    for name in ROLLUP_TABLES:
+        statements.append(f"DELETE FROM `{rollup_table(name)}` WHERE {delete_where};")
+        statements.append(f"INSERT INTO `{rollup_table(name)}` {_select(name, source_where)};")
+    statements.append("COMMIT TRANSACTION;")
+    attempt = 0
+    with _refresh_lock:
+        while True:
+            try:
+                job = client.query("\n".join(statements), job_config=bigquery.QueryJobConfig(query_parameters=parameters))
+                job.result()
+                return job
+            except Exception as e:
+                if not _is_concurrent_update(e) or attempt >= CONCURRENT_UPDATE_RETRIES:
+                    raise
+                attempt += 1
+                print(f"⚠️ Rollup transaction aborted by a concurrent update, retry {attempt}/{CONCURRENT_UPDATE_RETRIES}")
+                time.sleep(CONCURRENT_UPDATE_BACKOFF_SECONDS * attempt)
+
+
+def delivery_date_list(delivery_dates) -> list:
+    """Delivery dates as JSON-safe ISO strings, None (no delivery date) last."""
+    dates = sorted({str(d)[:10] for d in delivery_dates if d})
+    return dates + [None] if None in delivery_dates else dates
+
+
+def refresh_delivery_dates(client, delivery_dates) -> dict:
+    """
+    Recompute the rollup rows of the given delivery-date partitions (called
+    by ingest). None in delivery_dates stands for the rows without a
+    delivery date (the NULL partition).
+    """
+    dates = sorted({str(d)[:10] for d in delivery_dates if d})
+    refresh_null = None in delivery_dates
+    if not dates and not refresh_null:
+        return {"status": "empty"}
+    job = _recompute(
+        client,
+        "delivery_date IN UNNEST(@dates) OR (@refresh_null AND delivery_date IS NULL)",
+        "order_delivery_date IN UNNEST(@dates) OR (@refresh_null AND order_delivery_date IS NULL)",
+        [
+            bigquery.ArrayQueryParameter("dates", "DATE", dates),
+            bigquery.ScalarQueryParameter("refresh_null", "BOOL", refresh_null),
+        ],
+    )
+    return {
+        "status": "success",
+        "delivery_dates": len(dates),
+        "null_delivery_date": refresh_null,
+        "bytes_processed": job.total_bytes_processed,
+    }
+
+
+def rebuild(client, start: str, end: str) -> dict:
+    """Recompute the rollups for every order day in [start, end] (scans the source table)."""
+    job = _recompute(
+        client,
+        "order_date BETWEEN @start AND @end",
+        "DATE(order_created_date_tr) BETWEEN @start AND @end",
+        [
+            bigquery.ScalarQueryParameter("start", "DATE", start),
+            bigquery.ScalarQueryParameter("end", "DATE", end),
+        ],
+    )
+    return {"status": "success", "bytes_processed": job.total_bytes_processed}
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description="Daily rollup tables of the executive dashboard")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.add_argument("--from", dest="start", required=True, help="YYYY-MM-DD")
+    parser.add_argument("--to", dest="end", default=dt.date.today().isoformat(), help="YYYY-MM-DD (default: today)")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = _parse_args()
+    result = rebuild(bigquery.Client(project=PROJECT_ID, location="europe-west3"), args.start, args.end)
+    print(f"✅ Rebuilt rollups {args.start} → {args.end} ({(result['bytes_processed'] or 0) / 1024 ** 3:.2f} GB scanned)")
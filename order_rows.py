@@ -0,0 +1,167 @@
+"""
+Per-row transforms of the ingest path: normalization and the business-key /
+content hashes used for dedup.
+
+Kept free of side effects (no Flask app, no BigQuery client) so the worker
+processes of ingest_pool can import it; main.py re-exports everything.
+"""
+import hashlib
+
+import json_codec
+
+
+def normalize_row(row: dict) -> dict:
+    """Simplify Turkish characters, convert additional_products list to string, and map column names."""
+    clean = {}
+    for k, v in row.items():
+        key = simplify_key(k)
+        # Map order_created_date to order_created_date_tr for enriched table
+        if key == "order_created_date":
+            key = "order_created_date_tr"
+            # Convert datetime string to date format (YYYY-MM-DD) if needed
+            if isinstance(v, str) and "T" in v:
+                v = v.split("T")[0]  # Extract date part only
+        
+        # Convert delivery dates from TIMESTAMP to DATE (YYYY-MM-DD only)
+        if key in ["order_delivery_date", "requested_delivery_date"]:
+            if isinstance(v, str) and "T" in v:
+                v = v.split("T")[0]  # Extract date part only
+        
+        if key == "additional_products" and isinstance(v, list):
+            clean[key] = ", ".join(map(str, v))
+        else:
+            clean[key] = v
+    return clean
+
+
+def normalize_row_v1(row: dict) -> dict:
+    """
+    Mapping for order_items_clean_v3_partitioned_v1: like normalize_row, but
+    order_created_date keeps its API name and full timestamp.
+    """
+    clean = {}
+    for k, v in row.items():
+        key = simplify_key(k)
+        # Convert delivery dates from TIMESTAMP to DATE (YYYY-MM-DD only)
+        if key in ["order_delivery_date", "requested_delivery_date"]:
+            if isinstance(v, str) and "T" in v:
+                v = v.split("T")[0]
+        if key == "additional_products" and isinstance(v, list):
+            v = ", ".join(map(str, v))
+        clean[key] = v
+    return clean
+
+
+def simplify_key(key: str) -> str:
+    return (
+        key.replace("ğ", "g")
+        .replace("ü", "u")
+        .replace("ş", "s")
+        .replace("ı", "i")
+        .replace("ö", "o")
+        .replace("ç", "c")
+    )
+
+
+def project_row(row: dict, normalize, columns: frozenset) -> dict:
+    """normalize(row) restricted to a sink table's columns (see sinks.py)."""
+    return {key: value for key, value in normalize(row).items() if key in columns}
+
+
+def coerce_row(row: dict, normalize, types: dict) -> dict:
+    """
+    normalize(row), then text values converted to the target column types.
+
+    For rows read from export files (see file_ingest.py), where values come
+    as text: after coercion a row hashes like the same row coming from the
+    API or from BigQuery.
+    """
+    clean = normalize(row)
+    for key, value in clean.items():
+        if not isinstance(value, str):
+            continue
+        kind = types.get(key)
+        if value == "":
+            # Text columns keep "" (what the API sends); typed columns get NULL
+            value = value if kind in (None, "STRING") else None
+        elif kind in ("INTEGER", "INT64"):
+            try:
+                value = int(value)
+            except ValueError:
+                pass
+        elif kind in ("FLOAT", "FLOAT64"):
+            try:
+                value = float(value)
+            except ValueError:
+                pass
+        elif kind in ("BOOLEAN", "BOOL"):
+            value = value.strip().lower() in ("true", "1")
+        elif kind == "DATE" and len(value) > 10:
+            value = value[:10]  # exports write timestamps into date columns
+        clean[key] = value
+    return clean
+
+
+# Fields that define a unique order item (business key)
+# Exclude timestamps and other auto-generated fields
+# Exclude order_code (it's derived from order_id, adding it causes duplicate issues)
+HASH_FIELDS = [
+    'order_id',
+    'product_code_1',
+    'user_id',
+    'city',
+    'district',
+    'neighborhood',
+    'delivery_location_type',
+    'vendor_id',
+    'rider_id',
+    'additional_products',
+    'product_name',
+    'order_created_date_tr',
+    # Add other core fields but NOT timestamps or order_code
+]
+
+
+def get_row_hash_key(row: dict) -> str:
+    """
+    Create a hash based on business key fields only (not timestamps).
+    This ensures same order item gets same hash even if timestamps differ.
+    
+    NOTE: order_code is NOT included in hash because it's added later.
+    Including it would cause duplicates when backfilling old data.
+    """
+    return get_row_hash_digest(row).hex()
+
+
+def get_row_hash_digest(row: dict) -> bytes:
+    """Raw 16-byte md5 digest behind get_row_hash_key."""
+    hash_dict = {}
+    for field in HASH_FIELDS:
+        if field in row:
+            hash_dict[field] = row[field]
+    
+    # Create deterministic hash
+    hash_json = json_codec.hash_dumps(hash_dict)
+    return hashlib.md5(hash_json.encode('utf-8')).digest()
+
+
+# Mutable fields, deliberately left out of the business key: when they change
+# for an existing order item, the stored row is updated instead of skipped.
+# A changed order_delivery_date moves the row to another partition; stored
+# copies are therefore looked up by order day (main.stored_rows_filter)
+CONTENT_FIELDS = [
+    'delivery_status',
+    'order_delivery_date',
+    'requested_delivery_date',
+]
+
+
+def get_row_content_hash(row: dict) -> str:
+    """Hash of the mutable CONTENT_FIELDS (second hash next to the business key)."""
+    return get_row_content_digest(row).hex()
+
+
+def get_row_content_digest(row: dict) -> bytes:
+    """Raw 16-byte md5 digest behind get_row_content_hash."""
+    content = {field: row.get(field) for field in CONTENT_FIELDS}
+    return hashlib.md5(json_codec.hash_dumps(content).encode('utf-8')).digest()
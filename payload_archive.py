@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Raw API payload archive.
+
+Every day fetched from the orders API is stored as a zstd-compressed Parquet
+snapshot under ARCHIVE_URI/fetch_date=YYYY-MM-DD/. Archived days can be
+streamed back through the ingest pipeline in main.py, so re-deriving
+order_created_date_tr or re-running dedup does not need the API.
+
+A local ARCHIVE_URI is lost with the container on ephemeral filesystems
+(Cloud Run), so ingest only archives by default when ARCHIVE_URI points at
+durable storage, e.g. gs://bucket/order-archive (ARCHIVE_ENABLED in main.py).
+
+Usage:
+    python payload_archive.py list --from 2025-11-01 --to 2025-11-30
+    python payload_archive.py replay --from 2025-11-01 --to 2025-11-30 --sinks enriched,v1
+"""
+import argparse
+import datetime as dt
+import hashlib
+import os
+import time
+
+import pyarrow as pa
+import pyarrow.fs as pafs
+import pyarrow.parquet as pq
+
+import order_batch
+
+# === CONFIG ===
+# Local directory or any URI pyarrow understands (e.g. gs://bucket/order-archive)
+ARCHIVE_URI = os.getenv("ARCHIVE_URI", "archive")
+ARCHIVE_DURABLE = "://" in ARCHIVE_URI and not ARCHIVE_URI.startswith("file://")
+ARCHIVE_COMPRESSION = "zstd"
+# Each snapshot of a day is a superset of the previous one, so only the
+# newest few are kept
+ARCHIVE_KEEP_SNAPSHOTS = int(os.getenv("ARCHIVE_KEEP_SNAPSHOTS", "3"))
+READ_BATCH_SIZE = 5000
+
+
+def _filesystem():
+    """Return (filesystem, base_path) for ARCHIVE_URI."""
+    if "://" in ARCHIVE_URI:
+        return pafs.FileSystem.from_uri(ARCHIVE_URI)
+    return pafs.LocalFileSystem(), os.path.abspath(ARCHIVE_URI)
+
+
+def _row_day(row: dict, fallback: str) -> str:
+    """Day partition of a raw API row (order_created_date), or the fallback."""
+    value = row.get("order_created_date")
+    if isinstance(value, str) and len(value) >= 10:
+        return value[:10]
+    return fallback
+
+
+def _table_digest(table: pa.Table) -> str:
+    """Content digest used to skip writing an unchanged snapshot."""
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return hashlib.md5(sink.getvalue().to_pybytes()).hexdigest()[:12]
+
+
+def _day_dir(base: str, day: str) -> str:
+    return f"{base}/fetch_date={day}"
+
+
+def _snapshots(fs, base: str, day: str) -> list:
+    """Snapshot file paths of one day, oldest first."""
+    selector = pafs.FileSelector(_day_dir(base, day), allow_not_found=True)
+    files = [
+        info.path for info in fs.get_file_info(selector)
+        if info.type == pafs.FileType.File and info.path.endswith(".parquet")
+    ]
+    return sorted(files)
+
+
+def archive_payload(date: str, rows: list) -> dict:
+    """
+    Archive a raw API payload.
+
+    Day payloads are stored under their own date. Month payloads are split by
+    each row's order_created_date; rows without one stay under the month key.
+    Returns {day: row_count} for the snapshots that were written.
+    """
+    if not rows:
+        return {}
+
+    by_day = {}
+    for row in rows:
+        day = date if len(date) == 10 else _row_day(row, date)
+        by_day.setdefault(day, []).append(row)
+
+    fs, base = _filesystem()
+    written = {}
+    for day, day_rows in sorted(by_day.items()):
+        table = order_batch.rows_to_table(day_rows)
+        digest = _table_digest(table)
+        existing = _snapshots(fs, base, day)
+        if existing and existing[-1].endswith(f"-{digest}.parquet"):
+            continue  # Payload unchanged since the last fetch
+
+        fs.create_dir(_day_dir(base, day), recursive=True)
+        path = f"{_day_dir(base, day)}/part-{int(time.time() * 1000)}-{digest}.parquet"
+        with fs.open_output_stream(path) as out:
+            pq.write_table(table, out, compression=ARCHIVE_COMPRESSION)
+        written[day] = table.num_rows
+
+        for old in (existing + [path])[:-ARCHIVE_KEEP_SNAPSHOTS]:
+            fs.delete_file(old)
+
+    return written
+
+
+def list_archived_days(start: str = None, end: str = None) -> list:
+    """Archived day keys (YYYY-MM-DD, or YYYY-MM for undated rows), sorted."""
+    fs, base = _filesystem()
+    selector = pafs.FileSelector(base, allow_not_found=True)
+    days = []
+    for info in fs.get_file_info(selector):
+        name = info.base_name
+        if info.type != pafs.FileType.Directory or not name.startswith("fetch_date="):
+            continue
+        day = name.split("=", 1)[1]
+        if start and day < start[:len(day)]:
+            continue
+        if end and day > end[:len(day)]:
+            continue
+        days.append(day)
+    return sorted(days)
+
+
+def iter_archived_rows(day: str, batch_size: int = READ_BATCH_SIZE):
+    """Yield lists of raw API rows from the newest snapshot of a day."""
+    fs, base = _filesystem()
+    snapshots = _snapshots(fs, base, day)
+    if not snapshots:
+        return
+
+    with fs.open_input_file(snapshots[-1]) as f:
+        parquet_file = pq.ParquetFile(f)
+        encoded = order_batch.json_columns(parquet_file.schema_arrow)
+        for record_batch in parquet_file.iter_batches(batch_size=batch_size):
+            columns = order_batch.decode_columns(record_batch, encoded)
+            names = list(columns)
+            yield [
+                {name: columns[name][i] for name in names}
+                for i in range(record_batch.num_rows)
+            ]
+
+
+def read_archived_day(day: str) -> list:
+    """All raw API rows of the newest snapshot of a day."""
+    rows = []
+    for batch in iter_archived_rows(day):
+        rows.extend(batch)
+    return rows
+
+
+def replay_days(start: str, end: str, ingest) -> dict:
+    """
+    Stream archived days in [start, end] through an ingest callable.
+
+    `ingest` receives the raw rows of one day (e.g. main.ingest_rows),
+    exactly as if they had just come from the API.
+    """
+    started = time.time()
+    days = {}
+    total_rows = 0
+    for day in list_archived_days(start, end):
+        day_started = time.time()
+        rows = read_archived_day(day)
+        read_seconds = time.time() - day_started
+        result = ingest(rows)
+        total_rows += len(rows)
+        days[day] = {
+            "row_count": len(rows),
+            "read_seconds": round(read_seconds, 3),
+            "bq_status": result,
+        }
+        print(f"📼 Replayed {day}: {len(rows):,} rows (read {read_seconds:.2f}s)")
+
+    return {
+        "days": days,
+        "day_count": len(days),
+        "row_count": total_rows,
+        "elapsed_seconds": round(time.time() - started, 3),
+    }
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description="Raw orders API payload archive")
+    parser.add_argument("command", choices=["list", "replay"])
+    parser.add_argument("--from", dest="start", required=True, help="YYYY-MM-DD")
+    parser.add_argument(
+        "--to", dest="end",
+        default=dt.date.today().isoformat(),
+        help="YYYY-MM-DD (default: today)",
+    )
+    parser.add_argument("--strategy", default=None, help="stream or merge (default: INGEST_STRATEGY)")
+    parser.add_argument("--sinks", default=None, help="Comma-separated sink tables (default: INGEST_SINKS)")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = _parse_args()
+    if args.command == "list":
+        for day in list_archived_days(args.start, args.end):
+            print(day)
+    else:
+        import sinks
+        from main import ingest_to_sinks
+
+        # Same path as the /replay route: enrichment and every sink
+        sink_names = sinks.parse_sinks(args.sinks)
+        summary = replay_days(args.start, args.end, lambda rows: ingest_to_sinks(rows, args.strategy, sink_names))
+        print(
+            f"✅ Replayed {summary['day_count']} days, {summary['row_count']:,} rows "
+            f"in {summary['elapsed_seconds']:.1f}s"
+        )
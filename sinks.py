@@ -0,0 +1,51 @@
+"""
+Sink tables fed from one fetch.
+
+An API payload is fetched and parsed once, then written to every selected
+sink through the same dedup/writer pipeline, each sink with its own row
+mapping. INGEST_SINKS picks the default sinks (comma separated); /fetch,
+/replay and backfill.py accept a per-run override. Each sink's outcome is
+logged separately (main.record_sink_progress), so one sink failing or
+lagging does not hold back the others.
+"""
+import os
+
+from order_rows import normalize_row, normalize_row_v1
+
+
+class Sink:
+    """One destination table and the mapping from API rows to its rows."""
+
+    def __init__(self, name: str, table: str, normalize, schema_columns_only: bool = False,
+                 enrich: bool = False):
+        self.name = name
+        self.table = table
+        self.normalize = normalize
+        # Drop API fields the table does not have (the mapping is not exhaustive)
+        self.schema_columns_only = schema_columns_only
+        # Join the ENRICHMENTS dimensions into the rows (see enrichment.py)
+        self.enrich = enrich
+
+
+SINKS = {
+    sink.name: sink
+    for sink in (
+        Sink("enriched", "order_items_clean_v3_enriched_partitioned_clustered", normalize_row, enrich=True),
+        Sink("v1", "order_items_clean_v3_partitioned_v1", normalize_row_v1, schema_columns_only=True),
+    )
+}
+
+# The sink whose success advances the incremental fetch metadata
+PRIMARY_SINK = "enriched"
+
+
+def parse_sinks(value: str = None) -> list:
+    """Sink names from a comma-separated string (default: INGEST_SINKS)."""
+    names = [name.strip() for name in (value or INGEST_SINKS).split(",") if name.strip()]
+    unknown = [name for name in names if name not in SINKS]
+    if unknown or not names:
+        raise ValueError(f"Unknown sink(s): {', '.join(unknown) or repr(value)} (known: {', '.join(SINKS)})")
+    return list(dict.fromkeys(names))
+
+
+INGEST_SINKS = os.getenv("INGEST_SINKS", PRIMARY_SINK)